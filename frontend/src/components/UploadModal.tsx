@@ -14,6 +14,19 @@ interface UploadModalProps {
   onSuccess: (response: { dataset_id: string }) => void; 
 }
 
+const STATUS_POLL_INTERVAL_MS = 1500;
+
+// The upload endpoint returns as soon as the archive is stored; extraction and schema
+// generation run as a background job whose status we poll until it finishes.
+const waitForIngest = async (statusUrl: string) => {
+  while (true) {
+    const { data } = await axios.get(`${import.meta.env.VITE_FLASK_API_BASE_URL}${statusUrl}`);
+    if (data.status === 'done') return;
+    if (data.status === 'failed') throw new Error(data.error || 'Dataset processing failed');
+    await new Promise((resolve) => setTimeout(resolve, STATUS_POLL_INTERVAL_MS));
+  }
+};
+
 export const UploadModal = ({ isOpen, onClose, onSuccess }: UploadModalProps) => {
   const [isUploading, setIsUploading] = useState(false);
   const [uploadStatus, setUploadStatus] = useState<'idle' | 'success' | 'error'>('idle');
@@ -49,6 +62,10 @@ export const UploadModal = ({ isOpen, onClose, onSuccess }: UploadModalProps) =>
         }
       );
 
+      if (response.data.status_url) {
+        await waitForIngest(response.data.status_url);
+      }
+
       setUploadStatus('success');
       toast({
         title: "Dataset uploaded successfully!",
@@ -1,13 +1,21 @@
 import os
+import multiprocessing
+import pandas as pd
 from flask import Flask
 from flask_cors import CORS 
 
+from .upload_staging import UploadRequest, discard_staged_uploads
+
 def create_app():
     app = Flask(__name__, instance_relative_config=True)
+    app.request_class = UploadRequest
+    app.teardown_request(discard_staged_uploads)
     
     CORS(app) 
 
     app.config.from_object('app.config.Config')
+    # Process-wide, and passed on to the executor workers; see PANDAS_COPY_ON_WRITE.
+    pd.set_option('mode.copy_on_write', app.config['PANDAS_COPY_ON_WRITE'])
 
     os.environ["LANGCHAIN_TRACING_V2"] = str(app.config['LANGCHAIN_TRACING_V2']).lower()
     if app.config.get('LANGCHAIN_API_KEY'):
@@ -23,9 +31,20 @@ def create_app():
         pass
 
     os.makedirs(app.config['UPLOADS_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['UPLOAD_STAGING_FOLDER'], exist_ok=True)
     os.makedirs(app.config['VISUALIZATIONS_FOLDER'], exist_ok=True)
     
     from . import routes
     app.register_blueprint(routes.main)
+
+    from .commands import register_commands
+    register_commands(app)
+
+    # Ingest worker processes re-import the entry module; only the main process resumes jobs.
+    if multiprocessing.parent_process() is None:
+        from .services.catalog_service import dataset_catalog
+        from .services.job_service import ingest_queue
+        dataset_catalog.ensure_built(app.config['UPLOADS_FOLDER'])
+        ingest_queue.resume_unfinished()
     
     return app
\ No newline at end of file
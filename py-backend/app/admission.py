@@ -0,0 +1,162 @@
+import os
+import math
+import time
+import threading
+from functools import wraps
+from typing import Dict, Any
+
+from flask import g, jsonify, make_response
+
+from .config import Config
+from .services.instrumentation import metrics
+
+# Weight of the latest request in the moving average of service time used for Retry-After.
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    def __init__(self, controller: 'AdmissionController', wait_seconds: float):
+        self._controller = controller
+        self.wait_seconds = wait_seconds
+        self.admitted_at = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.perf_counter() - self.admitted_at)
+
+
+class AdmissionController:
+    """
+    Admission control for query requests in this process. At most `max_in_flight` requests run at
+    once and up to `max_queue_depth` more wait for a slot. A request arriving at a full queue is
+    rejected right away (429); one that waited longer than `queue_timeout` gives up (503). Both
+    carry a Retry-After estimated from the recent service time and the queue length.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue_depth: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        self._reset()
+
+    def _reset(self):
+        # Requests admitted by threads of the parent do not exist in a forked child.
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.service_seconds = None
+
+    def _retry_after(self) -> int:
+        service_seconds = self.service_seconds or 1.0
+        return max(1, math.ceil(service_seconds * (self.queued + 1) / self.max_in_flight))
+
+    def admit(self) -> _Ticket:
+        """Waits for a slot and returns the ticket to release when the request is done. Raises AdmissionRejected."""
+        started = time.perf_counter()
+        with self._condition:
+            if self.in_flight >= self.max_in_flight or self.queued:
+                if self.queued >= self.max_queue_depth:
+                    self.rejected_full += 1
+                    raise AdmissionRejected(429, "Too many queries are queued; try again later.", self._retry_after())
+                self.queued += 1
+                deadline = started + self.queue_timeout
+                try:
+                    while self.in_flight >= self.max_in_flight:
+                        remaining = deadline - time.perf_counter()
+                        if remaining <= 0:
+                            self.rejected_timeout += 1
+                            raise AdmissionRejected(503, "The server is busy; the query waited too long to start.",
+                                                    self._retry_after())
+                        self._condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+            waited = time.perf_counter() - started
+            self.in_flight += 1
+            self.admitted += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return _Ticket(self, waited)
+
+    def _release(self, service_seconds: float):
+        with self._condition:
+            self.in_flight -= 1
+            if self.service_seconds is None:
+                self.service_seconds = service_seconds
+            else:
+                self.service_seconds += SERVICE_TIME_SMOOTHING * (service_seconds - self.service_seconds)
+            self._condition.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue_depth": self.max_queue_depth,
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "rejected_queue_full": self.rejected_full,
+                "rejected_queue_timeout": self.rejected_timeout,
+                "avg_queue_wait_ms": round(self.wait_seconds / self.admitted * 1000, 1) if self.admitted else 0.0,
+                "max_queue_wait_ms": round(self.max_wait_seconds * 1000, 1),
+                "avg_service_ms": round(self.service_seconds * 1000, 1) if self.service_seconds is not None else None,
+            }
+
+
+def queue_wait_ms() -> float:
+    """How long the current request waited for admission, in milliseconds."""
+    ticket = g.get('admission_ticket')
+    return round(ticket.wait_seconds * 1000, 1) if ticket is not None else 0.0
+
+
+def admission_controlled(view):
+    """
+    Runs a view only once the query admission controller lets the request in, and reports the
+    queue wait in an X-Queue-Wait-Ms header. Streamed responses hold their slot until they close.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            ticket = query_admission.admit()
+        except AdmissionRejected as e:
+            response = jsonify({"error": str(e), "retry_after": e.retry_after})
+            response.status_code = e.status
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        g.admission_ticket = ticket
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            ticket.release()
+            raise
+        response.headers['X-Queue-Wait-Ms'] = str(queue_wait_ms())
+        if response.is_streamed:
+            response.call_on_close(ticket.release)
+        else:
+            ticket.release()
+        return response
+    return wrapper
+
+
+query_admission = AdmissionController(
+    max_in_flight=Config.QUERY_MAX_IN_FLIGHT,
+    max_queue_depth=Config.QUERY_QUEUE_MAX_DEPTH,
+    queue_timeout=Config.QUERY_QUEUE_TIMEOUT_SECONDS,
+)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=query_admission._reset)
+metrics.gauge('queries_in_flight', "Admitted queries running in this process.", lambda: query_admission.in_flight)
+metrics.gauge('queries_queued', "Queries waiting for admission in this process.", lambda: query_admission.queued)
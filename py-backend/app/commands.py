@@ -0,0 +1,56 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from .services.ingest_service import migrate_uploads, backfill_rollups
+from .services.schema_service import refresh_schema_notes
+from .services.catalog_service import dataset_catalog
+from .services.intent_classifier import evaluate, EVAL_PATH
+
+
+@click.command('migrate-columnar')
+@with_appcontext
+def migrate_columnar_command():
+    """Converts datasets already under the uploads folder to the columnar format."""
+    summary = migrate_uploads(current_app.config['UPLOADS_FOLDER'])
+    dataset_catalog.rebuild(current_app.config['UPLOADS_FOLDER'])
+    click.echo(f"Converted {summary['converted']} dataset(s), skipped {summary['skipped']}.")
+
+
+@click.command('build-rollups')
+@with_appcontext
+def build_rollups_command():
+    """Computes the hourly and daily rollups of columnar datasets that were ingested without them."""
+    dataset_ids = backfill_rollups(current_app.config['UPLOADS_FOLDER'])
+    for dataset_id in dataset_ids:
+        refresh_schema_notes(dataset_id)
+        dataset_catalog.sync(dataset_id)
+    click.echo(f"Built rollups for {len(dataset_ids)} dataset(s).")
+
+
+@click.command('rebuild-catalog')
+@with_appcontext
+def rebuild_catalog_command():
+    """Reconstructs the dataset catalog from the dataset folders under the uploads folder."""
+    count = dataset_catalog.rebuild(current_app.config['UPLOADS_FOLDER'])
+    click.echo(f"Catalogued {count} dataset(s).")
+
+
+@click.command('eval-intent')
+@click.option('--path', default=EVAL_PATH, help='Labelled JSONL file with "query" and "intent" fields.')
+@click.option('--threshold', type=float, default=None, help='Confidence threshold (defaults to INTENT_CONFIDENCE_THRESHOLD).')
+def eval_intent_command(path, threshold):
+    """Measures the local intent classifier against a labelled query set."""
+    report = evaluate(path, threshold=threshold)
+    click.echo(f"Examples:          {report['examples']}")
+    click.echo(f"Decided locally:   {report['decided_locally']} ({report['llm_calls_avoided']:.1%} of LLM calls avoided)")
+    click.echo(f"Local accuracy:    {report['accuracy']:.1%}")
+    for mistake in report['mistakes']:
+        click.echo(f"  wrong: {mistake['query']!r} -> {mistake['predicted']} (expected {mistake['intent']}, {mistake['source']})")
+
+
+def register_commands(app):
+    app.cli.add_command(migrate_columnar_command)
+    app.cli.add_command(build_rollups_command)
+    app.cli.add_command(rebuild_catalog_command)
+    app.cli.add_command(eval_intent_command)
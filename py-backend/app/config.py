@@ -6,8 +6,123 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'a-default-secret-key')
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    # Any OpenAI-compatible endpoint, e.g. a local fake server for tests and benchmarks.
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')
     UPLOADS_FOLDER = 'uploads'
+    UPLOAD_STAGING_FOLDER = 'upload_staging'
     VISUALIZATIONS_FOLDER = 'visualizations'
+    RESULTS_FOLDER = 'results'
+
+    # Columnar ingest: NDJSON files are parsed in chunks of this many rows and narrowed to compact dtypes.
+    INGEST_CHUNK_ROWS = int(os.environ.get('INGEST_CHUNK_ROWS', 200_000))
+    INGEST_CATEGORY_MAX_UNIQUE = int(os.environ.get('INGEST_CATEGORY_MAX_UNIQUE', 50_000))
+    INGEST_CATEGORY_MAX_RATIO = 0.2
+    INGEST_DOWNCAST_FLOATS = os.environ.get('INGEST_DOWNCAST_FLOATS', 'true').lower() == 'true'
+
+    # Uploads are processed by a background job queue; this bounds how many datasets are ingested at once.
+    INGEST_MAX_CONCURRENT_JOBS = int(os.environ.get('INGEST_MAX_CONCURRENT_JOBS', 2))
+    SCHEMA_SAMPLING_WORKERS = int(os.environ.get('SCHEMA_SAMPLING_WORKERS', 8))
+    # Zip members are streamed into the converter by this many processes; the limits guard against zip bombs.
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', os.cpu_count() or 2))
+    INGEST_MAX_MEMBERS = int(os.environ.get('INGEST_MAX_MEMBERS', 10_000))
+    INGEST_MAX_DECOMPRESSED_BYTES = int(os.environ.get('INGEST_MAX_DECOMPRESSED_BYTES', 20 * 1024**3))
+
+    # Hourly and daily rollups computed per file at ingest; files are read in batches of this many rows.
+    ROLLUP_BATCH_ROWS = int(os.environ.get('ROLLUP_BATCH_ROWS', 1_000_000))
+    ROLLUP_MAX_MEASURES = int(os.environ.get('ROLLUP_MAX_MEASURES', 50))
+
+    # Files can be appended to a dataset; files replaced by a newer version are kept this long for queries still reading them.
+    DATASET_VERSION_RETENTION_SECONDS = int(os.environ.get('DATASET_VERSION_RETENTION_SECONDS', 3600))
+
+    # In-process cache of loaded DataFrames shared by all queries; least recently used datasets are evicted.
+    DATAFRAME_CACHE_MAX_BYTES = int(os.environ.get('DATAFRAME_CACHE_MAX_BYTES', 2 * 1024**3))
+    # pandas copy-on-write for the whole process, so cached frames are handed out as shallow copies. Generated code
+    # then cannot use chained assignment (df['a'][mask] = v); the code prompt asks for df.loc[mask, 'a'] = v.
+    # When disabled, every query gets deep copies of the cached frames.
+    PANDAS_COPY_ON_WRITE = os.environ.get('PANDAS_COPY_ON_WRITE', 'true').lower() == 'true'
+
+    # Generated analysis code runs in a pool of forked worker processes with per-job limits.
+    EXECUTOR_POOL_ENABLED = os.environ.get('EXECUTOR_POOL_ENABLED', 'true').lower() == 'true'
+    EXECUTOR_WORKERS = int(os.environ.get('EXECUTOR_WORKERS', max(2, (os.cpu_count() or 2) // 2)))
+    EXECUTOR_TIMEOUT_SECONDS = float(os.environ.get('EXECUTOR_TIMEOUT_SECONDS', 60))
+    EXECUTOR_MEMORY_LIMIT_MB = int(os.environ.get('EXECUTOR_MEMORY_LIMIT_MB', 4096))
+    EXECUTOR_PRELOAD_DATASETS = int(os.environ.get('EXECUTOR_PRELOAD_DATASETS', 3))
+
+    # Admission control per server process: at most QUERY_MAX_IN_FLIGHT queries run at once and up to QUERY_QUEUE_MAX_DEPTH
+    # wait for a slot; a full queue is answered with 429, a wait beyond the timeout with 503, both with Retry-After.
+    QUERY_MAX_IN_FLIGHT = int(os.environ.get('QUERY_MAX_IN_FLIGHT', 16))
+    QUERY_QUEUE_MAX_DEPTH = int(os.environ.get('QUERY_QUEUE_MAX_DEPTH', 64))
+    QUERY_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('QUERY_QUEUE_TIMEOUT_SECONDS', 30))
+    # Batch queries (one dataset, many questions) run this many queries of a batch at once.
+    BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', 50))
+    BATCH_MAX_CONCURRENCY = int(os.environ.get('BATCH_MAX_CONCURRENCY', 8))
+    # Generated-code execution (the CPU-bound stage) has its own limit; LLM calls are bounded by LLM_MAX_CONCURRENCY.
+    CPU_STAGE_CONCURRENCY = int(os.environ.get('CPU_STAGE_CONCURRENCY', EXECUTOR_WORKERS))
+
+    # Query engine: 'pandas' loads whole files into DataFrames, 'duckdb' runs SQL over the Parquet files
+    # without materializing them, 'auto' switches to DuckDB above the size threshold. Datasets can be pinned.
+    QUERY_ENGINE = os.environ.get('QUERY_ENGINE', 'auto').lower()
+    DUCKDB_AUTO_THRESHOLD_BYTES = int(os.environ.get('DUCKDB_AUTO_THRESHOLD_BYTES', 1024**3))
+    DUCKDB_MEMORY_LIMIT_MB = int(os.environ.get('DUCKDB_MEMORY_LIMIT_MB', 2048))
+    DUCKDB_THREADS = int(os.environ.get('DUCKDB_THREADS', os.cpu_count() or 2))
+    DUCKDB_TEMP_FOLDER = os.environ.get('DUCKDB_TEMP_FOLDER', 'duckdb_tmp')
+    DUCKDB_MAX_RESULT_ROWS = int(os.environ.get('DUCKDB_MAX_RESULT_ROWS', 5_000_000))
+
+    # SQLite catalog of the datasets under UPLOADS_FOLDER, rebuilt with `flask rebuild-catalog`; schema
+    # contexts are served from a bounded in-memory cache revalidated against the file on every lookup.
+    CATALOG_PATH = os.environ.get('CATALOG_PATH', os.path.join('cache', 'catalog.sqlite3'))
+    CATALOG_MAX_PAGE_SIZE = int(os.environ.get('CATALOG_MAX_PAGE_SIZE', 500))
+    SCHEMA_CONTEXT_CACHE_SIZE = int(os.environ.get('SCHEMA_CONTEXT_CACHE_SIZE', 1024))
+
+    # Persistent cache of generated code (by schema context + normalized query) and of results (by dataset fingerprint + code).
+    QUERY_CACHE_ENABLED = os.environ.get('QUERY_CACHE_ENABLED', 'true').lower() == 'true'
+    QUERY_CACHE_PATH = os.environ.get('QUERY_CACHE_PATH', os.path.join('cache', 'query_cache.sqlite3'))
+    QUERY_CACHE_TTL_SECONDS = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+    QUERY_CACHE_MAX_CODE_ENTRIES = int(os.environ.get('QUERY_CACHE_MAX_CODE_ENTRIES', 5000))
+    QUERY_CACHE_MAX_RESULT_BYTES = int(os.environ.get('QUERY_CACHE_MAX_RESULT_BYTES', 256 * 1024**2))
+
+    # Conversation sessions in SQLite, shared by all workers: recent turns and the last result table, which
+    # follow-up queries can analyze. Idle sessions expire; the least recently used are evicted beyond the caps.
+    SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH', os.path.join('cache', 'sessions.sqlite3'))
+    SESSION_RESULTS_FOLDER = os.environ.get('SESSION_RESULTS_FOLDER', os.path.join('cache', 'session_results'))
+    SESSION_TTL_SECONDS = int(os.environ.get('SESSION_TTL_SECONDS', 24 * 3600))
+    SESSION_MAX_COUNT = int(os.environ.get('SESSION_MAX_COUNT', 10_000))
+    SESSION_MAX_BYTES = int(os.environ.get('SESSION_MAX_BYTES', 1024**3))
+    SESSION_HISTORY_TURNS = int(os.environ.get('SESSION_HISTORY_TURNS', 10))
+
+    # All LLM calls go through one gateway: pooled clients, per-model request/token buckets, bounded concurrency,
+    # retries with exponential backoff, and coalescing of identical prompts already in flight.
+    LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', 500))
+    LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', 200_000))
+    LLM_EXPECTED_OUTPUT_TOKENS = int(os.environ.get('LLM_EXPECTED_OUTPUT_TOKENS', 500))
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 16))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 4))
+    LLM_RETRY_BASE_SECONDS = float(os.environ.get('LLM_RETRY_BASE_SECONDS', 0.5))
+    LLM_RETRY_MAX_SECONDS = float(os.environ.get('LLM_RETRY_MAX_SECONDS', 20))
+    LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', 120))
+
+    # Stage metrics are exported on /metrics per server process. Queries may ask for a `trace` (timing breakdown) in the
+    # response; `profile` runs one query's graph nodes under cProfile and writes the .prof file to PROFILES_FOLDER.
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILES_FOLDER = os.environ.get('PROFILES_FOLDER', 'profiles')
+
+    # Local intent classifier in front of the LLM router; below this confidence the LLM decides.
+    INTENT_CLASSIFIER_ENABLED = os.environ.get('INTENT_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+    INTENT_CONFIDENCE_THRESHOLD = float(os.environ.get('INTENT_CONFIDENCE_THRESHOLD', 0.9))
+
+    # Result tables longer than the inline limit are stored server-side and paged; the first page is returned inline.
+    RESULT_INLINE_MAX_ROWS = int(os.environ.get('RESULT_INLINE_MAX_ROWS', 5000))
+    RESULT_PAGE_ROWS = int(os.environ.get('RESULT_PAGE_ROWS', 1000))
+    RESULT_TTL_SECONDS = int(os.environ.get('RESULT_TTL_SECONDS', 7 * 24 * 3600))
+
+    # Compiled LLM chart functions kept for result tables with the same column signature.
+    CHART_FUNCTION_CACHE_SIZE = int(os.environ.get('CHART_FUNCTION_CACHE_SIZE', 256))
+
+    # Charts are returned as HTML snippets ('html') or compact Plotly JSON specs ('json'); requests may override.
+    CHART_FORMAT = os.environ.get('CHART_FORMAT', 'html').lower()
+    # Stored charts are content-addressed; the folder is pruned by age and then by total size.
+    CHART_STORE_MAX_BYTES = int(os.environ.get('CHART_STORE_MAX_BYTES', 512 * 1024**2))
+    CHART_STORE_MAX_AGE_SECONDS = int(os.environ.get('CHART_STORE_MAX_AGE_SECONDS', 30 * 24 * 3600))
     
     LANGCHAIN_TRACING_V2 = os.environ.get('LANGCHAIN_TRACING_V2', 'false').lower() == 'true'
     LANGCHAIN_API_KEY = os.environ.get('LANGCHAIN_API_KEY')
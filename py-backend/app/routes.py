@@ -1,32 +1,75 @@
 import os
-import zipfile
 import re
+import json
+import time
+import shutil
+import zipfile
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app, send_from_directory
+from flask import Blueprint, Response, request, jsonify, current_app, send_from_directory, stream_with_context, g
 
-from .services.schema_service import generate_intelligent_schema
-from .services.agent_service import run_agent
+from .services.agent_service import run_agent, stream_agent, run_batch
+from .services.job_service import ingest_queue, read_job, job_active
+from .services.ingest_service import inspect_archive, read_manifest, ArchiveLimitError
+from .upload_staging import stage_upload
+from .admission import admission_controlled, query_admission, queue_wait_ms
+from .services.dataframe_cache import dataframe_cache
+from .services.query_cache import query_cache
+from .services.chart_store import chart_store, CONTENT_ADDRESSED_NAME
+from .services.result_service import result_exists, read_result_page, result_arrow_stream
+from .services.sql_engine import ENGINES, engine_info, write_engine_setting
+from .services.catalog_service import dataset_catalog
+from .services.schema_service import schema_context_cache
+from .services.session_service import session_manager
+from .services.llm_gateway import llm_gateway
+from .services.stage_limits import llm_stage, cpu_stage
+from .services.instrumentation import metrics, stage
 
 main = Blueprint('main', __name__)
 
+UPLOAD_ARCHIVE_FILENAME = '_upload.zip'
+CHART_FORMATS = ('html', 'json')
+
 def sanitize_filename(filename):
     name_without_ext = os.path.splitext(filename)[0]
     sanitized = re.sub(r'[^a-zA-Z0-9_.-]', '_', name_without_ext)
     return sanitized
 
+CATALOG_QUERY_ARGS = ('cursor', 'limit', 'status', 'q', 'column', 'created_after', 'created_before', 'sort', 'order')
+
 @main.route('/api/datasets', methods=['GET'])
 def get_datasets():
-    uploads_folder = current_app.config['UPLOADS_FOLDER']
+    """
+    Lists dataset ids from the catalog, newest first. With any of CATALOG_QUERY_ARGS it returns
+    a page of catalog entries instead: `{items, total, offset, limit, next_cursor}`.
+    """
+    if not any(arg in request.args for arg in CATALOG_QUERY_ARGS):
+        return jsonify(dataset_catalog.ids())
     try:
-        dataset_ids = [d for d in os.listdir(uploads_folder) if os.path.isdir(os.path.join(uploads_folder, d))]
-        return jsonify(sorted(dataset_ids, reverse=True))
-    except FileNotFoundError:
-        return jsonify([])
+        offset = int(request.args.get('cursor', 0))
+        limit = min(int(request.args.get('limit', 50)), current_app.config['CATALOG_MAX_PAGE_SIZE'])
+        if offset < 0 or limit < 1:
+            raise ValueError("cursor and limit must be positive")
+        page = dataset_catalog.search(
+            offset=offset, limit=limit,
+            status=request.args.get('status'), text=request.args.get('q'), column=request.args.get('column'),
+            created_after=request.args.get('created_after'), created_before=request.args.get('created_before'),
+            sort=request.args.get('sort', 'dataset_id'), descending=request.args.get('order', 'desc') != 'asc')
+    except ValueError as e:
+        return jsonify({"error": f"Invalid catalog query: {e}"}), 400
+    return jsonify(page)
+
+@main.route('/api/datasets/<dataset_id>', methods=['GET'])
+def get_dataset(dataset_id):
+    entry = dataset_catalog.get(dataset_id)
+    if entry is None:
+        return jsonify({"error": f"Dataset '{dataset_id}' not found."}), 404
+    return jsonify(entry)
 
 @main.route('/api/upload', methods=['POST'])
 def upload_file():
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
+    with stage("upload.receive"):
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
     file = request.files['file']
     if file.filename == '' or not file.filename.endswith('.zip'):
         return jsonify({"error": "No selected file or file is not a zip"}), 400
@@ -38,25 +81,99 @@ def upload_file():
     dataset_path = os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id)
     os.makedirs(dataset_path, exist_ok=True)
     
-    zip_path = os.path.join(dataset_path, file.filename)
-    file.save(zip_path)
-    
-    extracted_files = []
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        for member in zip_ref.namelist():
-            if member.startswith('__MACOSX/') or member.split('/')[-1].startswith('._'):
-                continue
-            zip_ref.extract(member, dataset_path)
-            if member.endswith('.ndjson'): 
-                 extracted_files.append(os.path.join(dataset_path, member))
-
-    os.remove(zip_path)
-
-    generate_intelligent_schema(extracted_files, dataset_id)
-    
-    return jsonify({"dataset_id": dataset_id})
+    zip_path = os.path.join(dataset_path, UPLOAD_ARCHIVE_FILENAME)
+    with stage("upload.stage"):
+        stage_upload(file, zip_path)
+    try:
+        with stage("upload.inspect"):
+            inspect_archive(zip_path)
+    except (zipfile.BadZipFile, ArchiveLimitError) as e:
+        shutil.rmtree(dataset_path, ignore_errors=True)
+        return jsonify({"error": f"Invalid dataset archive: {e}"}), 400
+
+    job = ingest_queue.submit(dataset_id, zip_path)
+
+    return jsonify({
+        "dataset_id": dataset_id,
+        "job_id": job['job_id'],
+        "status_url": f"/api/datasets/{dataset_id}/status"
+    }), 202
+
+@main.route('/api/datasets/<dataset_id>/files', methods=['POST'])
+def append_files(dataset_id):
+    """Adds the NDJSON files of a zip to an existing dataset; files with an existing name replace it."""
+    dataset_path = os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id)
+    manifest = read_manifest(dataset_path) if os.path.isdir(dataset_path) else None
+    if manifest is None or not os.path.exists(os.path.join(dataset_path, '_schema_context.json')):
+        return jsonify({"error": f"Dataset '{dataset_id}' not found or not ready."}), 404
+    if job_active(dataset_id):
+        return jsonify({"error": f"Dataset '{dataset_id}' already has an ingest job in progress.",
+                        "job": read_job(dataset_id)}), 409
+    with stage("upload.receive"):
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+    file = request.files['file']
+    if file.filename == '' or not file.filename.endswith('.zip'):
+        return jsonify({"error": "No selected file or file is not a zip"}), 400
+
+    version = manifest.get('version', 1) + 1
+    zip_path = os.path.join(dataset_path, f"_append_v{version}.zip")
+    with stage("upload.stage"):
+        stage_upload(file, zip_path)
+    try:
+        with stage("upload.inspect"):
+            inspect_archive(zip_path)
+    except (zipfile.BadZipFile, ArchiveLimitError) as e:
+        os.remove(zip_path)
+        return jsonify({"error": f"Invalid dataset archive: {e}"}), 400
+
+    job = ingest_queue.submit(dataset_id, zip_path, kind='append', version=version)
+
+    return jsonify({
+        "dataset_id": dataset_id,
+        "version": version,
+        "job_id": job['job_id'],
+        "status_url": f"/api/datasets/{dataset_id}/status"
+    }), 202
+
+@main.route('/api/datasets/<dataset_id>/status', methods=['GET'])
+def get_dataset_status(dataset_id):
+    job = read_job(dataset_id)
+    if job is not None:
+        return jsonify(job)
+    schema_path = os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id, '_schema_context.json')
+    if os.path.exists(schema_path):
+        return jsonify({"dataset_id": dataset_id, "status": "done", "stage": "done", "progress": 100, "error": None})
+    return jsonify({"error": f"Dataset '{dataset_id}' not found."}), 404
+
+def _load_schema_context(dataset_id):
+    """Returns `(schema_context, None)`, or `(None, error_response)` when the dataset cannot be queried yet."""
+    # Appends convert new files beside the current version, so only a first ingest blocks queries.
+    job = read_job(dataset_id)
+    if job is not None and job.get('kind', 'ingest') == 'ingest' and job['status'] != 'done':
+        return None, (jsonify({
+            "error": f"Dataset '{dataset_id}' is not ready (status: {job['status']}, stage: {job['stage']}).",
+            "job": job
+        }), 409)
+    schema_context = schema_context_cache.get(dataset_id)
+    if schema_context is not None:
+        return schema_context, None
+    return None, (jsonify({"error": f"Dataset '{dataset_id}' not found or schema is missing."}), 404)
+
+@main.route('/api/datasets/<dataset_id>/engine', methods=['GET', 'PUT'])
+def dataset_engine(dataset_id):
+    dataset_path = os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id)
+    if not os.path.isdir(dataset_path):
+        return jsonify({"error": f"Dataset '{dataset_id}' not found."}), 404
+    if request.method == 'PUT':
+        engine = (request.get_json(silent=True) or {}).get('engine')
+        if engine not in ENGINES + ('auto',):
+            return jsonify({"error": f"engine must be one of {', '.join(ENGINES + ('auto',))}"}), 400
+        write_engine_setting(dataset_path, engine)
+    return jsonify(engine_info(dataset_id))
 
 @main.route('/api/query', methods=['POST'])
+@admission_controlled
 def handle_query():
     data = request.json
     dataset_id = data.get('dataset_id')
@@ -65,19 +182,242 @@ def handle_query():
     if not dataset_id or not query:
         return jsonify({"error": "dataset_id and query are required"}), 400
 
-    schema_path = os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id, '_schema_context.json')
-    try:
-        with open(schema_path, 'r', encoding='utf-8') as f:
-            schema_context = f.read()
-    except FileNotFoundError:
-        return jsonify({"error": f"Dataset '{dataset_id}' not found or schema is missing."}), 404
+    chart_format = data.get('chart_format')
+    if chart_format is not None and chart_format not in CHART_FORMATS:
+        return jsonify({"error": f"chart_format must be one of {', '.join(CHART_FORMATS)}"}), 400
+
+    trace, profile, error_response = _trace_options(data)
+    if error_response:
+        return error_response
+
+    schema_context, error_response = _load_schema_context(dataset_id)
+    if error_response:
+        return error_response
         
-    result = run_agent(dataset_id, query, schema_context)
-    return jsonify(result)
+    result = run_agent(dataset_id, query, schema_context, chart_format, session_id=data.get('session_id'),
+                       trace=trace, profile=profile)
+    with stage("response.serialize"):
+        return jsonify(result)
+
+def _flag(value):
+    return value is True or str(value).lower() in ('true', '1')
+
+def _trace_options(data):
+    """The request's `trace` and `profile` flags; profiling must be enabled on the server."""
+    trace, profile = _flag(data.get('trace')), _flag(data.get('profile'))
+    if profile and not current_app.config['PROFILING_ENABLED']:
+        return trace, profile, (jsonify({"error": "Profiling is disabled on this server (PROFILING_ENABLED)."}), 403)
+    return trace, profile, None
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@main.route('/api/query/stream', methods=['GET', 'POST'])
+@admission_controlled
+def handle_query_stream():
+    """
+    Server-sent events variant of /api/query. Emits `start`, `intent`, `code`, `table`, `summary`
+    (or `summary_token` for conversational replies), `chart` and finally `done` with the same
+    payload as the blocking endpoint, or `error`. `start` reports the admission queue wait.
+    """
+    data = request.args if request.method == 'GET' else (request.get_json(silent=True) or {})
+    dataset_id = data.get('dataset_id')
+    query = data.get('query')
+
+    if not dataset_id or not query:
+        return jsonify({"error": "dataset_id and query are required"}), 400
+
+    chart_format = data.get('chart_format')
+    if chart_format is not None and chart_format not in CHART_FORMATS:
+        return jsonify({"error": f"chart_format must be one of {', '.join(CHART_FORMATS)}"}), 400
+
+    trace, profile, error_response = _trace_options(data)
+    if error_response:
+        return error_response
+
+    schema_context, error_response = _load_schema_context(dataset_id)
+    if error_response:
+        return error_response
+    session_id = data.get('session_id')
+    waited_ms = queue_wait_ms()
+
+    def generate():
+        started = time.perf_counter()
+        first_byte_ms = None
+        for event, payload in stream_agent(dataset_id, query, schema_context, chart_format, session_id=session_id,
+                                           trace=trace, profile=profile):
+            if event == "start":
+                payload["queue_wait_ms"] = waited_ms
+            yield _sse(event, payload)
+            if first_byte_ms is None:
+                first_byte_ms = (time.perf_counter() - started) * 1000
+        print(f"Query stream for '{dataset_id}': first byte after {first_byte_ms:.1f} ms, "
+              f"closed after {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _session_info(session):
+    return {
+        "session_id": session['session_id'],
+        "dataset_id": session['dataset_id'],
+        "history": session['history'],
+        "last_code": session['last_code'],
+        "result": {"columns": session['result_columns'], "rows": session['result_rows']} if session['result_path'] else None,
+        "created_at": datetime.fromtimestamp(session['created_at']).isoformat(),
+        "accessed_at": datetime.fromtimestamp(session['accessed_at']).isoformat(),
+    }
+
+@main.route('/api/sessions', methods=['POST'])
+def create_session():
+    """Starts a conversation about a dataset; pass the returned `session_id` with follow-up queries."""
+    dataset_id = (request.get_json(silent=True) or {}).get('dataset_id')
+    if not dataset_id:
+        return jsonify({"error": "dataset_id is required"}), 400
+    if not os.path.isdir(os.path.join(current_app.config['UPLOADS_FOLDER'], dataset_id)):
+        return jsonify({"error": f"Dataset '{dataset_id}' not found."}), 404
+    session_id = session_manager.create_session(dataset_id)
+    return jsonify(_session_info(session_manager.get_session(session_id))), 201
+
+@main.route('/api/sessions/<session_id>', methods=['GET', 'DELETE'])
+def session_detail(session_id):
+    if request.method == 'DELETE':
+        if not session_manager.delete_session(session_id):
+            return jsonify({"error": f"Session '{session_id}' not found."}), 404
+        return '', 204
+    session = session_manager.get_session(session_id)
+    if session is None:
+        return jsonify({"error": f"Session '{session_id}' not found or expired."}), 404
+    return jsonify(_session_info(session))
+
+@main.route('/api/query/batch', methods=['POST'])
+@admission_controlled
+def handle_query_batch():
+    """
+    Answers a list of queries about one dataset concurrently. Returns every item in query order,
+    or with `"stream": true` sends server-sent events: `start`, one `result` per query as it
+    finishes (with its `index`), and `done`. Items have a status of 'ok' or 'error'.
+    """
+    data = request.get_json(silent=True) or {}
+    dataset_id = data.get('dataset_id')
+    queries = data.get('queries')
+
+    if not dataset_id or not isinstance(queries, list) or not queries:
+        return jsonify({"error": "dataset_id and a non-empty list of queries are required"}), 400
+    if not all(isinstance(query, str) and query.strip() for query in queries):
+        return jsonify({"error": "every query must be a non-empty string"}), 400
+    max_queries = current_app.config['BATCH_MAX_QUERIES']
+    if len(queries) > max_queries:
+        return jsonify({"error": f"a batch may hold at most {max_queries} queries"}), 400
+
+    chart_format = data.get('chart_format')
+    if chart_format is not None and chart_format not in CHART_FORMATS:
+        return jsonify({"error": f"chart_format must be one of {', '.join(CHART_FORMATS)}"}), 400
+
+    if _flag(data.get('profile')):
+        return jsonify({"error": "profile is not supported for batches; profile a single query instead"}), 400
+
+    schema_context, error_response = _load_schema_context(dataset_id)
+    if error_response:
+        return error_response
+
+    started = time.perf_counter()
+    items = run_batch(dataset_id, queries, schema_context, chart_format, trace=_flag(data.get('trace')))
+
+    def summary(results):
+        failed = sum(1 for item in results if item['status'] != 'ok')
+        return {"succeeded": len(results) - failed, "failed": failed,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+    if not data.get('stream'):
+        results = sorted(items, key=lambda item: item['index'])
+        return jsonify({"dataset_id": dataset_id, "results": results, **summary(results)})
+
+    waited_ms = queue_wait_ms()
+
+    def generate():
+        yield _sse("start", {"dataset_id": dataset_id, "count": len(queries), "queue_wait_ms": waited_ms})
+        results = []
+        for item in items:
+            results.append(item)
+            item["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            yield _sse("result", item)
+        yield _sse("done", {"dataset_id": dataset_id, **summary(results)})
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@main.route('/api/results/<result_id>', methods=['GET'])
+def get_result_page(result_id):
+    if not result_exists(result_id):
+        return jsonify({"error": f"Result '{result_id}' not found or expired."}), 404
+    try:
+        offset = int(request.args.get('cursor', 0))
+        limit = int(request.args.get('limit', current_app.config['RESULT_PAGE_ROWS']))
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be integers"}), 400
+    if offset < 0 or limit < 1:
+        return jsonify({"error": "cursor must be >= 0 and limit >= 1"}), 400
+    limit = min(limit, current_app.config['RESULT_INLINE_MAX_ROWS'])
+    return jsonify(read_result_page(result_id, offset, limit))
+
+@main.route('/api/results/<result_id>/arrow', methods=['GET'])
+def download_result_arrow(result_id):
+    if not result_exists(result_id):
+        return jsonify({"error": f"Result '{result_id}' not found or expired."}), 404
+    response = Response(result_arrow_stream(result_id), mimetype='application/vnd.apache.arrow.stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="{result_id}.arrows"'
+    return response
+
+@main.route('/api/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({"dataframes": dataframe_cache.stats(), "queries": query_cache.stats(), "charts": chart_store.stats(),
+                    "schema_contexts": schema_context_cache.stats(), "catalog": dataset_catalog.stats(),
+                    "sessions": session_manager.stats(), "llm": llm_gateway.stats(),
+                    "admission": query_admission.stats(), "stages": {"llm": llm_stage.stats(), "cpu": cpu_stage.stats()}})
+
+@main.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition of this process's stage, cache, token and request metrics."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@main.before_app_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+@main.after_app_request
+def _observe_request(response):
+    started = g.get('request_started')
+    if started is not None and request.endpoint not in (None, 'main.get_metrics', 'static'):
+        metrics.requests.observe(time.perf_counter() - started, endpoint=request.endpoint,
+                                 status=str(response.status_code))
+    return response
 
 @main.route('/visualizations/<filename>')
 def serve_visualization(filename):
-    return send_from_directory(
-        os.path.abspath(current_app.config['VISUALIZATIONS_FOLDER']), 
-        filename
-    )
+    folder = os.path.abspath(current_app.config['VISUALIZATIONS_FOLDER'])
+    match = CONTENT_ADDRESSED_NAME.match(filename)
+    if match is None:
+        return send_from_directory(folder, filename)
+
+    # Content-addressed charts never change: the hash is the ETag and clients may cache them forever.
+    etag = match.group(1)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        variant = chart_store.variant_for(filename, request.headers.get('Accept-Encoding', ''))
+        mimetype = 'text/html' if match.group(2) == 'html' else 'application/json'
+        if variant is None:
+            response = send_from_directory(folder, filename, mimetype=mimetype, etag=False, conditional=False)
+        else:
+            encoding, variant_filename = variant
+            response = send_from_directory(folder, variant_filename, mimetype=mimetype, etag=False, conditional=False)
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
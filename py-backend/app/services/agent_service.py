@@ -1,16 +1,33 @@
 import os
 import re
-import uuid
 import json
-import importlib.util
+import time
+import hashlib
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 from typing import TypedDict, Dict, Any, Optional
 
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, END
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.callbacks import BaseCallbackHandler
+
+from .executor_service import execute_analysis, share_dataset
+from .llm_gateway import llm_gateway
+from .dataframe_cache import dataset_fingerprint
+from .query_cache import query_cache
+from .intent_classifier import classify_intent, column_terms
+from .chart_service import plan_chart, build_figure, chart_title, column_signature, compile_chart_function, compiled_charts, compact_figure
+from .chart_store import chart_store
+from .result_service import result_exists, result_path, table_to_frame
+from .session_service import session_manager
+from .sql_engine import select_engine, describe_views
+from .instrumentation import stage, tracing, instrument_node
+from ..config import Config
 
 class AgentState(TypedDict):
     dataset_id: str
@@ -18,57 +35,99 @@ class AgentState(TypedDict):
     schema_context: str
     generated_code: Optional[str] = None
     analysis_result: Optional[Dict[str, Any]] = None
-    visualization_output: Optional[Dict[str, str]] = None
+    visualization_output: Optional[Dict[str, Any]] = None
+    chart_format: Optional[str] = None
+    engine: Optional[str] = None
     intent: Optional[str] = None 
+    dataset_fingerprint: Optional[str] = None
+    code_cache_hit: Optional[bool] = None
+    result_cache_hit: Optional[bool] = None
+    session_id: Optional[str] = None
+    conversation: Optional[str] = None
+    previous_result: Optional[str] = None
+    result_frame: Optional[pd.DataFrame] = None
 
 @tool
-def python_pandas_tool(dataset_id: str, code: str) -> Dict[str, Any]:
+def python_pandas_tool(dataset_id: str, code: str, engine: str = "pandas", previous_result: Optional[str] = None,
+                       keep_frame: bool = False) -> Dict[str, Any]:
     """
     Executes a string of Python code designed to analyze a dataset using Pandas.
-    The code must define a function `analyze_data(dataframes: dict)`.
-    This tool loads all data files for the given dataset_id into a dictionary of
-    DataFrames and passes it to the `analyze_data` function.
+    The code must define a function `analyze_data(dataframes: dict, combined, rollups: dict, previous=None)`.
+    The code runs in a sandboxed worker process, which passes the dataset's files as a
+    dictionary of DataFrames and, if the function accepts them, `combined`: all rows in one
+    DataFrame with source and context columns, and `rollups`: hourly and daily aggregates. With the 'duckdb' engine, `analyze_data(db)`
+    instead receives a DuckDB-backed handle with a combined view and one view per data file.
+    `previous` is the session's last result table, read from the `previous_result` Parquet file.
     """
     cleaned_code = code.strip().replace("```python", "").replace("```", "").strip()
-
-    local_namespace = {"pd": pd, "re": re}
-    dataset_path = os.path.join('uploads', dataset_id)
-    map_path = os.path.join(dataset_path, '_column_map.json')
-
-    try:
-        with open(map_path, 'r', encoding='utf-8') as f:
-            column_map = json.load(f)
-    except Exception as e:
-        return {"error": f"Failed to load column map: {e}"}
-
-    dataframes = {}
-    for filename in os.listdir(dataset_path):
-        if filename.endswith('.ndjson'):
-            file_path = os.path.join(dataset_path, filename)
-            df = pd.read_json(file_path, lines=True)
-            df.columns = [column_map.get(col, col) for col in df.columns]
-            dataframes[filename] = df
-            
-    try:
-        exec(cleaned_code, local_namespace)
-        analyze_data_func = local_namespace['analyze_data']
-        result = analyze_data_func(dataframes)
+    return execute_analysis(dataset_id, cleaned_code, engine, previous_path=previous_result, keep_frame=keep_frame)
+
+def _generate_plot_with_llm(table_data: list, query: str):
+    """Fallback for tables the chart planner cannot handle; compiled functions are reused per column signature."""
+    signature = column_signature(table_data)
+    generate_plot = compiled_charts.get(signature)
+    if generate_plot is None:
+        actual_columns = list(table_data[0].keys())
+        llm = llm_gateway.chat("gpt-4o-mini")
+        prompt = ChatPromptTemplate.from_template(
+            """
+            You are a Python data visualization expert. Your task is to write a single Python function `generate_plot(data)` that takes a list of dictionaries and returns a Plotly Figure object.
         
-        if 'table' in result and isinstance(result['table'], list):
-            table_data = result['table']
-            for row in table_data:
-                for key, value in row.items():
-                    if isinstance(value, pd.Timestamp):
-                        row[key] = value.isoformat()
-            result['table'] = table_data
+            User's Query: "{query}"
+            Available Data Columns: {actual_columns}
         
-        return result
-    except Exception as e:
-        print(f"--- Code Execution Error ---\nCode:\n{cleaned_code}\nError: {e}")
-        return {"error": f"Execution failed: {e}"}
+            Based on the user's query and the available columns, write the Python code.
+            - The first line inside the function MUST be `df = pd.DataFrame(data)`.
+            - Choose the best chart type (e.g., 'bar', 'line', 'pie') to answer the query.
+            - Use the actual column names provided for the x and y axes. For example: `x=df['{col1}']`, `y=df['{col2}']`.
+            - Create a descriptive title for the chart.
+            - The script must only contain the function definition and necessary imports (pandas, plotly.graph_objects). DO NOT call the function.
+            """
+        )
+        code_generation_chain = prompt | llm | StrOutputParser()
+    
+        response = code_generation_chain.invoke({
+            "query": query,
+            "actual_columns": actual_columns,
+            "col1": actual_columns[0],
+            "col2": actual_columns[1] if len(actual_columns) > 1 else actual_columns[0]
+        })
+    
+        python_code = response.replace("```python", "").replace("```", "").strip()
+        generate_plot = compile_chart_function(python_code)
+        compiled_charts.put(signature, generate_plot)
+
+    try:
+        return generate_plot(table_data)
+    except Exception:
+        compiled_charts.discard(signature)
+        raise
+
+
+def _store_chart(fig, chart_format: str) -> Dict[str, Any]:
+    """Serializes a figure in the requested format and saves it in the content-addressed chart store."""
+    if chart_format == "json":
+        figure = compact_figure(fig)
+        filename = chart_store.save(json.dumps(figure, separators=(',', ':')), 'json')
+        return {"html_snippet": "", "figure": figure, "url": f"/visualizations/{filename}", "format": "json"}
+
+    # A div id derived from the figure keeps the snippet identical for identical charts.
+    div_id = "chart-" + hashlib.sha1(fig.to_json().encode('utf-8')).hexdigest()[:16]
+    html_snippet = fig.to_html(full_html=False, include_plotlyjs='cdn', div_id=div_id)
+    filename = chart_store.save(html_snippet, 'html')
+    return {"html_snippet": html_snippet, "url": f"/visualizations/{filename}", "format": "html"}
+
+
+def _restore_chart(visualization_output: Dict[str, Any]):
+    """Re-saves a cached chart so its URL keeps working after the chart store was pruned."""
+    if visualization_output.get('format') == "json":
+        chart_store.save(json.dumps(visualization_output['figure'], separators=(',', ':')), 'json')
+    elif visualization_output.get('url') and visualization_output.get('html_snippet'):
+        chart_store.save(visualization_output['html_snippet'], 'html')
+
 
 @tool
-def visualization_tool(dataset_id: str, analysis_result: Dict[str, Any], query: str) -> Dict[str, str]:
+def visualization_tool(dataset_id: str, analysis_result: Dict[str, Any], query: str, chart_format: str = "html") -> Dict[str, Any]:
     """
     Generates a Plotly visualization from the result of a data analysis.
     """
@@ -76,57 +135,30 @@ def visualization_tool(dataset_id: str, analysis_result: Dict[str, Any], query:
     if not table_data or not isinstance(table_data, list) or not table_data[0]:
         return {"html_snippet": "<p>No data available to generate a chart.</p>", "url": ""}
 
-    actual_columns = list(table_data[0].keys())
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    prompt = ChatPromptTemplate.from_template(
-        """
-        You are a Python data visualization expert. Your task is to write a single Python function `generate_plot(data)` that takes a list of dictionaries and returns a Plotly Figure object.
-        
-        User's Query: "{query}"
-        Available Data Columns: {actual_columns}
-        
-        Based on the user's query and the available columns, write the Python code.
-        - The first line inside the function MUST be `df = pd.DataFrame(data)`.
-        - Choose the best chart type (e.g., 'bar', 'line', 'pie') to answer the query.
-        - Use the actual column names provided for the x and y axes. For example: `x=df['{col1}']`, `y=df['{col2}']`.
-        - Create a descriptive title for the chart.
-        - The script must only contain the function definition and necessary imports (pandas, plotly.graph_objects). DO NOT call the function.
-        """
-    )
-    code_generation_chain = prompt | llm | StrOutputParser()
-    
-    response = code_generation_chain.invoke({
-        "query": query,
-        "actual_columns": actual_columns,
-        "col1": actual_columns[0],
-        "col2": actual_columns[1] if len(actual_columns) > 1 else actual_columns[0]
-    })
-    
-    python_code = response.replace("```python", "").replace("```", "").strip()
+    with stage("chart.build", rows=len(table_data)) as span:
+        plan = plan_chart(table_data, query)
+        span['planned'] = plan is not None
+        if plan is not None:
+            fig = build_figure(table_data, plan, chart_title(query))
+        else:
+            fig = _generate_plot_with_llm(table_data, query)
 
-    temp_filename = f"temp_chart_gen_{uuid.uuid4()}.py"
-    with open(temp_filename, "w", encoding="utf-8") as f:
-        f.write(python_code)
-        
-    spec = importlib.util.spec_from_file_location("chart_module", temp_filename)
-    chart_module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(chart_module)
-    
-    fig = chart_module.generate_plot(table_data)
-    os.remove(temp_filename)
-
-    html_snippet = fig.to_html(full_html=False, include_plotlyjs='cdn')
-    viz_filename = f"{dataset_id}_{uuid.uuid4()}.html"
-    viz_filepath = os.path.join('visualizations', viz_filename)
-    with open(viz_filepath, "w", encoding="utf-8") as f:
-        f.write(html_snippet)
-    
-    viz_url = f"/visualizations/{viz_filename}"
-    return {"html_snippet": html_snippet, "url": viz_url}
+    with stage("chart.store", format=chart_format):
+        return _store_chart(fig, chart_format)
+
+# LLM runs tagged with this have their tokens forwarded to streaming clients as summary tokens.
+SUMMARY_STREAM_TAG = "summary_stream"
 
 # --- New Nodes for Intent Routing and General Response ---
 def intent_router_node(state: AgentState) -> Dict[str, Any]:
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0) 
+    if Config.INTENT_CLASSIFIER_ENABLED:
+        decision = classify_intent(state['query'], column_terms(state['schema_context']))
+        if decision['intent'] is not None:
+            print(f"User Query: '{state['query']}' -> Intent: '{decision['intent']}' "
+                  f"(source: {decision['source']}, confidence: {decision['confidence']:.2f})")
+            return {"intent": decision['intent']}
+
+    llm = llm_gateway.chat("gpt-4o-mini")
     prompt = ChatPromptTemplate.from_messages([
         ("system", """
         You are an AI assistant. Your task is to classify the user's intent based on their query.
@@ -148,11 +180,11 @@ def intent_router_node(state: AgentState) -> Dict[str, Any]:
         print(f"Intent classification failed: {e}. Defaulting to DATA_ANALYSIS_REQUEST.")
         intent = 'DATA_ANALYSIS_REQUEST' # Fallback if LLM call fails
         
-    print(f"User Query: '{state['query']}' -> Intent: '{intent}'")
+    print(f"User Query: '{state['query']}' -> Intent: '{intent}' (source: llm)")
     return {"intent": intent}
 
 def general_response_node(state: AgentState) -> Dict[str, Any]:
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+    llm = llm_gateway.chat("gpt-4o-mini", temperature=0.7, streaming=True)
     prompt = ChatPromptTemplate.from_messages([
         ("system", """
         You are an AI assistant designed to help users analyze datasets and create visualizations.
@@ -167,7 +199,7 @@ def general_response_node(state: AgentState) -> Dict[str, Any]:
         """),
         ("human", "User Query: {query}")
     ])
-    chain = prompt | llm | StrOutputParser()
+    chain = (prompt | llm | StrOutputParser()).with_config(tags=[SUMMARY_STREAM_TAG])
     
     response_text = chain.invoke({"query": state['query']})
     
@@ -180,18 +212,14 @@ def general_response_node(state: AgentState) -> Dict[str, Any]:
     }
 
 # --- Existing Graph Nodes ---
-def code_generator_node(state: AgentState) -> Dict[str, str]:
-    """Generates the Python analysis code."""
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """
-        You are an expert Python data scientist. Your sole task is to write a single Python function `analyze_data(dataframes: dict)` to answer the user's query based on the provided data schema.
+PANDAS_CODEGEN_PROMPT = """
+        You are an expert Python data scientist. Your sole task is to write a single Python function `analyze_data(dataframes: dict, combined, rollups: dict, previous=None)` to answer the user's query based on the provided data schema.
 
         **Function Requirements:**
-        1.  **Input:** The function will receive a dictionary of Pandas DataFrames, where keys are the original filenames.
-        2.  **Combine Data:** The first step inside your function MUST be to combine all DataFrames into a single master DataFrame.
-        3.  **Create Context Column:** While combining, you MUST create a new column to identify the source of each row. Extract a meaningful name (like a room number or category) from the filename. A helper function `extract_context(filename)` is recommended.
-        4.  **Perform Analysis:** Write the necessary Pandas code to perform the calculations required by the user's query. This may include filtering, grouping, calculating standard deviation (`.std()`), finding max/min values (`.idxmax()`), sorting, etc.
+        1.  **Input:** `dataframes` is a dictionary of Pandas DataFrames, where keys are the original filenames. `combined` is a single DataFrame with the rows of every file, already combined, with a categorical source column holding the filename and a categorical context column holding a meaningful name parsed from it (like a room number or category). They are named `source` and `context` unless the schema context names them differently. `rollups` holds precomputed hourly and daily aggregates per source (`rollups['hour']`, `rollups['day']`) when the schema context describes them, and is empty otherwise. `previous` is the result table of the previous answer in this conversation as a DataFrame, or None.
+        2.  **Use the Combined Data:** For analysis across files, start from `combined`. Do NOT concatenate the DataFrames yourself and do NOT parse filenames; group or filter by the context column instead.
+        3.  **Prefer Rollups:** If the query only needs counts, sums, means, minima, maxima or standard deviations per source by hour or day (or coarser), compute them from `rollups` with the formulas in the schema context instead of scanning `combined`. Otherwise select the columns you need from `combined` and filter before any expensive step, and do not copy the whole DataFrame.
+        4.  **Perform Analysis:** Write the necessary Pandas code to perform the calculations required by the user's query. This may include filtering, grouping, calculating standard deviation (`.std()`), finding max/min values (`.idxmax()`), sorting, etc. Pandas copy-on-write is enabled, so chained assignment such as `df['col'][mask] = value` has no effect; assign with `df.loc[mask, 'col'] = value`.
         5.  **Return Value:** The function MUST return a dictionary with two keys:
             - `table`: The final data as a list of dictionaries (e.g., `df.to_dict('records')`).
             - `summary_text`: A detailed, data-driven explanation of your findings in natural language.
@@ -199,31 +227,154 @@ def code_generator_node(state: AgentState) -> Dict[str, str]:
         **IMPORTANT HOUR FORMATTING:**
         If the analysis involves the 'hour' column (typically an integer from 0-23) and it's part of the final `table` output or `summary_text`, ensure these hour values are formatted as "HH:00" (e.g., 0 becomes "00:00", 1 becomes "01:00", ..., 23 becomes "23:00"). For example, apply `df['hour'] = df['hour'].apply(lambda x: f"{{x:02d}}:00")` to the DataFrame column *before* converting to dictionary records or using it in summary text.
 
+        **Conversation:**
+        {conversation}
+
         **Schema Context:**
         {schema_context}
         
         **Constraint:**
         Return ONLY the raw Python code. Do not include markdown, explanations, or any text outside the function definition.
-        """),
+        """
+
+SQL_CODEGEN_PROMPT = """
+        You are an expert data analyst who writes DuckDB SQL inside Python. Your sole task is to write a single Python function `analyze_data(db, previous=None)` to answer the user's query based on the provided data schema.
+
+        **Function Requirements:**
+        1.  **Input:** `db` gives SQL access to the dataset through DuckDB views:
+{views}
+            Call `db.query(sql)` to run a DuckDB SQL query; it returns a Pandas DataFrame with the result.
+            `previous` is the result table of the previous answer in this conversation as a Pandas DataFrame, or None; it is not a view, so process it with Pandas.
+        2.  **Work in SQL:** The data may be larger than memory. Select only the columns you need, filter in `WHERE`, aggregate with `GROUP BY`, and sort and limit in SQL. Never select raw rows without a `LIMIT`.
+        3.  **Use the Combined View:** To analyze several files together, query the combined view, which already holds every file's rows with a source column (the filename) and a context column (like a room number or category). Do NOT union the per-file views yourself and do NOT parse filenames. If there are rollup views and the query only needs per-source counts, sums, means, minima, maxima or standard deviations by hour or day, query them instead of the raw data.
+        4.  **Perform Analysis:** Use SQL aggregates (`avg`, `stddev_samp`, `min`, `max`, `arg_max`, `date_trunc`, `extract(hour FROM ...)`, window functions) for the calculations. Only small results should be post-processed with Pandas.
+        5.  **Return Value:** The function MUST return a dictionary with two keys:
+            - `table`: The final data as a list of dictionaries (e.g., `df.to_dict('records')`).
+            - `summary_text`: A detailed, data-driven explanation of your findings in natural language.
+
+        **IMPORTANT HOUR FORMATTING:**
+        If the analysis involves an hour value (an integer from 0-23) and it's part of the final `table` output or `summary_text`, format it as "HH:00" (e.g., 0 becomes "00:00", 23 becomes "23:00"), for example with `lpad(CAST(hour AS VARCHAR), 2, '0') || ':00'` in SQL.
+
+        **Conversation:**
+        {conversation}
+
+        **Schema Context:**
+        {schema_context}
+        
+        **Constraint:**
+        Return ONLY the raw Python code. Do not include markdown, explanations, or any text outside the function definition.
+        """
+
+
+FIRST_TURN_CONVERSATION = "This is the first question of the conversation; `previous` is None."
+# Earlier answers are shown to the code generator cut to this many characters.
+CONVERSATION_SUMMARY_CHARS = 300
+
+
+def _conversation_context(session: Optional[Dict[str, Any]]) -> Optional[str]:
+    """The session's earlier turns, last code and last result columns for the code generator, or None on a first question."""
+    if not session or not session['history']:
+        return None
+    lines = ["Earlier questions in this conversation, oldest first:"]
+    for turn in session['history']:
+        lines.append(f"- Q: {turn['query']}")
+        summary = turn.get('summary') or ""
+        if summary:
+            if len(summary) > CONVERSATION_SUMMARY_CHARS:
+                summary = summary[:CONVERSATION_SUMMARY_CHARS] + "..."
+            lines.append(f"  A: {summary}")
+    if session.get('last_code'):
+        lines += ["Code that produced the last result:", session['last_code']]
+    if session.get('result_columns'):
+        columns = ", ".join(f"`{column}`" for column in session['result_columns'])
+        lines.append(f"`previous` holds that result table ({session['result_rows']} rows; columns {columns}). "
+                     "If the question follows up on it (filters, sorts, reshapes or re-aggregates it) and `previous` "
+                     "has the columns it needs, compute the answer from `previous` instead of the full data.")
+    else:
+        lines.append("`previous` is None.")
+    return "\n".join(lines)
+
+
+def _codegen_cache_key(schema_context: str, engine: str, conversation: Optional[str] = None) -> str:
+    # Code written for one engine cannot run on the other, so each engine has its own cache entries.
+    key = schema_context if engine == "pandas" else f"[engine: {engine}]\n{schema_context}"
+    # A follow-up question only means the same thing after the same conversation.
+    return key if conversation is None else f"{key}\n[conversation]\n{conversation}"
+
+
+def _uses_previous(code: str) -> bool:
+    """Whether generated code declares the `previous` parameter (or takes **kwargs)."""
+    match = re.search(r'def\s+analyze_data\s*\(([^)]*)\)', code)
+    return match is not None and ('previous' in match.group(1) or '**' in match.group(1))
+
+
+def code_generator_node(state: AgentState) -> Dict[str, str]:
+    """Generates the analysis code for the dataset's engine, reusing cached code for the same or a near-identical query."""
+    engine = select_engine(state['dataset_id'])
+    cache_key = _codegen_cache_key(state['schema_context'], engine, state.get('conversation'))
+    cached_code = query_cache.get_code(cache_key, state['query'])
+    if cached_code is not None:
+        return {"generated_code": cached_code, "code_cache_hit": True, "engine": engine}
+
+    llm = llm_gateway.chat("gpt-4o")
+    if engine == "duckdb":
+        dataset_path = os.path.join(Config.UPLOADS_FOLDER, state['dataset_id'])
+        views = describe_views(dataset_path).replace("{", "{{").replace("}", "}}")
+        system_prompt = SQL_CODEGEN_PROMPT.replace("{views}", "\n".join(" " * 12 + line for line in views.splitlines()))
+    else:
+        system_prompt = PANDAS_CODEGEN_PROMPT
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", system_prompt),
         ("human", "User Query: {query}")
     ])
     chain = prompt | llm | StrOutputParser()
     generated_code = chain.invoke({
         "schema_context": state['schema_context'], 
+        "conversation": state.get('conversation') or FIRST_TURN_CONVERSATION,
         "query": state['query']
     })
-    return {"generated_code": generated_code}
+    return {"generated_code": generated_code, "code_cache_hit": False, "engine": engine}
 
 def code_executor_node(state: AgentState) -> Dict[str, Any]:
-    """Executes the generated code using the python_pandas_tool."""
+    """Executes the generated code using the python_pandas_tool, unless this dataset version already ran it."""
+    fingerprint = dataset_fingerprint(state['dataset_id'])
+    previous_result = state.get('previous_result')
+    if previous_result and _uses_previous(state['generated_code']):
+        # The session's result files are never rewritten, so their names identify the input.
+        fingerprint = f"{fingerprint}+{os.path.basename(previous_result)}"
+    cached = query_cache.get_result(fingerprint, state['generated_code'])
+    table_info = (cached or {}).get('analysis_result', {}).get('table_info')
+    if cached is not None and (table_info is None or result_exists(table_info['result_id'])):
+        return {
+            "analysis_result": cached['analysis_result'],
+            "visualization_output": cached['visualization_output'],
+            "dataset_fingerprint": fingerprint,
+            "result_cache_hit": True
+        }
+
+    engine = state.get('engine') or "pandas"
     result = python_pandas_tool.invoke({
         "dataset_id": state['dataset_id'],
-        "code": state['generated_code']
+        "code": state['generated_code'],
+        "engine": engine,
+        "previous_result": previous_result,
+        "keep_frame": bool(state.get('session_id'))
     })
-    return {"analysis_result": result}
+    result_frame = result.pop('frame', None)
+    if "error" not in result and not state.get('code_cache_hit'):
+        query_cache.put_code(_codegen_cache_key(state['schema_context'], engine, state.get('conversation')),
+                             state['query'], state['generated_code'], state['dataset_id'])
+    return {"analysis_result": result, "dataset_fingerprint": fingerprint, "result_cache_hit": False,
+            "result_frame": result_frame}
 
 def visualization_node(state: AgentState) -> Dict[str, Any]:
     """Generates a visualization from the analysis result."""
+    chart_format = state.get('chart_format') or Config.CHART_FORMAT
+    cached_output = state.get('visualization_output') if state.get('result_cache_hit') else None
+    if cached_output is not None and cached_output.get('format', 'html') == chart_format:
+        _restore_chart(cached_output)
+        return {"visualization_output": cached_output}
+
     analysis_result = state.get('analysis_result', {})
     if "error" in analysis_result or not analysis_result.get('table'):
         return {"visualization_output": {"html_snippet": "", "url": ""}}
@@ -231,17 +382,20 @@ def visualization_node(state: AgentState) -> Dict[str, Any]:
     result = visualization_tool.invoke({
         "dataset_id": state['dataset_id'],
         "analysis_result": analysis_result,
-        "query": state['query']
+        "query": state['query'],
+        "chart_format": chart_format
     })
+    query_cache.put_result(state['dataset_fingerprint'], state['generated_code'], state['dataset_id'],
+                           analysis_result, result)
     return {"visualization_output": result}
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("intent_router", intent_router_node) 
-workflow.add_node("general_response", general_response_node) 
-workflow.add_node("code_generator", code_generator_node)
-workflow.add_node("code_executor", code_executor_node)
-workflow.add_node("visualizer", visualization_node)
+workflow.add_node("intent_router", instrument_node("intent_router", intent_router_node))
+workflow.add_node("general_response", instrument_node("general_response", general_response_node))
+workflow.add_node("code_generator", instrument_node("code_generator", code_generator_node))
+workflow.add_node("code_executor", instrument_node("code_executor", code_executor_node))
+workflow.add_node("visualizer", instrument_node("visualizer", visualization_node))
 
 workflow.set_entry_point("intent_router") 
 
@@ -266,18 +420,9 @@ workflow.add_edge("visualizer", END)
 app_graph = workflow.compile()
 
 
-def run_agent(dataset_id: str, query: str, schema_context: str) -> Dict[str, Any]:
-    initial_state = {
-        "dataset_id": dataset_id,
-        "query": query,
-        "schema_context": schema_context,
-        "intent": None 
-    }
-    
-    final_state = app_graph.invoke(initial_state)
-
-    analysis_result = final_state.get('analysis_result', {})
-    visualization_output = final_state.get('visualization_output', {"html_snippet": "", "url": ""})
+def _build_response(final_state: Dict[str, Any]) -> Dict[str, Any]:
+    analysis_result = final_state.get('analysis_result') or {}
+    visualization_output = final_state.get('visualization_output') or {"html_snippet": "", "url": ""}
     
     
     if final_state.get('intent') == "GENERAL_CONVERSATION":
@@ -304,14 +449,237 @@ def run_agent(dataset_id: str, query: str, schema_context: str) -> Dict[str, Any
             "visualizationHtml": visualization_output.get('html_snippet', ''),
             "visualizationUrl": visualization_output.get('url', '')
         }
+        if analysis_result.get('table_info'):
+            result["tableInfo"] = analysis_result['table_info']
+        if visualization_output.get('figure') is not None:
+            result["visualizationSpec"] = visualization_output['figure']
+
+    result["cache"] = {
+        "code": bool(final_state.get('code_cache_hit')),
+        "result": bool(final_state.get('result_cache_hit'))
+    }
+    return result
+
+
+def _open_session(dataset_id: str, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The session to continue, or a new one if `session_id` is unknown, expired or belongs to another dataset."""
+    if session_id is None:
+        return None
+    session = session_manager.get_session(session_id)
+    if session is None or session['dataset_id'] != dataset_id:
+        session = session_manager.get_session(session_manager.create_session(dataset_id))
+    return session
+
 
-    print("\n" + "="*50)
-    print("FINAL JSON RESPONSE TO FRONTEND:")
+def _initial_state(dataset_id: str, query: str, schema_context: str, chart_format: Optional[str] = None,
+                   session: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    state = {
+        "dataset_id": dataset_id,
+        "query": query,
+        "schema_context": schema_context,
+        "chart_format": chart_format or Config.CHART_FORMAT,
+        "intent": None 
+    }
+    if session is not None:
+        state["session_id"] = session['session_id']
+        state["conversation"] = _conversation_context(session)
+        if session.get('result_path') and os.path.exists(session['result_path']):
+            state["previous_result"] = session['result_path']
+    return state
+
+
+def _record_session_turn(final_state: Dict[str, Any], result: Dict[str, Any]):
+    """Adds the answered query to its session; a successful analysis also becomes the session's last code and result."""
+    session_id = final_state.get('session_id')
+    if not session_id:
+        return
+    analysis_result = final_state.get('analysis_result') or {}
+    code, frame, stored_path = None, None, None
+    if final_state.get('intent') == "DATA_ANALYSIS_REQUEST" and "error" not in analysis_result:
+        code = final_state.get('generated_code')
+        table_info = analysis_result.get('table_info')
+        if table_info is not None and result_exists(table_info['result_id']):
+            stored_path = result_path(table_info['result_id'])
+        elif final_state.get('result_frame') is not None:
+            frame = final_state['result_frame']
+        else:
+            frame = table_to_frame(analysis_result.get('table'))
     try:
-        print(json.dumps(result, indent=2))
-    except TypeError as e:
-        print(f"Could not serialize result to JSON: {e}")
-        print(str(result))
-    print("="*50 + "\n")
-    
-    return result
\ No newline at end of file
+        session_manager.record_turn(session_id, final_state['query'], result.get('summary'), code,
+                                    final_state.get('engine'), frame, stored_path)
+    except Exception as e:
+        print(f"Recording a turn of session '{session_id}' failed: {e}")
+    result["session_id"] = session_id
+
+
+LOG_SUMMARY_CHARS = 200
+
+
+def _response_log_line(dataset_id: str, query: str, result: Dict[str, Any]) -> str:
+    """One bounded log line per answered query instead of a dump of the whole response."""
+    summary = str(result['summary'])
+    if len(summary) > LOG_SUMMARY_CHARS:
+        summary = summary[:LOG_SUMMARY_CHARS] + "..."
+    table_info = result.get('tableInfo')
+    total_rows = table_info['total_rows'] if table_info else len(result['table'])
+    return (f"Answered '{query}' on '{dataset_id}': {len(result['table'])}/{total_rows} rows inline, "
+            f"chart {result['visualizationUrl'] or 'none'}, cache {result['cache']}, summary {summary!r}")
+
+
+def _trace_report(trace) -> Dict[str, Any]:
+    """A request's timing breakdown; a profiled request also gets the path of its .prof file and its hottest functions."""
+    report = trace.as_dict()
+    if trace.profile:
+        report["profile"] = {"path": trace.dump_profile(Config.PROFILES_FOLDER), "top": trace.profile_report()}
+    return report
+
+
+def _answer(dataset_id: str, query: str, schema_context: str, chart_format: Optional[str] = None,
+            session_id: Optional[str] = None, trace: bool = False, profile: bool = False) -> tuple:
+    with tracing(profile) if trace or profile else nullcontext() as request_trace:
+        session = _open_session(dataset_id, session_id)
+        final_state = app_graph.invoke(_initial_state(dataset_id, query, schema_context, chart_format, session))
+
+        result = _build_response(final_state)
+        _record_session_turn(final_state, result)
+    if request_trace is not None:
+        result["trace"] = _trace_report(request_trace)
+
+    print(_response_log_line(dataset_id, query, result))
+    return final_state, result
+
+
+def run_agent(dataset_id: str, query: str, schema_context: str, chart_format: Optional[str] = None,
+              session_id: Optional[str] = None, trace: bool = False, profile: bool = False) -> Dict[str, Any]:
+    """Answers a query. With `trace` the response carries a per-stage timing breakdown; `profile` also runs the graph nodes under cProfile."""
+    return _answer(dataset_id, query, schema_context, chart_format, session_id, trace, profile)[1]
+
+
+def run_batch(dataset_id: str, queries: list, schema_context: str, chart_format: Optional[str] = None,
+              trace: bool = False):
+    """
+    Answers several queries about one dataset and yields one item per query as it finishes. The
+    dataset is loaded once and shared with the executor workers, then the queries run through the
+    graph concurrently, so their LLM calls overlap within the gateway and stage limits. Each item
+    is `{"index", "query", "status", "result"}` with status 'ok', or 'error' and an `error`
+    message; a failed query never fails the batch. With `trace` every result carries its own timing breakdown.
+    """
+    share_dataset(dataset_id)
+    pool = ThreadPoolExecutor(max_workers=max(1, min(Config.BATCH_MAX_CONCURRENCY, len(queries))),
+                              thread_name_prefix="batch-query")
+    try:
+        futures = {pool.submit(_answer, dataset_id, query, schema_context, chart_format, None, trace): index
+                   for index, query in enumerate(queries)}
+        for future in as_completed(futures):
+            index = futures[future]
+            item = {"index": index, "query": queries[index]}
+            try:
+                final_state, result = future.result()
+            except Exception as e:
+                print(f"Batch query '{queries[index]}' on '{dataset_id}' failed: {e}")
+                item.update(status="error", error=str(e), result=None)
+            else:
+                error = (final_state.get('analysis_result') or {}).get('error')
+                item.update(status="error" if error else "ok", result=result)
+                if error:
+                    item["error"] = error
+            yield item
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _SummaryTokenHandler(BaseCallbackHandler):
+    """Forwards tokens of LLM runs tagged with SUMMARY_STREAM_TAG to a streaming client."""
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._run_ids = set()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        if tags and SUMMARY_STREAM_TAG in tags:
+            self._run_ids.add(run_id)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if token and run_id in self._run_ids:
+            self._emit("summary_token", {"token": token})
+
+
+def _node_events(node: str, update: Dict[str, Any]):
+    """Maps a finished graph node's state update to the events sent to streaming clients."""
+    if node == "intent_router":
+        yield "intent", {"intent": update['intent']}
+    elif node == "code_generator":
+        yield "code", {"code": update['generated_code'], "cached": update.get('code_cache_hit', False),
+                       "engine": update.get('engine')}
+    elif node == "code_executor":
+        analysis_result = update['analysis_result']
+        if "error" in analysis_result:
+            yield "table", {"table": [], "error": analysis_result['error'], "cached": update['result_cache_hit']}
+        else:
+            yield "table", {"table": analysis_result.get('table', []), "table_info": analysis_result.get('table_info'),
+                            "cached": update['result_cache_hit']}
+            yield "summary", {"text": analysis_result.get('summary_text', "Analysis complete.")}
+    elif node == "general_response":
+        yield "summary", {"text": update['analysis_result']['summary_text']}
+    elif node == "visualizer":
+        visualization_output = update['visualization_output']
+        yield "chart", {"html": visualization_output.get('html_snippet', ''), "url": visualization_output.get('url', ''),
+                        "figure": visualization_output.get('figure')}
+
+
+def stream_agent(dataset_id: str, query: str, schema_context: str, chart_format: Optional[str] = None,
+                 session_id: Optional[str] = None, trace: bool = False, profile: bool = False):
+    """
+    Runs the agent graph and yields `(event, data)` pairs as each node finishes: the intent, the
+    generated code, the result table (before the chart is rendered), summary text or tokens, the
+    chart, and finally `done` with the same payload `run_agent` returns. Every event carries the
+    milliseconds elapsed since the request started; `done` also reports when each event type first
+    went out, so time-to-first-byte and time-to-table can be measured. With `trace` or `profile`
+    `done` carries the same timing breakdown (and profile) as `run_agent`.
+    """
+    started = time.perf_counter()
+    events = queue.Queue()
+    initial_state = _initial_state(dataset_id, query, schema_context, chart_format, _open_session(dataset_id, session_id))
+
+    def emit(event: str, data: Dict[str, Any]):
+        events.put((event, data))
+
+    def run():
+        final_state = dict(initial_state)
+        try:
+            with tracing(profile) if trace or profile else nullcontext() as request_trace:
+                config = {"callbacks": [_SummaryTokenHandler(emit)]}
+                for step in app_graph.stream(initial_state, config=config):
+                    for node, update in step.items():
+                        final_state.update(update or {})
+                        for event, data in _node_events(node, update or {}):
+                            emit(event, data)
+                result = _build_response(final_state)
+                _record_session_turn(final_state, result)
+            if request_trace is not None:
+                result["trace"] = _trace_report(request_trace)
+            emit("done", result)
+        except Exception as e:
+            print(f"Streaming query failed: {e}")
+            emit("error", {"error": str(e)})
+        finally:
+            events.put(None)
+
+    threading.Thread(target=run, name="stream-agent", daemon=True).start()
+
+    first_sent = {}
+    yield "start", {"dataset_id": dataset_id, "query": query, "session_id": initial_state.get('session_id'),
+                    "elapsed_ms": 0.0}
+    while True:
+        item = events.get()
+        if item is None:
+            break
+        event, data = item
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        first_sent.setdefault(event, elapsed_ms)
+        data["elapsed_ms"] = elapsed_ms
+        if event == "done":
+            data["timings"] = first_sent
+            print(f"Streamed query '{query}': first event {min(first_sent.values())} ms, "
+                  f"table {first_sent.get('table')} ms, done {elapsed_ms} ms")
+        yield event, data
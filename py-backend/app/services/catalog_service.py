@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from ..config import Config
+from .ingest_service import read_manifest
+
+SCHEMA_CONTEXT_FILENAME = '_schema_context.json'
+SORT_COLUMNS = ('dataset_id', 'created_at', 'updated_at', 'total_rows', 'total_bytes', 'file_count')
+_JSON_FIELDS = ('files', 'columns')
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+def _epoch(iso_time: Optional[str]) -> Optional[float]:
+    if not iso_time:
+        return None
+    parsed = datetime.fromisoformat(iso_time)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _dataset_status(job: Optional[Dict[str, Any]], has_context: bool) -> str:
+    if job is None:
+        return 'done' if has_context else 'incomplete'
+    if job.get('kind') == 'append':
+        # The dataset stays queryable while files are appended, and after a failed append.
+        return 'updating' if job['status'] in ('queued', 'running') else 'done'
+    return job['status']
+
+
+def describe_dataset(dataset_id: str, job: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Builds a dataset's catalog row from its folder: manifest, schema context and ingest job."""
+    dataset_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id)
+    if not os.path.isdir(dataset_path):
+        return None
+    if job is None:
+        from .job_service import read_job
+        job = read_job(dataset_id)
+
+    manifest = read_manifest(dataset_path) or {"files": {}}
+    files, columns = {}, {}
+    for filename, info in manifest['files'].items():
+        files[filename] = {key: info.get(key) for key in ('rows', 'bytes', 'source_bytes')}
+        files[filename]['version'] = info.get('version', 1)
+        for column, dtype in info.get('dtypes', {}).items():
+            columns.setdefault(column, dtype)
+
+    try:
+        with open(os.path.join(dataset_path, SCHEMA_CONTEXT_FILENAME), 'rb') as f:
+            schema_hash = hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        schema_hash = None
+
+    created_at = _epoch(job['created_at']) if job and job.get('kind', 'ingest') == 'ingest' else None
+    return {
+        "dataset_id": dataset_id,
+        "status": _dataset_status(job, schema_hash is not None),
+        "version": manifest.get('version', 1) if manifest['files'] else None,
+        "file_count": len(files),
+        "total_rows": sum(info['rows'] or 0 for info in files.values()),
+        "total_bytes": sum(info['bytes'] or 0 for info in files.values()),
+        "source_bytes": sum(info['source_bytes'] or 0 for info in files.values()),
+        "files": files,
+        "columns": columns,
+        "schema_hash": schema_hash,
+        "error": job.get('error') if job else None,
+        "created_at": created_at or os.stat(dataset_path).st_ctime,
+        "updated_at": time.time(),
+    }
+
+
+class DatasetCatalog:
+    """
+    Catalog of the datasets under the uploads folder in SQLite: status, files, row counts, sizes,
+    column types, times and schema-context hash per dataset. It is kept current by the ingest
+    jobs, so listing datasets never scans the uploads folder, and can be rebuilt from it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS datasets (
+                    dataset_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    version INTEGER,
+                    file_count INTEGER NOT NULL,
+                    total_rows INTEGER NOT NULL,
+                    total_bytes INTEGER NOT NULL,
+                    source_bytes INTEGER NOT NULL,
+                    files TEXT NOT NULL,
+                    columns TEXT NOT NULL,
+                    schema_hash TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS datasets_status ON datasets (status);
+                CREATE INDEX IF NOT EXISTS datasets_created ON datasets (created_at);
+                CREATE INDEX IF NOT EXISTS datasets_updated ON datasets (updated_at);
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def _reset_connections(self):
+        # SQLite connections must not be shared with a forked child.
+        self._local = threading.local()
+
+    def sync(self, dataset_id: str, job: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Re-reads one dataset from disk into the catalog, or drops it if its folder is gone."""
+        row = describe_dataset(dataset_id, job)
+        conn = self._connect()
+        with conn:
+            if row is None:
+                conn.execute('DELETE FROM datasets WHERE dataset_id = ?', (dataset_id,))
+                return None
+            values = {key: json.dumps(value) if key in _JSON_FIELDS else value for key, value in row.items()}
+            columns = ', '.join(values)
+            updates = ', '.join(f"{key} = excluded.{key}" for key in values if key not in ('dataset_id', 'created_at'))
+            conn.execute(f'''
+                INSERT INTO datasets ({columns}) VALUES ({', '.join('?' * len(values))})
+                ON CONFLICT (dataset_id) DO UPDATE SET {updates}
+            ''', list(values.values()))
+        return self.get(dataset_id)
+
+    def rebuild(self, uploads_folder: str) -> int:
+        """Reconstructs the catalog from the dataset folders under `uploads_folder`. Returns the number of datasets."""
+        try:
+            dataset_ids = sorted(d for d in os.listdir(uploads_folder) if os.path.isdir(os.path.join(uploads_folder, d)))
+        except FileNotFoundError:
+            dataset_ids = []
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM datasets')
+        for dataset_id in dataset_ids:
+            self.sync(dataset_id)
+        return len(dataset_ids)
+
+    def ensure_built(self, uploads_folder: str):
+        """Builds the catalog on first start against an existing uploads folder."""
+        if self._connect().execute('SELECT 1 FROM datasets LIMIT 1').fetchone() is None:
+            count = self.rebuild(uploads_folder)
+            if count:
+                print(f"Built the dataset catalog from {count} dataset folder(s).")
+
+    def _row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        item = dict(row)
+        for key in _JSON_FIELDS:
+            item[key] = json.loads(item[key])
+        item['created_at'] = _iso(item['created_at'])
+        item['updated_at'] = _iso(item['updated_at'])
+        return item
+
+    def get(self, dataset_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute('SELECT * FROM datasets WHERE dataset_id = ?', (dataset_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def ids(self) -> list:
+        """Every dataset id, newest name first (the original `/api/datasets` listing)."""
+        return [row[0] for row in self._connect().execute('SELECT dataset_id FROM datasets ORDER BY dataset_id DESC')]
+
+    def search(self, offset: int = 0, limit: int = 50, status: Optional[str] = None, text: Optional[str] = None,
+               column: Optional[str] = None, created_after: Optional[str] = None, created_before: Optional[str] = None,
+               sort: str = 'dataset_id', descending: bool = True) -> Dict[str, Any]:
+        """
+        One page of catalog entries matching the filters: `text` is a substring of the dataset id,
+        `column` a column the dataset must have, `created_*` ISO 8601 times. Raises ValueError on a bad sort or time.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_COLUMNS)}")
+        clauses, params = [], []
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if text:
+            clauses.append("dataset_id LIKE ? ESCAPE '\\'")
+            params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if column:
+            clauses.append('EXISTS (SELECT 1 FROM json_each(datasets.columns) WHERE key = ?)')
+            params.append(column)
+        if created_after:
+            clauses.append('created_at >= ?')
+            params.append(_epoch(created_after))
+        if created_before:
+            clauses.append('created_at < ?')
+            params.append(_epoch(created_before))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+        conn = self._connect()
+        total = conn.execute(f'SELECT COUNT(*) FROM datasets {where}', params).fetchone()[0]
+        order = f"{sort} {'DESC' if descending else 'ASC'}, dataset_id {'DESC' if descending else 'ASC'}"
+        rows = conn.execute(f'SELECT * FROM datasets {where} ORDER BY {order} LIMIT ? OFFSET ?',
+                            params + [limit, offset]).fetchall()
+        next_offset = offset + len(rows)
+        return {
+            "items": [self._row(row) for row in rows],
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "next_cursor": str(next_offset) if next_offset < total else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        rows = self._connect().execute('SELECT status, COUNT(*) FROM datasets GROUP BY status').fetchall()
+        return {"datasets": sum(count for _, count in rows), "by_status": {status: count for status, count in rows}}
+
+
+dataset_catalog = DatasetCatalog(Config.CATALOG_PATH)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dataset_catalog._reset_connections)
@@ -0,0 +1,238 @@
+import json
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Callable
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+
+from ..config import Config
+
+_PIE_HINTS = ('share', 'percentage', 'percent', 'proportion', 'breakdown', 'composition', 'split', 'pie')
+_SCATTER_HINTS = ('correlation', 'correlate', 'relationship', 'versus', 'vs', 'scatter')
+_DATETIME_NAME_HINTS = ('time', 'date', '_at', '_ts', 'day', 'month', 'week', 'year')
+PIE_MAX_SLICES = 8
+MAX_CATEGORIES = 200
+MAX_SERIES = 20
+
+
+def _is_temporal(name: str, series: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if series.dtype != object or not any(hint in name.lower() for hint in _DATETIME_NAME_HINTS):
+        return False
+    sample = series.dropna().head(100)
+    if sample.empty or not sample.map(lambda v: isinstance(v, str)).all():
+        return False
+    return bool(pd.to_datetime(sample, errors='coerce', format='ISO8601').notna().all())
+
+
+def _column_roles(df: pd.DataFrame) -> Dict[str, list]:
+    roles = {"temporal": [], "numeric": [], "categorical": []}
+    for col in df.columns:
+        series = df[col]
+        if _is_temporal(col, series):
+            roles["temporal"].append(col)
+        elif pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            roles["numeric"].append(col)
+        else:
+            roles["categorical"].append(col)
+    return roles
+
+
+def column_signature(table_data: list) -> tuple:
+    """Column names and dtype kinds of a result table, used to key compiled chart functions."""
+    df = pd.DataFrame(table_data)
+    return tuple((str(col), df[col].dtype.kind) for col in df.columns)
+
+
+def plan_chart(table_data: list, query: str) -> Optional[Dict[str, Any]]:
+    """
+    Picks a chart for a result table from its column types and cardinality:
+    a line over time, a pie for a small share-of-total breakdown, grouped bars for
+    categories, a scatter for two measures, or a bar of the measures of a single row.
+    Returns None when the table has a shape the planner does not handle.
+    """
+    df = pd.DataFrame(table_data)
+    if df.empty:
+        return None
+    roles = _column_roles(df)
+    numeric, temporal, categorical = roles["numeric"], roles["temporal"], roles["categorical"]
+    words = set(query.lower().replace('?', ' ').split())
+    if not numeric:
+        return None
+
+    if temporal:
+        if not categorical:
+            return {"kind": "line", "x": temporal[0], "y": numeric, "series": None}
+        if len(categorical) == 1 and len(numeric) == 1 and df[categorical[0]].nunique() <= MAX_SERIES:
+            return {"kind": "line", "x": temporal[0], "y": numeric, "series": categorical[0]}
+        return None
+
+    if categorical:
+        x = categorical[0]
+        if len(categorical) > 2 or df[x].nunique() > MAX_CATEGORIES:
+            return None
+        if len(categorical) == 2:
+            if len(numeric) != 1 or df[categorical[1]].nunique() > MAX_SERIES:
+                return None
+            return {"kind": "bar", "x": x, "y": numeric, "series": categorical[1]}
+        if (len(numeric) == 1 and len(df) <= PIE_MAX_SLICES and words & set(_PIE_HINTS)
+                and (df[numeric[0]].dropna() >= 0).all()):
+            return {"kind": "pie", "x": x, "y": numeric, "series": None}
+        return {"kind": "bar", "x": x, "y": numeric, "series": None}
+
+    if len(df) == 1:
+        return {"kind": "bar", "x": None, "y": numeric, "series": None}
+    if len(numeric) >= 2:
+        x = numeric[0]
+        if not words & set(_SCATTER_HINTS) and df[x].is_unique and df[x].is_monotonic_increasing:
+            return {"kind": "line", "x": x, "y": numeric[1:], "series": None}
+        return {"kind": "scatter", "x": x, "y": numeric[1:], "series": None}
+    return {"kind": "bar", "x": None, "y": numeric, "series": None}
+
+
+def _trace(kind: str, x, y, name: str):
+    if kind == "line":
+        return go.Scatter(x=x, y=y, mode="lines+markers", name=name)
+    if kind == "scatter":
+        return go.Scatter(x=x, y=y, mode="markers", name=name)
+    return go.Bar(x=x, y=y, name=name)
+
+
+def build_figure(table_data: list, plan: Dict[str, Any], title: str) -> go.Figure:
+    """Builds the Plotly figure described by a chart plan."""
+    df = pd.DataFrame(table_data)
+    kind, x, ys, series_col = plan["kind"], plan["x"], plan["y"], plan["series"]
+    fig = go.Figure()
+
+    if kind == "pie":
+        fig.add_trace(go.Pie(labels=df[x], values=df[ys[0]]))
+    elif x is None and len(df) == 1:
+        fig.add_trace(go.Bar(x=ys, y=[df[col].iloc[0] for col in ys]))
+    elif x is None:
+        fig.add_trace(_trace(kind, df.index, df[ys[0]], ys[0]))
+    else:
+        if kind == "line":
+            df = df.sort_values(x)
+        if series_col is not None:
+            for value, group in df.groupby(series_col, sort=True, observed=True):
+                fig.add_trace(_trace(kind, group[x], group[ys[0]], str(value)))
+        else:
+            for col in ys:
+                fig.add_trace(_trace(kind, df[x], df[col], col))
+        if kind == "bar" and (len(ys) > 1 or series_col is not None):
+            fig.update_layout(barmode="group")
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=x if kind != "pie" else None,
+        yaxis_title=ys[0] if kind != "pie" and len(ys) == 1 and series_col is None else None,
+        showlegend=kind == "pie" or len(fig.data) > 1,
+    )
+    return fig
+
+
+def chart_title(query: str) -> str:
+    title = query.strip().rstrip('?.!')
+    return title[:1].upper() + title[1:] if title else "Analysis result"
+
+
+# Plotly.js typed-array dtypes, smallest first.
+_TYPED_INT_DTYPES = (('i1', np.int8), ('u1', np.uint8), ('i2', np.int16), ('u2', np.uint16), ('i4', np.int32), ('u4', np.uint32))
+COMPACT_MIN_ARRAY_LENGTH = 16
+
+
+def _typed_array(values: np.ndarray) -> Optional[Dict[str, Any]]:
+    """Encodes a numeric array as a Plotly.js typed array (`{dtype, bdata[, shape]}`), or None if it is not numeric."""
+    if values.dtype.kind == 'b':
+        values, dtype = values.astype(np.uint8), 'u1'
+    elif values.dtype.kind in 'iu':
+        dtype = None
+        if values.size:
+            low, high = values.min(), values.max()
+            for name, np_type in _TYPED_INT_DTYPES:
+                info = np.iinfo(np_type)
+                if info.min <= low and high <= info.max:
+                    values, dtype = values.astype(np_type), name
+                    break
+        if dtype is None:
+            values, dtype = values.astype(np.float64), 'f8'
+    elif values.dtype.kind == 'f':
+        dtype = 'f4' if values.dtype.itemsize <= 4 else 'f8'
+    else:
+        return None
+    data = np.ascontiguousarray(values, dtype=f"<{dtype}")
+    encoded = {"dtype": dtype, "bdata": base64.b64encode(data.tobytes()).decode('ascii')}
+    if values.ndim > 1:
+        encoded["shape"] = ','.join(str(n) for n in values.shape)
+    return encoded
+
+
+def _compact(value):
+    if isinstance(value, (pd.Series, pd.Index)):
+        value = value.to_numpy()
+    if isinstance(value, np.ndarray):
+        if value.size >= COMPACT_MIN_ARRAY_LENGTH:
+            encoded = _typed_array(value)
+            if encoded is not None:
+                return encoded
+        return value
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) >= COMPACT_MIN_ARRAY_LENGTH and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+            return _compact(np.asarray(value))
+        return [_compact(item) for item in value]
+    return value
+
+
+def compact_figure(fig: go.Figure) -> Dict[str, Any]:
+    """
+    Plotly figure spec for clients that render with Plotly.js: numeric arrays of
+    COMPACT_MIN_ARRAY_LENGTH or more values are base64 typed arrays and the layout
+    template is left to the client's default.
+    """
+    spec = fig.to_plotly_json()
+    spec['layout'].pop('template', None)
+    return json.loads(json.dumps(_compact(spec), cls=PlotlyJSONEncoder))
+
+
+def compile_chart_function(code: str, name: str = "<generated chart>") -> Callable:
+    """Compiles generated chart code in memory and returns its `generate_plot` function."""
+    namespace = {"pd": pd, "go": go}
+    exec(compile(code, name, "exec"), namespace)
+    return namespace["generate_plot"]
+
+
+class CompiledChartCache:
+    """LRU of compiled `generate_plot` functions keyed by the result table's column signature."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, signature: tuple) -> Optional[Callable]:
+        with self._lock:
+            func = self._entries.get(signature)
+            if func is not None:
+                self._entries.move_to_end(signature)
+            return func
+
+    def put(self, signature: tuple, func: Callable):
+        with self._lock:
+            self._entries[signature] = func
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, signature: tuple):
+        with self._lock:
+            self._entries.pop(signature, None)
+
+
+compiled_charts = CompiledChartCache(Config.CHART_FUNCTION_CACHE_SIZE)
@@ -0,0 +1,137 @@
+import os
+import re
+import gzip
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli variants are optional; gzip is always written
+    brotli = None
+
+from ..config import Config
+
+# Stored charts are named after the SHA-256 of their content, so the name doubles as the ETag.
+CONTENT_ADDRESSED_NAME = re.compile(r'^([0-9a-f]{64})\.(html|json)$')
+COMPRESSED_VARIANTS = (('br', '.br'), ('gzip', '.gz'))
+MIN_COMPRESS_BYTES = 1024
+
+
+class ChartStore:
+    """
+    Content-addressed store for rendered charts in the visualizations folder.
+
+    Identical charts map to the same file, written once together with precompressed gzip
+    (and brotli, when installed) variants. Reusing a chart refreshes its modification time;
+    `prune()` removes charts older than the maximum age and then the least recently used
+    ones until the folder fits the byte budget.
+    """
+
+    def __init__(self, folder: str, max_bytes: int, max_age_seconds: int, prune_interval: float = 60.0):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.prune_interval = prune_interval
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        self.writes = 0
+        self.dedup_hits = 0
+        self.pruned_files = 0
+
+    def save(self, content: str, extension: str) -> str:
+        """Stores `content` and returns its file name."""
+        data = content.encode('utf-8')
+        filename = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+        path = os.path.join(self.folder, filename)
+        if os.path.exists(path):
+            os.utime(path)
+            self.dedup_hits += 1
+        else:
+            os.makedirs(self.folder, exist_ok=True)
+            self._write(path, data)
+            if len(data) >= MIN_COMPRESS_BYTES:
+                self._write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    self._write(path + '.br', brotli.compress(data, mode=brotli.MODE_TEXT))
+            self.writes += 1
+        self._maybe_prune()
+        return filename
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def variant_for(self, filename: str, accept_encoding: str) -> Optional[tuple]:
+        """The best precompressed variant of a stored chart the client accepts, as `(encoding, filename)`."""
+        accepted = {part.split(';')[0].strip() for part in (accept_encoding or '').split(',')}
+        for encoding, suffix in COMPRESSED_VARIANTS:
+            if encoding in accepted and os.path.exists(os.path.join(self.folder, filename + suffix)):
+                return encoding, filename + suffix
+        return None
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_prune < self.prune_interval:
+                return
+            self._last_prune = now
+        self.prune()
+
+    def prune(self) -> int:
+        """Applies the age and size limits. Returns the number of charts removed."""
+        charts = {}
+        try:
+            names = os.listdir(self.folder)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            chart = name
+            for _, suffix in COMPRESSED_VARIANTS:
+                chart = chart.removesuffix(suffix)
+            if not chart.endswith(('.html', '.json')):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                continue
+            entry = charts.setdefault(chart, {'files': [], 'bytes': 0, 'mtime': 0.0})
+            entry['files'].append(name)
+            entry['bytes'] += stat.st_size
+            if name == chart:
+                entry['mtime'] = stat.st_mtime
+
+        oldest_allowed = time.time() - self.max_age_seconds
+        total = sum(entry['bytes'] for entry in charts.values())
+        removed = 0
+        for chart, entry in sorted(charts.items(), key=lambda item: item[1]['mtime']):
+            if entry['mtime'] >= oldest_allowed and total <= self.max_bytes:
+                break
+            for name in entry['files']:
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+            total -= entry['bytes']
+            removed += 1
+        self.pruned_files += removed
+        if removed:
+            print(f"Pruned {removed} stored charts from '{self.folder}' ({total} bytes remain).")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "writes": self.writes,
+            "dedup_hits": self.dedup_hits,
+            "pruned": self.pruned_files,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age_seconds,
+            "brotli": brotli is not None,
+        }
+
+
+chart_store = ChartStore(Config.VISUALIZATIONS_FOLDER, Config.CHART_STORE_MAX_BYTES, Config.CHART_STORE_MAX_AGE_SECONDS)
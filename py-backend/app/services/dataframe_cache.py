@@ -0,0 +1,142 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any
+
+import pandas as pd
+
+from ..config import Config
+from .ingest_service import COLUMNAR_DIR, COLUMN_MAP_FILENAME, load_dataset
+from .instrumentation import metrics, stage, record_cache
+
+def dataset_fingerprint(dataset_id: str) -> str:
+    """Fingerprint of a dataset's files on disk, built from their names, sizes and modification times."""
+    dataset_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id)
+    columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+    if os.path.isdir(columnar_path):
+        paths = [os.path.join(columnar_path, name) for name in os.listdir(columnar_path)]
+    else:
+        paths = [os.path.join(dataset_path, name) for name in os.listdir(dataset_path)
+                 if name.endswith('.ndjson') or name == COLUMN_MAP_FILENAME]
+
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _dataset_nbytes(dataset: Dict[str, Any]) -> int:
+    # The per-file frames are slices of the combined frame and share its memory.
+    return int(dataset['combined'].memory_usage(deep=True).sum()
+               + sum(df.memory_usage(deep=True).sum() for df in dataset['rollups'].values()))
+
+
+class DataFrameCache:
+    """
+    Process-wide LRU cache of loaded, column-mapped datasets (the combined frame, the
+    per-file frames sliced from it and the rollups), bounded by a byte budget. Entries are
+    keyed by dataset_id and revalidated against the dataset fingerprint on every lookup.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, dataset_id: str) -> Dict[str, Any]:
+        """
+        Returns `{"combined", "frames", "rollups", "layout"}` with every DataFrame as a copy the
+        caller may modify. With pandas copy-on-write (enabled by the app factory) these are cheap
+        shallow copies, since any write through them copies the affected data first. Without it
+        they are deep copies, so one query can never mutate what the next one sees.
+        """
+        fingerprint = dataset_fingerprint(dataset_id)
+        dataset = self._lookup(dataset_id, fingerprint)
+        if dataset is None:
+            with self._lock:
+                load_lock = self._load_locks.setdefault(dataset_id, threading.Lock())
+            with load_lock:
+                dataset = self._lookup(dataset_id, fingerprint, count=False)
+                if dataset is None:
+                    with stage("dataset.read") as span:
+                        dataset = load_dataset(os.path.join(Config.UPLOADS_FOLDER, dataset_id))
+                        span['rows'] = len(dataset['combined'])
+                    self._store(dataset_id, fingerprint, dataset)
+        deep = not pd.options.mode.copy_on_write
+        return {
+            "combined": dataset['combined'].copy(deep=deep),
+            "frames": {name: df.copy(deep=deep) for name, df in dataset['frames'].items()},
+            "rollups": {name: df.copy(deep=deep) for name, df in dataset['rollups'].items()},
+            "layout": dataset['layout'],
+        }
+
+    def _lookup(self, dataset_id: str, fingerprint: str, count: bool = True):
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is not None and entry['fingerprint'] == fingerprint:
+                self._entries.move_to_end(dataset_id)
+                if count:
+                    self.hits += 1
+                    record_cache('dataframe', True)
+                return entry['dataset']
+            if count:
+                self.misses += 1
+                record_cache('dataframe', False)
+            return None
+
+    def _store(self, dataset_id: str, fingerprint: str, dataset: Dict[str, Any]):
+        nbytes = _dataset_nbytes(dataset)
+        with self._lock:
+            self._remove(dataset_id)
+            if nbytes > self.max_bytes:
+                return
+            self._entries[dataset_id] = {'fingerprint': fingerprint, 'dataset': dataset, 'nbytes': nbytes}
+            self._total_bytes += nbytes
+            while self._total_bytes > self.max_bytes:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                self.evictions += 1
+
+    def _remove(self, dataset_id: str):
+        entry = self._entries.pop(dataset_id, None)
+        if entry is not None:
+            self._total_bytes -= entry['nbytes']
+
+    def _reset_locks(self):
+        # Locks held by other threads at fork time would never be released in the child.
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def fingerprints(self) -> Dict[str, str]:
+        """`{dataset_id: fingerprint}` of the datasets currently loaded in this process."""
+        with self._lock:
+            return {dataset_id: entry['fingerprint'] for dataset_id, entry in self._entries.items()}
+
+    def invalidate(self, dataset_id: str):
+        with self._lock:
+            self._remove(dataset_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+dataframe_cache = DataFrameCache(Config.DATAFRAME_CACHE_MAX_BYTES)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dataframe_cache._reset_locks)
+metrics.gauge('dataframe_cache_bytes', "Bytes of DataFrames held by this process's dataset cache.",
+              lambda: dataframe_cache.stats()['bytes'])
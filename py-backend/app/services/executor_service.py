@@ -0,0 +1,486 @@
+import os
+import re
+import sys
+import signal
+import inspect
+import time
+import threading
+import queue
+import multiprocessing as mp
+from multiprocessing import reduction
+from multiprocessing.connection import Connection
+from typing import Dict, Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from ..config import Config
+from .dataframe_cache import dataframe_cache
+from .stage_limits import cpu_stage
+from .instrumentation import stage, tracing, replay_spans
+from .result_service import table_to_frame, prepare_result, serialize_table
+from .sql_engine import open_sql_dataset, select_engine
+
+
+def _keyword_arguments(func, available: Dict[str, Any]) -> Dict[str, Any]:
+    """The subset of `available` that `func` declares as parameters (all of it if it takes **kwargs)."""
+    parameters = inspect.signature(func).parameters
+    if any(p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values()):
+        return available
+    return {name: value for name, value in available.items() if name in parameters}
+
+
+def _result_rows(result) -> int:
+    table = result.get('table') if isinstance(result, dict) else None
+    try:
+        return len(table) if table is not None else 0
+    except TypeError:
+        return 0
+
+
+def run_analysis_code(dataset_id: str, code: str, engine: str = 'pandas', previous_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs the `analyze_data` function defined by `code` against the dataset. Under the pandas
+    engine it receives the dict of per-file DataFrames, plus the combined frame as `combined`
+    and the hourly and daily rollups as `rollups` if its signature asks for them; under the
+    DuckDB engine it receives a `SQLDataset`. Under both, a function that asks for `previous`
+    gets the session's last result table read from `previous_path`, or None.
+    """
+    local_namespace = {"pd": pd, "re": re}
+
+    try:
+        with stage("code.dataset_load", engine=engine) as span:
+            if engine == 'duckdb':
+                data, extra = open_sql_dataset(dataset_id), {}
+            else:
+                dataset = dataframe_cache.get(dataset_id)
+                data, extra = dataset['frames'], {"combined": dataset['combined'], "rollups": dataset['rollups']}
+                span['rows'] = len(dataset['combined'])
+    except Exception as e:
+        return {"error": f"Failed to load dataset: {e}"}
+
+    try:
+        with stage("code.run", engine=engine) as span:
+            exec(code, local_namespace)
+            analyze_data_func = local_namespace['analyze_data']
+            keyword_arguments = _keyword_arguments(analyze_data_func, dict(extra, previous=None))
+            if 'previous' in keyword_arguments and previous_path:
+                keyword_arguments['previous'] = pd.read_parquet(previous_path)
+            result = analyze_data_func(data, **keyword_arguments)
+            span['rows'] = _result_rows(result)
+            return result
+    except MemoryError:
+        raise
+    except Exception as e:
+        print(f"--- Code Execution Error ---\nCode:\n{code}\nError: {e}")
+        return {"error": f"Execution failed: {e}"}
+    finally:
+        if engine == 'duckdb':
+            data.close()
+
+
+def _encode_table(table) -> Optional[pa.Buffer]:
+    """Encodes a result table as an Arrow IPC stream, or returns None if it has no tabular shape."""
+    df = table_to_frame(table)
+    if df is None:
+        return None
+    try:
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return None
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, arrow_table.schema) as writer:
+        writer.write_table(arrow_table)
+    return sink.getvalue()
+
+
+def _decode_table(data: bytes) -> pd.DataFrame:
+    return pa.ipc.open_stream(pa.py_buffer(data)).read_all().to_pandas()
+
+
+def _limit_memory(limit_bytes: int):
+    """Caps the address space of the current process at its present size plus `limit_bytes`."""
+    if not limit_bytes:
+        return
+    import resource
+    with open('/proc/self/statm') as f:
+        current = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    resource.setrlimit(resource.RLIMIT_AS, (current + limit_bytes, resource.RLIM_INFINITY))
+
+
+def _worker_main(conn, memory_limit_bytes: int):
+    _limit_memory(memory_limit_bytes)
+    while True:
+        try:
+            dataset_id, code, engine, previous_path = conn.recv()
+        except EOFError:
+            return
+        # Spans measured here travel back with the result and are recorded by the web process.
+        with tracing() as trace:
+            try:
+                result = run_analysis_code(dataset_id, code, engine, previous_path)
+            except MemoryError:
+                conn.send(("oom", None, []))
+                os._exit(1)
+
+            try:
+                with stage("code.encode"):
+                    result = prepare_result(result)
+                    table_buffer = _encode_table(result.get('table')) if isinstance(result, dict) else None
+                spans = trace.as_dict()['spans']
+                if table_buffer is None:
+                    conn.send(("ok", result, spans))
+                else:
+                    conn.send(("ok_table", {k: v for k, v in result.items() if k != 'table'}, spans))
+                    conn.send_bytes(memoryview(table_buffer))
+            except MemoryError:
+                conn.send(("oom", None, []))
+                os._exit(1)
+            except Exception as e:
+                conn.send(("ok", {"error": f"Execution result could not be returned: {e}"}, []))
+
+
+# Exit codes the zygote keeps for workers nobody has asked about yet.
+ZYGOTE_MAX_EXIT_CODES = 1024
+
+
+def _zygote_main(conn, copy_on_write: bool):
+    """
+    Serves the executor pool from a freshly spawned process that runs no threads of its own (the
+    native Arrow and jemalloc pools re-create themselves in a forked child): loads datasets into
+    its DataFrame cache and forks workers from itself on request, so they share its frames
+    copy-on-write. Workers are its children, so it reaps them and reports their exit codes.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the web process decides when the pool stops
+    pd.set_option('mode.copy_on_write', copy_on_write)
+    children, exit_codes = set(), {}
+
+    def reap():
+        while children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            children.discard(pid)
+            exit_codes[pid] = os.waitstatus_to_exitcode(status)
+            if len(exit_codes) > ZYGOTE_MAX_EXIT_CODES:
+                exit_codes.pop(next(iter(exit_codes)))
+
+    while True:
+        try:
+            ready = conn.poll(1.0)
+            reap()
+            if not ready:
+                continue
+            command, *args = conn.recv()
+        except EOFError:
+            return
+        try:
+            if command == 'load':
+                dataframe_cache.get(args[0])
+                reply = dataframe_cache.fingerprints()
+            elif command == 'fork':
+                fd = reduction.recv_handle(conn)
+                pid = os.fork()
+                if pid == 0:
+                    code = 1
+                    try:
+                        conn.close()
+                        _worker_main(Connection(fd), args[0])
+                        code = 0
+                    finally:
+                        sys.stdout.flush()
+                        sys.stderr.flush()
+                        os._exit(code)
+                os.close(fd)
+                children.add(pid)
+                reply = (pid, dataframe_cache.fingerprints())
+            elif command == 'kill':
+                # Only unreaped children are signalled, so a recycled pid is never hit.
+                reap()
+                if args[0] in children:
+                    os.kill(args[0], signal.SIGKILL)
+                reply = None
+            elif command == 'exitcode':
+                pid, deadline = args[0], time.monotonic() + args[1]
+                reap()
+                while pid in children and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                    reap()
+                reply = exit_codes.pop(pid, None)
+            else:
+                reply = ValueError(f"Unknown zygote command '{command}'.")
+        except Exception as e:
+            reply = RuntimeError(f"Zygote command '{command}' failed: {e}")
+        conn.send(reply)
+
+
+class _Zygote:
+    """Handle on the zygote process, started on first use and restarted if it dies. Requests are serialized."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        # Spawned rather than forked, so the zygote starts single-threaded whatever runs here.
+        ctx = mp.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(target=_zygote_main, args=(child_conn, pd.options.mode.copy_on_write),
+                                    name="executor-zygote", daemon=True)
+        self._process.start()
+        child_conn.close()
+
+    def _stop(self):
+        if self._process is None:
+            return
+        self._conn.close()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._process = self._conn = None
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process is not None else None
+
+    def request(self, *message, handle: Optional[int] = None):
+        """Sends a command, with a file descriptor to hand over if `handle` is given, and returns the reply."""
+        with self._lock:
+            for attempt in range(2):
+                if self._process is None or not self._process.is_alive():
+                    if self._process is not None:
+                        print(f"Executor zygote exited (exit code {self._process.exitcode}); restarting it.")
+                        self._stop()
+                    self._start()
+                try:
+                    self._conn.send(message)
+                    if handle is not None:
+                        reduction.send_handle(self._conn, handle, self._process.pid)
+                    reply = self._conn.recv()
+                    break
+                except (EOFError, OSError):
+                    if attempt:
+                        raise
+                    self._process.join(1)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    def stop(self):
+        with self._lock:
+            self._stop()
+
+
+class _Worker:
+    def __init__(self, zygote: _Zygote, memory_limit_bytes: int):
+        self._zygote = zygote
+        self.conn, child_conn = mp.Pipe()
+        try:
+            # `inherited`: datasets the worker got from the zygote, shared copy-on-write.
+            self.pid, self.inherited = zygote.request('fork', memory_limit_bytes, handle=child_conn.fileno())
+        except BaseException:
+            self.conn.close()
+            raise
+        finally:
+            child_conn.close()
+
+    def is_alive(self) -> bool:
+        """Idle workers never write to their pipe, so a readable pipe means the worker has exited."""
+        try:
+            return not self.conn.poll()
+        except OSError:
+            return False
+
+    def exitcode(self, timeout: float) -> Optional[int]:
+        """The worker's exit code, waiting up to `timeout` seconds for it to exit, or None."""
+        return self._zygote.request('exitcode', self.pid, timeout)
+
+    def kill(self):
+        try:
+            self._zygote.request('kill', self.pid)
+        finally:
+            self.conn.close()
+
+
+class ExecutorPool:
+    """
+    Pool of forked worker processes that execute generated `analyze_data` code.
+
+    Each job gets a wall-clock timeout and each worker an address-space limit. A worker
+    that times out, runs out of memory, dies or breaks its pipe is killed and replaced by a
+    fresh fork, and idle workers that died in the meantime are replaced before reuse.
+    Result tables travel back as Arrow IPC streams.
+
+    Workers are not forked from the web process, whose request, ingest and LLM threads may
+    hold locks at fork time that would stay locked in the child. They are forked by a zygote,
+    a process spawned for the pool that runs no other threads, that loads the hot datasets into its own
+    DataFrame cache, so the workers share those frames copy-on-write instead of each loading them.
+    """
+
+    def __init__(self, size: int, timeout: float, memory_limit_bytes: int):
+        self.size = size
+        self.timeout = timeout
+        self.memory_limit_bytes = memory_limit_bytes
+        self._zygote = _Zygote()
+        self._idle = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._started = False
+
+    def start(self, preload_datasets=()):
+        with self._start_lock:
+            if self._started:
+                return
+            for dataset_id in preload_datasets:
+                if select_engine(dataset_id) != 'pandas':
+                    continue
+                try:
+                    self._zygote.request('load', dataset_id)
+                except Exception as e:
+                    print(f"Preloading dataset '{dataset_id}' failed: {e}")
+            for _ in range(self.size):
+                self._idle.put(self._spawn())
+            self._started = True
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._zygote, self.memory_limit_bytes)
+
+    def share(self, dataset_id: str):
+        """
+        Loads a dataset in the zygote and re-forks the idle workers that were forked before it
+        was loaded, so they all read the same copy-on-write frames instead of each loading its
+        own copy. Busy workers are left alone and load the dataset themselves if they need it.
+        """
+        if not self._started:
+            self.start([dataset_id] + hot_datasets(Config.EXECUTOR_PRELOAD_DATASETS))
+            return
+        fingerprint = self._zygote.request('load', dataset_id).get(dataset_id)
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for worker in idle:
+            if worker.inherited.get(dataset_id) != fingerprint:
+                worker.kill()
+                worker = self._spawn()
+            self._idle.put(worker)
+
+    def _checkout(self) -> _Worker:
+        """An idle worker; one that died while idle (e.g. killed by the kernel's OOM killer) is replaced first."""
+        worker = self._idle.get()
+        if not worker.is_alive():
+            worker.kill()
+            worker = self._spawn()
+        return worker
+
+    def run(self, dataset_id: str, code: str, engine: str = 'pandas', timeout: Optional[float] = None,
+            previous_path: Optional[str] = None) -> Dict[str, Any]:
+        if not self._started:
+            self.start(hot_datasets(Config.EXECUTOR_PRELOAD_DATASETS))
+        timeout = timeout or self.timeout
+
+        # A worker that cannot be replaced goes back dead and is replaced at its next checkout.
+        worker = self._checkout()
+        try:
+            sent_at = time.perf_counter()
+            try:
+                worker.conn.send((dataset_id, code, engine, previous_path))
+                if not worker.conn.poll(timeout):
+                    worker.kill()
+                    worker = self._spawn()
+                    return {"error": f"Execution timed out after {timeout:g} seconds."}
+                status, payload, spans = worker.conn.recv()
+                if status == "ok_table":
+                    payload['table'] = _decode_table(worker.conn.recv_bytes())
+            except (EOFError, OSError):
+                exitcode = worker.exitcode(1)
+                worker.kill()
+                worker = self._spawn()
+                hint = " It was probably killed for using too much memory." if exitcode == -9 else ""
+                return {"error": f"Execution worker crashed (exit code {exitcode}).{hint}"}
+            replay_spans(spans, sent_at)
+
+            if status == "oom":
+                worker.kill()
+                worker = self._spawn()
+                limit_mb = self.memory_limit_bytes // (1024 * 1024)
+                return {"error": f"Execution ran out of memory (limit {limit_mb} MB)."}
+            return payload
+        finally:
+            self._idle.put(worker)
+
+    def shutdown(self):
+        with self._start_lock:
+            while not self._idle.empty():
+                self._idle.get().kill()
+            self._zygote.stop()
+            self._started = False
+
+
+def hot_datasets(limit: int) -> list[str]:
+    """The most recently modified datasets under the uploads folder."""
+    uploads_folder = Config.UPLOADS_FOLDER
+    try:
+        dataset_ids = [d for d in os.listdir(uploads_folder) if os.path.isdir(os.path.join(uploads_folder, d))]
+    except FileNotFoundError:
+        return []
+    dataset_ids.sort(key=lambda d: os.path.getmtime(os.path.join(uploads_folder, d)), reverse=True)
+    return dataset_ids[:limit]
+
+
+def share_dataset(dataset_id: str):
+    """Loads a pandas-engine dataset once for several queries, sharing it with the executor pool's workers."""
+    if select_engine(dataset_id) != 'pandas':
+        return
+    try:
+        if executor_pool is not None:
+            executor_pool.share(dataset_id)
+        else:
+            dataframe_cache.get(dataset_id)
+    except Exception as e:
+        print(f"Sharing dataset '{dataset_id}' with the executor failed: {e}")
+
+
+def execute_analysis(dataset_id: str, code: str, engine: str = 'pandas', previous_path: Optional[str] = None,
+                     keep_frame: bool = False) -> Dict[str, Any]:
+    """
+    Runs generated analysis code in the executor pool, or in-process when the pool is disabled,
+    within the CPU stage limit. With `keep_frame` the result also carries the inline table as a
+    typed DataFrame under `frame`.
+    """
+    with stage("code.execute", engine=engine) as span, cpu_stage.slot() as waited:
+        span['stage_wait_ms'] = round(waited * 1000, 2)
+        if executor_pool is not None:
+            result = executor_pool.run(dataset_id, code, engine, previous_path=previous_path)
+        else:
+            try:
+                result = prepare_result(run_analysis_code(dataset_id, code, engine, previous_path))
+            except MemoryError:
+                return {"error": "Execution ran out of memory."}
+            except Exception as e:
+                return {"error": f"Execution result could not be returned: {e}"}
+        span['rows'] = _result_rows(result)
+    frame = result.get('table') if keep_frame and isinstance(result, dict) else None
+    try:
+        with stage("result.serialize"):
+            result = serialize_table(result)
+    except Exception as e:
+        return {"error": f"Execution result could not be returned: {e}"}
+    if isinstance(frame, pd.DataFrame):
+        result['frame'] = frame
+    return result
+
+
+executor_pool = None
+if Config.EXECUTOR_POOL_ENABLED and hasattr(os, 'fork'):
+    executor_pool = ExecutorPool(
+        size=Config.EXECUTOR_WORKERS,
+        timeout=Config.EXECUTOR_TIMEOUT_SECONDS,
+        memory_limit_bytes=Config.EXECUTOR_MEMORY_LIMIT_MB * 1024 * 1024,
+    )
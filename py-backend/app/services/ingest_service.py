@@ -0,0 +1,626 @@
+import io
+import os
+import re
+import json
+import time
+import shutil
+import zipfile
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Dict, Any, Optional
+
+from ..config import Config
+from .rollup_service import ROLLUP_DIR, build_file_rollups, load_rollups, remove_file_rollups
+
+COLUMNAR_DIR = '_columnar'
+MANIFEST_FILENAME = '_manifest.json'
+COLUMN_MAP_FILENAME = '_column_map.json'
+
+_INT_TYPES = [
+    (pa.int8(), -2**7, 2**7 - 1),
+    (pa.int16(), -2**15, 2**15 - 1),
+    (pa.int32(), -2**31, 2**31 - 1),
+]
+_DATETIME_NAME_HINTS = ('time', 'date', '_at', '_ts')
+
+# Columns added to the combined frame; a leading underscore is added if the data already uses the name.
+SOURCE_COLUMN = 'source'
+CONTEXT_COLUMN = 'context'
+_NAME_SEPARATORS = '_-.'
+_GENERIC_NAME_TOKENS = {'sensor', 'sensors', 'data', 'dataset', 'readings', 'reading', 'export', 'log', 'logs', 'file'}
+
+
+class _ColumnStats:
+    """Running statistics for one column, collected while the NDJSON is parsed chunk by chunk."""
+
+    def __init__(self):
+        self.kind = None
+        self.min = None
+        self.max = None
+        self.nulls = 0
+        self.float32_exact = True
+        self.distinct = set()
+        self.too_many_distinct = False
+        self.tz = None
+
+    def update(self, series: pd.Series, kind: str):
+        self.kind = _merge_kinds(self.kind, kind)
+        self.nulls += int(series.isna().sum())
+        values = series.dropna()
+        if values.empty:
+            return
+        if kind in ('int', 'float'):
+            low, high = values.min(), values.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+            if self.float32_exact:
+                numbers = values.to_numpy(np.float64)
+                with np.errstate(over='ignore'):
+                    self.float32_exact = bool(np.array_equal(numbers.astype(np.float32).astype(np.float64), numbers))
+        elif kind == 'datetime':
+            self.tz = self.tz or getattr(series.dt, 'tz', None)
+        elif kind == 'string' and not self.too_many_distinct:
+            self.distinct.update(values.unique())
+            if len(self.distinct) > Config.INGEST_CATEGORY_MAX_UNIQUE:
+                self.too_many_distinct = True
+                self.distinct = set()
+
+
+def _merge_kinds(current: Optional[str], new: str) -> str:
+    if current is None or current == new:
+        return new
+    if {current, new} == {'int', 'float'}:
+        return 'float'
+    return 'string'
+
+
+def _column_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return 'datetime'
+    return 'string'
+
+
+def _looks_like_datetime(name: str, series: pd.Series) -> bool:
+    """Object columns are parsed as timestamps only when the name hints at it and a sample parses cleanly."""
+    if not any(hint in name.lower() for hint in _DATETIME_NAME_HINTS):
+        return False
+    sample = series.dropna().head(100)
+    if sample.empty or not sample.map(lambda v: isinstance(v, str)).all():
+        return False
+    parsed = pd.to_datetime(sample, errors='coerce', format='ISO8601')
+    return bool(parsed.notna().all())
+
+
+def _stringify(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+def _normalize_chunk(df: pd.DataFrame, column_map: Dict[str, str], datetime_columns: set) -> pd.DataFrame:
+    df.columns = [column_map.get(col, col) for col in df.columns]
+    for col in df.columns:
+        series = df[col]
+        if isinstance(series.dtype, pd.StringDtype):
+            series = df[col] = series.astype(object).where(series.notna(), None)
+        if col in datetime_columns or (series.dtype == object and _looks_like_datetime(col, series)):
+            datetime_columns.add(col)
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                df[col] = pd.to_datetime(series, errors='coerce', format='ISO8601')
+        elif series.dtype == object:
+            df[col] = series.map(_stringify)
+    return df
+
+
+def _target_type(stats: _ColumnStats, total_rows: int) -> pa.DataType:
+    if stats.kind == 'bool':
+        return pa.bool_()
+    if stats.kind == 'datetime':
+        return pa.timestamp('ns', tz=str(stats.tz) if stats.tz is not None else None)
+    if stats.kind == 'int' and stats.min is not None:
+        # Arrow integers are nullable, so ints with missing values stay ints.
+        for arrow_type, low, high in _INT_TYPES:
+            if low <= stats.min and stats.max <= high:
+                return arrow_type
+        return pa.int64()
+    if stats.kind in ('int', 'float'):
+        # float32 only when every value survives the round trip: IDs above 2**24 and epoch seconds do not.
+        if Config.INGEST_DOWNCAST_FLOATS and stats.float32_exact:
+            return pa.float32()
+        return pa.float64()
+    if (stats.kind == 'string' and not stats.too_many_distinct
+            and len(stats.distinct) <= max(1, total_rows * Config.INGEST_CATEGORY_MAX_RATIO)):
+        return pa.dictionary(pa.int32(), pa.string())
+    return pa.string()
+
+
+def _arrow_column(df: pd.DataFrame, name: str, arrow_type: pa.DataType) -> pa.Array:
+    if name not in df.columns:
+        return pa.nulls(len(df), type=arrow_type)
+    array = pa.Array.from_pandas(df[name])
+    if array.type == arrow_type:
+        return array
+    if pa.types.is_dictionary(arrow_type) and not pa.types.is_string(array.type):
+        array = array.cast(pa.string())
+    return array.cast(arrow_type)
+
+
+def convert_ndjson(source, dest_path: str, column_map: Dict[str, str], chunk_rows: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Converts one NDJSON file (a path or a readable binary stream) into a typed Parquet file.
+
+    The input is parsed in chunks with nullable dtypes, so integer columns with missing
+    values stay integers. Each chunk is renamed with the column map and spilled to a
+    temporary Parquet part while per-column statistics are gathered. A second pass then
+    casts every part to the narrowest type that holds every value exactly (small ints,
+    float32 only when all values round-trip, dictionary-encoded strings, parsed
+    timestamps) and writes the final file.
+    """
+    chunk_rows = chunk_rows or Config.INGEST_CHUNK_ROWS
+    started = time.perf_counter()
+    parts_dir = dest_path + '.parts'
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    os.makedirs(parts_dir)
+
+    stats: Dict[str, _ColumnStats] = {}
+    datetime_columns: set = set()
+    part_paths = []
+    total_rows = 0
+    try:
+        reader = pd.read_json(source, lines=True, chunksize=chunk_rows, dtype_backend='numpy_nullable')
+        with reader:
+            for chunk in reader:
+                chunk = _normalize_chunk(chunk, column_map, datetime_columns)
+                for col in chunk.columns:
+                    stats.setdefault(col, _ColumnStats()).update(chunk[col], _column_kind(chunk[col]))
+                part_path = os.path.join(parts_dir, f"part-{len(part_paths):05d}.parquet")
+                pq.write_table(pa.Table.from_pandas(chunk, preserve_index=False), part_path)
+                part_paths.append(part_path)
+                total_rows += len(chunk)
+
+        schema = pa.schema([(name, _target_type(col_stats, total_rows)) for name, col_stats in stats.items()])
+        tmp_path = dest_path + '.tmp'
+        with pq.ParquetWriter(tmp_path, schema, compression='zstd') as writer:
+            for part_path in part_paths:
+                part = pq.read_table(part_path).to_pandas()
+                arrays = [_arrow_column(part, field.name, field.type) for field in schema]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        os.replace(tmp_path, dest_path)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+    return {
+        "rows": total_rows,
+        "bytes": os.path.getsize(dest_path),
+        "dtypes": {field.name: str(field.type) for field in schema},
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def load_column_map(dataset_path: str) -> Dict[str, str]:
+    map_path = os.path.join(dataset_path, COLUMN_MAP_FILENAME)
+    with open(map_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def read_manifest(dataset_path: str) -> Optional[Dict[str, Any]]:
+    manifest_path = os.path.join(dataset_path, COLUMNAR_DIR, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(dataset_path: str, manifest: Dict[str, Any]):
+    columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+    os.makedirs(columnar_path, exist_ok=True)
+    tmp_path = os.path.join(columnar_path, MANIFEST_FILENAME + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(columnar_path, MANIFEST_FILENAME))
+
+
+class ArchiveLimitError(ValueError):
+    """Raised when an uploaded archive exceeds the configured member count or decompressed size."""
+
+
+class _LimitedReader(io.RawIOBase):
+    """Counts the bytes read from a zip member and refuses to read past `limit`."""
+
+    def __init__(self, raw, limit: int):
+        self._raw = raw
+        self._limit = limit
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._raw.read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.bytes_read += size
+        if self.bytes_read > self._limit:
+            raise ArchiveLimitError(f"Archive member decompresses to more than {self._limit} bytes.")
+        return size
+
+
+def _is_data_member(info: zipfile.ZipInfo) -> bool:
+    name = info.filename
+    if info.is_dir() or name.startswith('__MACOSX/') or name.split('/')[-1].startswith('._'):
+        return False
+    return name.endswith('.ndjson')
+
+
+def inspect_archive(zip_path: str) -> list[str]:
+    """
+    Validates a dataset zip from its central directory and returns the names of its NDJSON members.
+    Raises ArchiveLimitError for archives with too many members or too much decompressed data.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        infos = zip_ref.infolist()
+        if len(infos) > Config.INGEST_MAX_MEMBERS:
+            raise ArchiveLimitError(f"Archive has {len(infos)} members; the limit is {Config.INGEST_MAX_MEMBERS}.")
+        members = [info for info in infos if _is_data_member(info)]
+        total_size = sum(info.file_size for info in members)
+        if total_size > Config.INGEST_MAX_DECOMPRESSED_BYTES:
+            raise ArchiveLimitError(f"Archive decompresses to {total_size} bytes; "
+                                    f"the limit is {Config.INGEST_MAX_DECOMPRESSED_BYTES}.")
+    if not members:
+        raise ArchiveLimitError("Archive contains no .ndjson files.")
+    return [info.filename for info in members]
+
+
+def open_archive_member(zip_ref: zipfile.ZipFile, member: str) -> _LimitedReader:
+    """Opens a zip member as a byte-counting stream capped at its declared size and the global limit."""
+    declared = zip_ref.getinfo(member).file_size
+    return _LimitedReader(zip_ref.open(member), min(declared, Config.INGEST_MAX_DECOMPRESSED_BYTES))
+
+
+def _parquet_name(filename: str, manifest: Dict[str, Any], version: int) -> str:
+    """
+    Name of the columnar file for `filename` in dataset version `version`. A file that replaces
+    one from an earlier version gets a new name, so readers of the earlier version keep their file.
+    """
+    stem = os.path.splitext(filename)[0]
+    existing = manifest["files"].get(filename)
+    if existing is not None and existing.get("version", 1) == version:
+        return existing["path"]
+    taken = {info["path"] for info in manifest["files"].values()}
+    taken |= {entry["path"] for entry in manifest.get("retired", [])}
+    name = f"{stem}.parquet"
+    return name if name not in taken else f"{stem}.v{version}.parquet"
+
+
+def _record_file(manifest: Dict[str, Any], filename: str, info: Dict[str, Any], version: int):
+    """Adds a converted file to the manifest, retiring the entry it replaces."""
+    info["version"] = version
+    previous = manifest["files"].get(filename)
+    if previous is not None and previous["path"] != info["path"]:
+        manifest.setdefault("retired", []).append({
+            "path": previous["path"], "rollups": previous.get("rollups"), "retired_at": time.time()})
+    manifest["files"][filename] = info
+
+
+def prune_retired_files(dataset_path: str, manifest: Dict[str, Any], max_age_seconds: Optional[float] = None):
+    """Deletes the columnar and rollup files of replaced versions once they are older than the retention period."""
+    if max_age_seconds is None:
+        max_age_seconds = Config.DATASET_VERSION_RETENTION_SECONDS
+    kept = []
+    for entry in manifest.get("retired", []):
+        if time.time() - entry["retired_at"] < max_age_seconds:
+            kept.append(entry)
+            continue
+        try:
+            os.remove(os.path.join(dataset_path, COLUMNAR_DIR, entry["path"]))
+        except FileNotFoundError:
+            pass
+        remove_file_rollups(os.path.join(dataset_path, ROLLUP_DIR), entry.get("rollups"))
+    manifest["retired"] = kept
+
+
+def _start_version(dataset_path: str, version: int) -> Dict[str, Any]:
+    manifest = read_manifest(dataset_path) or {"format": "parquet", "files": {}}
+    prune_retired_files(dataset_path, manifest)
+    manifest["version"] = max(manifest.get("version", 1), version)
+    return manifest
+
+
+def _add_rollups(info: Dict[str, Any], dest_path: str, rollup_path: str):
+    try:
+        info["rollups"] = build_file_rollups(dest_path, rollup_path)
+    except Exception as e:
+        print(f"Rollup computation failed for {os.path.basename(dest_path)}: {e}")
+        info["rollups"] = None
+
+
+def _convert_member(zip_path: str, member: str, dest_path: str, column_map: Dict[str, str],
+                    rollup_path: str) -> Dict[str, Any]:
+    """Process-pool entry point: streams one zip member through the chunked NDJSON converter and rolls it up."""
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        reader = open_archive_member(zip_ref, member)
+        with io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8') as text_stream:
+            info = convert_ndjson(text_stream, dest_path, column_map)
+    info["source_bytes"] = reader.bytes_read
+    info["throughput_mb_s"] = round(reader.bytes_read / (1024 * 1024) / max(info["seconds"], 1e-6), 2)
+    _add_rollups(info, dest_path, rollup_path)
+    return info
+
+
+def convert_archive(zip_path: str, dataset_path: str, members: list[str], on_progress=None,
+                    version: int = 1) -> Dict[str, Any]:
+    """
+    Converts the NDJSON members of a dataset zip straight to the columnar format, without extracting them,
+    and precomputes their rollups. Members are converted in parallel worker processes;
+    `on_progress(done, total)` is called after each one. Members are added to the dataset as
+    `version`; members with the name of an existing file replace it.
+    """
+    try:
+        column_map = load_column_map(dataset_path)
+    except FileNotFoundError:
+        column_map = {}
+
+    columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+    rollup_path = os.path.join(dataset_path, ROLLUP_DIR)
+    os.makedirs(columnar_path, exist_ok=True)
+    manifest = _start_version(dataset_path, version)
+
+    max_workers = max(1, min(Config.INGEST_WORKERS, len(members)))
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp.get_context('spawn')) as executor:
+        futures = {}
+        for member in members:
+            filename = os.path.basename(member)
+            parquet_name = _parquet_name(filename, manifest, version)
+            dest_path = os.path.join(columnar_path, parquet_name)
+            futures[executor.submit(_convert_member, zip_path, member, dest_path, column_map, rollup_path)] = (filename, parquet_name)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            filename, parquet_name = futures[future]
+            try:
+                info = future.result()
+                info["path"] = parquet_name
+                _record_file(manifest, filename, info, version)
+                print(f"Converted '{filename}': {info['rows']} rows, {info['source_bytes']} bytes "
+                      f"in {info['seconds']}s ({info['throughput_mb_s']} MB/s)")
+            except ArchiveLimitError:
+                raise
+            except Exception as e:
+                print(f"Columnar conversion failed for {filename}: {e}")
+            if on_progress:
+                on_progress(done, len(members))
+
+    _combine_manifest(manifest)
+    write_manifest(dataset_path, manifest)
+    return manifest
+
+
+def convert_dataset(dataset_path: str, file_paths: list[str], on_progress=None, version: int = 1) -> Dict[str, Any]:
+    """
+    Converts the NDJSON files of a dataset to the columnar format, precomputes their rollups and
+    records them in the manifest as `version`. The column map written by the schema step is applied
+    during conversion. `on_progress(done, total)` is called after each file.
+    """
+    try:
+        column_map = load_column_map(dataset_path)
+    except FileNotFoundError:
+        column_map = {}
+
+    columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+    rollup_path = os.path.join(dataset_path, ROLLUP_DIR)
+    os.makedirs(columnar_path, exist_ok=True)
+    manifest = _start_version(dataset_path, version)
+
+    for done, file_path in enumerate(file_paths, start=1):
+        filename = os.path.basename(file_path)
+        parquet_name = _parquet_name(filename, manifest, version)
+        try:
+            dest_path = os.path.join(columnar_path, parquet_name)
+            info = convert_ndjson(file_path, dest_path, column_map)
+            info["path"] = parquet_name
+            info["source_bytes"] = os.path.getsize(file_path)
+            _add_rollups(info, dest_path, rollup_path)
+            _record_file(manifest, filename, info, version)
+        except Exception as e:
+            print(f"Columnar conversion failed for {file_path}: {e}")
+        if on_progress:
+            on_progress(done, len(file_paths))
+
+    _combine_manifest(manifest)
+    write_manifest(dataset_path, manifest)
+    return manifest
+
+
+def source_contexts(filenames) -> Dict[str, str]:
+    """
+    A readable context per dataset file, parsed from the filenames: the part that differs
+    between files, without generic words, e.g. 'sensor_data_Room 1.ndjson' -> 'Room 1'.
+    """
+    stems = {f: os.path.splitext(os.path.basename(f))[0] for f in filenames}
+    prefix = suffix = ''
+    if len(stems) > 1:
+        prefix = os.path.commonprefix(list(stems.values()))
+        prefix = prefix[:max(prefix.rfind(sep) for sep in _NAME_SEPARATORS) + 1]
+        suffix = os.path.commonprefix([stem[::-1] for stem in stems.values()])[::-1]
+        cuts = [suffix.find(sep) for sep in _NAME_SEPARATORS if sep in suffix]
+        suffix = suffix[min(cuts):] if cuts else ''
+
+    contexts = {}
+    for filename, stem in stems.items():
+        core = stem[len(prefix):len(stem) - len(suffix)] or stem
+        parts = [part.strip() for part in re.split(r'[_\-.]+', core) if part.strip()]
+        while len(parts) > 1 and parts[0].lower() in _GENERIC_NAME_TOKENS:
+            parts.pop(0)
+        contexts[filename] = ' '.join(parts) or stem
+    if len(set(contexts.values())) < len(contexts):
+        return stems
+    return contexts
+
+
+def _added_column_names(columns) -> tuple:
+    columns = set(columns)
+    source_column, context_column = SOURCE_COLUMN, CONTEXT_COLUMN
+    while source_column in columns:
+        source_column = '_' + source_column
+    while context_column in columns:
+        context_column = '_' + context_column
+    return source_column, context_column
+
+
+def describe_combined(filenames, columns) -> Dict[str, Any]:
+    """Layout of a dataset's combined frame: the names of the added columns and each file's context."""
+    source_column, context_column = _added_column_names(columns)
+    return {
+        "source_column": source_column,
+        "context_column": context_column,
+        "contexts": source_contexts(filenames),
+    }
+
+
+def _combine_manifest(manifest: Dict[str, Any]):
+    columns = {col for info in manifest["files"].values() for col in info.get("dtypes", {})}
+    manifest["combined"] = describe_combined(list(manifest["files"]), columns)
+
+
+def _unify_tables(tables: list) -> list:
+    """Casts per-file tables to one schema: missing columns become nulls, numeric types widen, conflicts become strings."""
+    names = []
+    for table in tables:
+        names += [name for name in table.column_names if name not in names]
+    fields = []
+    for name in names:
+        types = [table.schema.field(name).type for table in tables if name in table.column_names]
+        try:
+            unified = pa.unify_schemas([pa.schema([(name, t)]) for t in types], promote_options='permissive')
+            fields.append(unified.field(name))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            fields.append(pa.field(name, pa.string()))
+    schema = pa.schema(fields)
+
+    unified_tables = []
+    for table in tables:
+        arrays = []
+        for field in schema:
+            if field.name not in table.column_names:
+                arrays.append(pa.nulls(table.num_rows, field.type))
+                continue
+            column = table.column(field.name)
+            if column.type != field.type:
+                if pa.types.is_dictionary(column.type) and not pa.types.is_dictionary(field.type):
+                    column = column.cast(column.type.value_type)
+                column = column.cast(field.type)
+            arrays.append(column)
+        unified_tables.append(pa.Table.from_arrays(arrays, schema=schema))
+    return unified_tables
+
+
+def _constant_dictionary(values: list, index: int, length: int) -> pa.DictionaryArray:
+    return pa.DictionaryArray.from_arrays(pa.array(np.full(length, index, dtype=np.int32)), pa.array(values, pa.string()))
+
+
+def load_dataset(dataset_path: str) -> Dict[str, Any]:
+    """
+    Loads a dataset as `{"combined": DataFrame, "frames": {filename: DataFrame}, "rollups": {...}}`.
+
+    The columnar files are the source partitions of one combined frame: they are read
+    (their zstd pages are decompressed into memory, so they are not memory-mapped),
+    unified to one schema and concatenated in Arrow, with a categorical source column
+    (the filename) and a context column parsed from it. The per-file frames
+    are row slices of the combined frame restricted to the file's own columns, so with
+    copy-on-write the data is held once. Datasets that were never converted fall back to
+    parsing NDJSON. The rollups are the small precomputed hourly and daily frames.
+    """
+    manifest = read_manifest(dataset_path)
+    if manifest is not None:
+        columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+        filenames = list(manifest["files"])
+        tables = [pq.read_table(os.path.join(columnar_path, manifest["files"][f]["path"]))
+                  for f in filenames]
+        own_columns = [table.column_names for table in tables]
+        layout = manifest.get("combined") or describe_combined(filenames, {c for cols in own_columns for c in cols})
+        contexts = [layout["contexts"].get(f, f) for f in filenames]
+        tables = [
+            table.append_column(layout["source_column"], _constant_dictionary(filenames, i, table.num_rows))
+                 .append_column(layout["context_column"], _constant_dictionary(contexts, i, table.num_rows))
+            for i, table in enumerate(_unify_tables(tables))
+        ]
+        if tables:
+            combined = pa.concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
+        else:
+            combined = pd.DataFrame(columns=[layout["source_column"], layout["context_column"]])
+        row_counts = [table.num_rows for table in tables]
+    else:
+        column_map = load_column_map(dataset_path)
+        frames = {}
+        for filename in sorted(os.listdir(dataset_path)):
+            if filename.endswith('.ndjson'):
+                df = pd.read_json(os.path.join(dataset_path, filename), lines=True)
+                df.columns = [column_map.get(col, col) for col in df.columns]
+                frames[filename] = df
+        filenames = list(frames)
+        own_columns = [list(df.columns) for df in frames.values()]
+        layout = describe_combined(filenames, {c for cols in own_columns for c in cols})
+        combined = pd.concat(
+            [df.assign(**{layout["source_column"]: f, layout["context_column"]: layout["contexts"][f]})
+             for f, df in frames.items()], ignore_index=True) if frames else pd.DataFrame()
+        for column in (layout["source_column"], layout["context_column"]):
+            if column in combined:
+                combined[column] = combined[column].astype('category')
+        row_counts = [len(df) for df in frames.values()]
+
+    frames, start = {}, 0
+    for filename, columns, rows in zip(filenames, own_columns, row_counts):
+        frames[filename] = combined.iloc[start:start + rows][columns]
+        start += rows
+    return {"combined": combined, "frames": frames, "layout": layout,
+            "rollups": load_rollups(dataset_path, manifest, layout)}
+
+
+def migrate_uploads(uploads_folder: str) -> Dict[str, int]:
+    """One-shot conversion of every dataset under `uploads_folder` that has no columnar manifest yet."""
+    converted = 0
+    skipped = 0
+    for dataset_id in sorted(os.listdir(uploads_folder)):
+        dataset_path = os.path.join(uploads_folder, dataset_id)
+        if not os.path.isdir(dataset_path) or read_manifest(dataset_path) is not None:
+            skipped += 1
+            continue
+        file_paths = [os.path.join(dataset_path, f) for f in sorted(os.listdir(dataset_path)) if f.endswith('.ndjson')]
+        if not file_paths:
+            skipped += 1
+            continue
+        print(f"Converting dataset '{dataset_id}' ({len(file_paths)} files)...")
+        convert_dataset(dataset_path, file_paths)
+        converted += 1
+    return {"converted": converted, "skipped": skipped}
+
+
+def backfill_rollups(uploads_folder: str) -> list:
+    """Builds rollups for the columnar files that have none yet. Returns the ids of the datasets that changed."""
+    updated = []
+    for dataset_id in sorted(os.listdir(uploads_folder)):
+        dataset_path = os.path.join(uploads_folder, dataset_id)
+        manifest = read_manifest(dataset_path) if os.path.isdir(dataset_path) else None
+        missing = [f for f, info in (manifest or {"files": {}})["files"].items() if "rollups" not in info]
+        if not missing:
+            continue
+        print(f"Building rollups for dataset '{dataset_id}' ({len(missing)} files)...")
+        for filename in missing:
+            info = manifest["files"][filename]
+            _add_rollups(info, os.path.join(dataset_path, COLUMNAR_DIR, info["path"]),
+                         os.path.join(dataset_path, ROLLUP_DIR))
+        write_manifest(dataset_path, manifest)
+        updated.append(dataset_id)
+    return updated
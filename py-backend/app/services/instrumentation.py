@@ -0,0 +1,320 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+METRIC_PREFIX = 'analysis_agent'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+BYTES_BUCKETS = tuple(2 ** power for power in range(20, 34, 2))  # 1 MiB .. 8 GiB
+PROFILE_TOP_FUNCTIONS = 40
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _label_text(label_names: tuple, values: tuple) -> str:
+    if not label_names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                     for name, value in zip(label_names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.label_names, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple, label_names: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def totals(self) -> Dict[tuple, tuple]:
+        """`{label values: (count, sum)}` of every series."""
+        with self._lock:
+            return {key: (series['count'], series['sum']) for key, series in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    labels = _label_text(self.label_names + ('le',), key + (f"{bound:g}",))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.label_names + ('le',), key + ('+Inf',))
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.label_names, key)} {series['sum']:g}")
+                lines.append(f"{self.name}_count{_label_text(self.label_names, key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The process's metrics, rendered in the Prometheus text format. Gauges are read from
+    callbacks at scrape time. Every server process keeps its own registry.
+    """
+
+    def __init__(self):
+        self.stage_seconds = Histogram(f"{METRIC_PREFIX}_stage_duration_seconds",
+                                       "Wall time per pipeline stage.", DURATION_BUCKETS, ('stage',))
+        self.stage_cpu_seconds = Histogram(f"{METRIC_PREFIX}_stage_cpu_seconds",
+                                           "CPU time of the thread or worker process running a stage.",
+                                           DURATION_BUCKETS, ('stage',))
+        self.stage_rss_delta = Histogram(f"{METRIC_PREFIX}_stage_peak_rss_delta_bytes",
+                                         "Growth of the process's peak RSS during a stage.", BYTES_BUCKETS, ('stage',))
+        self.rows = Counter(f"{METRIC_PREFIX}_rows_processed_total", "Rows read or produced per stage.", ('stage',))
+        self.llm_tokens = Counter(f"{METRIC_PREFIX}_llm_tokens_total", "LLM tokens by model and direction.",
+                                  ('model', 'kind'))
+        self.cache_requests = Counter(f"{METRIC_PREFIX}_cache_requests_total", "Cache lookups by cache and outcome.",
+                                      ('cache', 'outcome'))
+        self.requests = Histogram(f"{METRIC_PREFIX}_request_duration_seconds", "Wall time per HTTP request until the response starts.",
+                                  DURATION_BUCKETS, ('endpoint', 'status'))
+        self._gauges = []
+
+    def gauge(self, name: str, help_text: str, callback):
+        """Registers a gauge whose value(s) `callback` returns at scrape time: a number or `{label_value: number}`."""
+        self._gauges.append((f"{METRIC_PREFIX}_{name}", help_text, callback))
+
+    def render(self) -> str:
+        lines = []
+        for metric in (self.stage_seconds, self.stage_cpu_seconds, self.stage_rss_delta, self.rows,
+                       self.llm_tokens, self.cache_requests, self.requests):
+            lines += metric.render()
+        for name, help_text, callback in self._gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Metric {name} could not be read: {e}")
+                continue
+            if isinstance(value, dict):
+                for label_value, number in sorted(value.items()):
+                    lines.append(f'{name}{{name="{label_value}"}} {number:g}')
+            else:
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _reset_locks(self):
+        # A metric lock held by another thread at fork time would never be released in the child.
+        for metric in (self.stage_seconds, self.stage_cpu_seconds, self.stage_rss_delta, self.rows,
+                       self.llm_tokens, self.cache_requests, self.requests):
+            metric._lock = threading.Lock()
+
+
+class Trace:
+    """Timing breakdown of one request: a span per instrumented stage, and optionally a cProfile of its graph nodes."""
+
+    def __init__(self, profile: bool = False):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.profile = profile
+        self._profile_stats = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_profile(self, profiler: cProfile.Profile):
+        with self._lock:
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profiler)
+            else:
+                self._profile_stats.add(profiler)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.get('start_ms', 0))
+        by_stage = {}
+        for span in spans:
+            by_stage[span['stage']] = round(by_stage.get(span['stage'], 0) + span['wall_ms'], 1)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "by_stage": by_stage,
+            "spans": spans,
+        }
+
+    def profile_report(self, limit: int = PROFILE_TOP_FUNCTIONS) -> Optional[str]:
+        """The profiled functions with the highest cumulative time, as pstats text."""
+        with self._lock:
+            if self._profile_stats is None:
+                return None
+            buffer = io.StringIO()
+            self._profile_stats.stream = buffer
+            self._profile_stats.sort_stats('cumulative').print_stats(limit)
+            return buffer.getvalue()
+
+    def dump_profile(self, folder: str) -> Optional[str]:
+        """Writes the collected profile as a .prof file for snakeviz/pstats and returns its path."""
+        with self._lock:
+            if self._profile_stats is None:
+                return None
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(self):x}.prof")
+            self._profile_stats.dump_stats(path)
+            return path
+
+
+_current_trace = contextvars.ContextVar('analysis_trace', default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(profile: bool = False):
+    """Collects the spans of everything run in this context (and threads that copy it) into a new Trace."""
+    trace = Trace(profile=profile)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def record_span(stage: str, wall_seconds: float, cpu_seconds: float, rss_delta_bytes: int = 0,
+                attributes: Optional[Dict[str, Any]] = None, start_seconds: Optional[float] = None):
+    """Observes a finished stage in the histograms and adds it to the current trace."""
+    attributes = attributes or {}
+    metrics.stage_seconds.observe(wall_seconds, stage=stage)
+    metrics.stage_cpu_seconds.observe(cpu_seconds, stage=stage)
+    metrics.stage_rss_delta.observe(max(0, rss_delta_bytes), stage=stage)
+    if attributes.get('rows'):
+        metrics.rows.inc(attributes['rows'], stage=stage)
+    trace = current_trace()
+    if trace is not None:
+        span = {
+            "stage": stage,
+            "wall_ms": round(wall_seconds * 1000, 2),
+            "cpu_ms": round(cpu_seconds * 1000, 2),
+            "peak_rss_delta_bytes": max(0, rss_delta_bytes),
+            **attributes,
+        }
+        if start_seconds is not None:
+            span["start_ms"] = round((start_seconds - trace.started) * 1000, 2)
+        trace.add(span)
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """
+    Measures a block as pipeline stage `name`: wall time, CPU time of the current thread and the
+    growth of the process's peak RSS. Yields the span's attributes, so the block can add e.g. `rows`.
+    """
+    started, cpu_started, rss_started = time.perf_counter(), time.thread_time(), peak_rss_bytes()
+    try:
+        yield attributes
+    finally:
+        record_span(name, time.perf_counter() - started, time.thread_time() - cpu_started,
+                    peak_rss_bytes() - rss_started, attributes, start_seconds=started)
+
+
+def replay_spans(spans: list, started_at: float):
+    """
+    Records spans measured in another process (an executor worker) as if they had been measured
+    here; `started_at` is this process's perf_counter when the other process started its trace.
+    """
+    for span in spans:
+        attributes = {key: value for key, value in span.items()
+                      if key not in ('stage', 'wall_ms', 'cpu_ms', 'peak_rss_delta_bytes', 'start_ms')}
+        attributes['process'] = 'worker'
+        record_span(span['stage'], span['wall_ms'] / 1000, span['cpu_ms'] / 1000, span['peak_rss_delta_bytes'],
+                    attributes, start_seconds=started_at + span.get('start_ms', 0) / 1000)
+
+
+def record_cache(cache: str, hit: bool):
+    outcome = 'hit' if hit else 'miss'
+    metrics.cache_requests.inc(cache=cache, outcome=outcome)
+    trace = current_trace()
+    if trace is not None:
+        trace.add({"stage": f"cache.{cache}", "wall_ms": 0.0, "cpu_ms": 0.0, "peak_rss_delta_bytes": 0,
+                   "outcome": outcome, "start_ms": round((time.perf_counter() - trace.started) * 1000, 2)})
+
+
+def record_tokens(model: str, input_tokens: int, output_tokens: int):
+    metrics.llm_tokens.inc(input_tokens, model=model, kind='input')
+    metrics.llm_tokens.inc(output_tokens, model=model, kind='output')
+
+
+# Newer Pythons allow one active profiler per process, so profiled nodes take turns.
+_profile_lock = threading.Lock()
+
+
+def instrument_node(name: str, func):
+    """Wraps a LangGraph node as stage `node.<name>`; when the request is profiled, the node runs under cProfile."""
+    @wraps(func)
+    def node(state):
+        trace = current_trace()
+        with stage(f"node.{name}"):
+            if trace is None or not trace.profile:
+                return func(state)
+            with _profile_lock:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError as e:  # another profiler is already active
+                    print(f"Profiling node '{name}' skipped: {e}")
+                    return func(state)
+                try:
+                    return func(state)
+                finally:
+                    profiler.disable()
+                    trace.add_profile(profiler)
+    return node
+
+
+metrics = MetricsRegistry()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._reset_locks)
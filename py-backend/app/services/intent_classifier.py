@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+from typing import Dict, Any, Optional, Iterable
+
+from ..config import Config
+
+GENERAL_CONVERSATION = 'GENERAL_CONVERSATION'
+DATA_ANALYSIS_REQUEST = 'DATA_ANALYSIS_REQUEST'
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+TRAIN_PATH = os.path.join(DATA_DIR, 'intent_train.jsonl')
+EVAL_PATH = os.path.join(DATA_DIR, 'intent_eval.jsonl')
+
+_GENERAL_PATTERNS = [re.compile(p) for p in (
+    r"^(hi+|hiya|hello+|hey+|yo|howdy|greetings)( there| again| all| everyone)?$",
+    r"^good (morning|afternoon|evening|night)( to you)?$",
+    r"^(many )?(thanks?|thank you|thx|ty|cheers)( (so|very) much| a lot| again| for (your|the) help)?$",
+    r"^(ok|okay|cool|great|awesome|perfect|nice|sounds good|got it|no worries|never mind)( thanks?| thank you)?$",
+    r"^(bye|goodbye|see (you|ya)( later)?|bye for now)$",
+    r"^who (are|made|built|created|developed) (you|this)",
+    r"^what (can|are) you( able to)? do$",
+)]
+_DATA_KEYWORDS = {
+    'average', 'avg', 'mean', 'median', 'sum', 'total', 'max', 'maximum', 'min', 'minimum', 'highest', 'lowest',
+    'std', 'deviation', 'variance', 'correlation', 'trend', 'plot', 'chart', 'graph', 'histogram', 'distribution',
+    'compare', 'count', 'percentage', 'hourly', 'daily', 'weekly', 'monthly', 'per', 'top', 'rank', 'readings',
+}
+# Verbs that ask for an analysis or a chart, e.g. in follow-ups like "can you plot that".
+_REQUEST_VERBS = {
+    'plot', 'chart', 'graph', 'visualize', 'visualise', 'draw', 'show', 'display', 'compare', 'calculate', 'compute',
+    'count', 'list', 'break', 'group', 'split', 'sort', 'filter', 'rank', 'summarize', 'summarise', 'analyze',
+    'analyse', 'many',
+}
+# Greetings and thanks; next to a request ("thanks! and the max?") the query is mixed and the LLM decides.
+_PLEASANTRIES = {
+    'hi', 'hiya', 'hello', 'hey', 'thanks', 'thank', 'thx', 'ty', 'cheers', 'great', 'ok', 'okay', 'cool',
+    'awesome', 'perfect', 'nice', 'good', 'morning', 'afternoon', 'evening', 'bye', 'goodbye',
+}
+
+
+def tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def column_terms(schema_context: str) -> set:
+    """Column names mentioned (in backticks) in a schema context, plus their snake_case parts."""
+    terms = set()
+    for name in re.findall(r"`([A-Za-z_][A-Za-z0-9_]*)`", schema_context or ''):
+        name = name.lower()
+        terms.add(name)
+        terms.update(part for part in name.split('_') if len(part) > 2)
+    return terms
+
+
+def _features(tokens: list[str], columns: set) -> list[str]:
+    features = list(tokens)
+    features += [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    if len(tokens) <= 3:
+        features.append('__short__')
+    if any(t.isdigit() for t in tokens):
+        features.append('__number__')
+    if columns and any(t in columns for t in tokens):
+        features.append('__column__')
+    return features
+
+
+class NaiveBayesIntentModel:
+    """Multinomial Naive Bayes over word unigrams, bigrams and a few shape features."""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.class_counts = Counter()
+        self.feature_counts = {}
+        self.totals = Counter()
+        self.vocabulary = set()
+
+    def fit(self, examples: Iterable[Dict[str, str]], columns: set = frozenset()):
+        for example in examples:
+            label = example['intent']
+            features = _features(tokenize(example['query']), columns)
+            self.class_counts[label] += 1
+            self.feature_counts.setdefault(label, Counter()).update(features)
+            self.totals[label] += len(features)
+            self.vocabulary.update(features)
+        return self
+
+    def predict_proba(self, features: list[str]) -> Dict[str, float]:
+        n_examples = sum(self.class_counts.values())
+        vocabulary_size = len(self.vocabulary)
+        log_scores = {}
+        for label, count in self.class_counts.items():
+            score = math.log(count / n_examples)
+            denominator = self.totals[label] + self.alpha * vocabulary_size
+            for feature in features:
+                if feature in self.vocabulary:
+                    score += math.log((self.feature_counts[label][feature] + self.alpha) / denominator)
+            log_scores[label] = score
+        top = max(log_scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+def load_examples(path: str) -> list[Dict[str, str]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# Typical sensor column names, so the `__column__` feature is seen during training.
+_TRAINING_COLUMNS = {'co2', 'ppm', 'temperature', 'humidity', 'room', 'energy', 'timestamp'}
+_model = NaiveBayesIntentModel().fit(load_examples(TRAIN_PATH), _TRAINING_COLUMNS)
+
+
+def classify_intent(query: str, columns: set = frozenset(), threshold: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Classifies a query locally. Returns the intent, a confidence and the deciding source
+    ('rules' or 'model'), or an intent of None when the caller should fall back to the LLM:
+    below the confidence threshold, for greetings mixed with a request, and when the model
+    would call a query with an analysis or chart verb small talk.
+    """
+    threshold = Config.INTENT_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    tokens = tokenize(query)
+    text = ' '.join(tokens)
+
+    if not tokens or any(pattern.match(text) for pattern in _GENERAL_PATTERNS):
+        return {"intent": GENERAL_CONVERSATION, "confidence": 1.0, "source": "rules"}
+    keyword_hits = sum(t in _DATA_KEYWORDS for t in tokens)
+    column_hits = sum(t in columns for t in tokens)
+    if keyword_hits and column_hits:
+        return {"intent": DATA_ANALYSIS_REQUEST, "confidence": 1.0, "source": "rules"}
+    requested = keyword_hits or any(t in _REQUEST_VERBS for t in tokens)
+    if requested and any(t in _PLEASANTRIES for t in tokens):
+        return {"intent": None, "confidence": 0.0, "source": "rules"}
+
+    probabilities = _model.predict_proba(_features(tokens, columns))
+    intent, confidence = max(probabilities.items(), key=lambda item: item[1])
+    # A request verb makes small talk unlikely; misrouting a data request costs more than an LLM call.
+    if confidence < threshold or (requested and intent == GENERAL_CONVERSATION):
+        return {"intent": None, "confidence": confidence, "source": "model"}
+    return {"intent": intent, "confidence": confidence, "source": "model"}
+
+
+def evaluate(path: str = EVAL_PATH, columns: set = _TRAINING_COLUMNS, threshold: Optional[float] = None) -> Dict[str, Any]:
+    """Scores the local classifier on a labelled set: accuracy of local decisions and share of LLM calls avoided."""
+    examples = load_examples(path)
+    decided = correct = 0
+    mistakes = []
+    for example in examples:
+        decision = classify_intent(example['query'], columns, threshold)
+        if decision['intent'] is None:
+            continue
+        decided += 1
+        if decision['intent'] == example['intent']:
+            correct += 1
+        else:
+            mistakes.append({**example, "predicted": decision['intent'], "source": decision['source']})
+    return {
+        "examples": len(examples),
+        "decided_locally": decided,
+        "llm_calls_avoided": decided / len(examples) if examples else 0.0,
+        "accuracy": correct / decided if decided else 0.0,
+        "mistakes": mistakes,
+    }
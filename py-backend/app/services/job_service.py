@@ -0,0 +1,268 @@
+import os
+import json
+import uuid
+import queue
+import time
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process job locking
+    fcntl = None
+
+from ..config import Config
+from .ingest_service import inspect_archive, convert_archive, read_manifest, load_column_map
+from .schema_service import (sample_archive, sample_columnar, generate_column_map, generate_schema_context,
+                             save_schema_context, refresh_schema_notes)
+from .query_cache import query_cache
+from .dataframe_cache import dataframe_cache
+from .catalog_service import dataset_catalog
+from .instrumentation import record_span, peak_rss_bytes
+
+JOB_FILENAME = '_job.json'
+JOB_LOCK_FILENAME = '_job.lock'
+
+# Overall progress (percent) reached when each stage starts.
+STAGE_PROGRESS = {
+    'queued': 0,
+    'validating': 5,
+    'sampling': 20,
+    'column_map': 30,
+    'converting': 40,
+    'schema_context': 90,
+    'done': 100,
+}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _job_path(dataset_id: str) -> str:
+    return os.path.join(Config.UPLOADS_FOLDER, dataset_id, JOB_FILENAME)
+
+
+def read_job(dataset_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(_job_path(dataset_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _write_job(job: Dict[str, Any]):
+    path = _job_path(job['dataset_id'])
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _dataset_columns(manifest: Optional[Dict[str, Any]]) -> set:
+    return {col for info in (manifest or {"files": {}})['files'].values() for col in info.get('dtypes', {})}
+
+
+def job_active(dataset_id: str) -> bool:
+    job = read_job(dataset_id)
+    return job is not None and job['status'] in ('queued', 'running')
+
+
+class IngestJobQueue:
+    """
+    In-process queue of dataset ingest jobs, run by a fixed number of daemon threads.
+
+    Job state lives in `_job.json` inside the dataset folder, so jobs that were queued or
+    running when the server stopped are picked up again by `resume_unfinished()`. A file
+    lock per dataset keeps two processes from running the same job.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._queue = queue.Queue()
+        self._state_lock = threading.Lock()
+        self._threads = []
+        self._start_lock = threading.Lock()
+        # job_id -> (stage, wall, thread CPU and peak RSS when the stage started), for the stage metrics.
+        self._stage_clocks = {}
+
+    def _ensure_workers(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, dataset_id: str, archive_path: str, kind: str = 'ingest', version: int = 1) -> Dict[str, Any]:
+        """Queues an ingest of a new dataset, or with kind='append' the addition of files as dataset `version`."""
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'dataset_id': dataset_id,
+            'kind': kind,
+            'version': version,
+            'archive': os.path.basename(archive_path),
+            'status': 'queued',
+            'stage': 'queued',
+            'progress': 0,
+            'error': None,
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        _write_job(job)
+        dataset_catalog.sync(dataset_id, job)
+        self._ensure_workers()
+        self._queue.put(dataset_id)
+        return job
+
+    def resume_unfinished(self):
+        uploads_folder = Config.UPLOADS_FOLDER
+        try:
+            dataset_ids = sorted(os.listdir(uploads_folder))
+        except FileNotFoundError:
+            return
+        for dataset_id in dataset_ids:
+            job = read_job(dataset_id) if os.path.isdir(os.path.join(uploads_folder, dataset_id)) else None
+            if job and job['status'] in ('queued', 'running'):
+                print(f"Resuming ingest job {job['job_id']} for dataset '{dataset_id}'.")
+                self._ensure_workers()
+                self._queue.put(dataset_id)
+
+    def _worker_loop(self):
+        while True:
+            dataset_id = self._queue.get()
+            try:
+                self._run_locked(dataset_id)
+            except Exception as e:
+                print(f"Ingest job for dataset '{dataset_id}' crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _run_locked(self, dataset_id: str):
+        lock_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id, JOB_LOCK_FILENAME)
+        with open(lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another process is already running this job
+            self._run(dataset_id)
+
+    def _update(self, job: Dict[str, Any], **fields):
+        with self._state_lock:
+            if 'stage' in fields and 'progress' not in fields:
+                fields['progress'] = STAGE_PROGRESS[fields['stage']]
+            job.update(fields, updated_at=_now())
+            _write_job(job)
+        if 'stage' in fields or fields.get('status') == 'failed':
+            self._clock_stage(job, fields.get('stage'))
+        if 'status' in fields:
+            dataset_catalog.sync(job['dataset_id'], job)
+
+    def _clock_stage(self, job: Dict[str, Any], stage: Optional[str]):
+        """Records the stage the job just finished as `ingest.<stage>` and starts timing `stage`."""
+        now = (time.perf_counter(), time.thread_time(), peak_rss_bytes())
+        previous = self._stage_clocks.pop(job['job_id'], None)
+        if previous is not None and previous[0] != 'queued':
+            name, started, cpu_started, rss_started = previous
+            attributes = {}
+            if name == 'converting':
+                attributes['rows'] = sum(info.get('rows') or 0 for info in (job.get('files') or {}).values())
+            record_span(f"ingest.{name}", now[0] - started, now[1] - cpu_started, now[2] - rss_started, attributes)
+        if stage is not None and stage != 'done':
+            self._stage_clocks[job['job_id']] = (stage,) + now
+
+    def _run(self, dataset_id: str):
+        job = read_job(dataset_id)
+        if job is None or job['status'] not in ('queued', 'running'):
+            return
+        dataset_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id)
+        archive_path = os.path.join(dataset_path, job['archive'])
+
+        try:
+            self._update(job, status='running', stage='validating', error=None)
+            if not os.path.exists(archive_path):
+                raise RuntimeError("The uploaded archive is missing; please upload the dataset again.")
+            members = inspect_archive(archive_path)
+            if job.get('kind') == 'append':
+                self._append(job, dataset_id, dataset_path, archive_path, members)
+            else:
+                self._ingest(job, dataset_id, dataset_path, archive_path, members)
+
+            query_cache.invalidate_dataset(dataset_id)
+            dataframe_cache.invalidate(dataset_id)
+            self._update(job, status='done', stage='done')
+            os.remove(archive_path)
+        except Exception as e:
+            print(f"Ingest job for dataset '{dataset_id}' failed: {e}")
+            self._update(job, status='failed', error=str(e))
+
+    def _convert(self, job: Dict[str, Any], dataset_path: str, archive_path: str, members: list) -> Dict[str, Any]:
+        span = STAGE_PROGRESS['schema_context'] - STAGE_PROGRESS['converting']
+        manifest = convert_archive(archive_path, dataset_path, members, version=job.get('version', 1),
+                                   on_progress=lambda done, total: self._update(
+                                       job, progress=STAGE_PROGRESS['converting'] + span * done // total))
+        if not manifest['files']:
+            raise RuntimeError("None of the dataset files could be converted.")
+        converted = [os.path.basename(member) for member in members]
+        files = {
+            name: {key: info[key] for key in ('rows', 'source_bytes', 'seconds', 'throughput_mb_s')}
+            for name, info in manifest['files'].items()
+            if name in converted and info.get('version', 1) == job.get('version', 1)
+        }
+        self._update(job, stage='schema_context', files=files)
+        return manifest
+
+    def _ingest(self, job: Dict[str, Any], dataset_id: str, dataset_path: str, archive_path: str, members: list):
+        self._update(job, stage='sampling')
+        raw_schemas = sample_archive(archive_path, members)
+        if not raw_schemas:
+            raise RuntimeError("No readable .ndjson files were found in the archive.")
+
+        self._update(job, stage='column_map')
+        column_map = generate_column_map(raw_schemas, dataset_id)
+        if column_map is None:
+            raise RuntimeError("Column map generation failed.")
+
+        # The schema context only needs the samples and the column map, so the LLM call
+        # runs while the files are converted. It is saved only once the converted files exist.
+        self._update(job, stage='converting')
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            context_future = executor.submit(generate_schema_context, raw_schemas, column_map, dataset_id, save=False)
+            self._convert(job, dataset_path, archive_path, members)
+            schema_context = context_future.result()
+            if schema_context is None:
+                raise RuntimeError("Schema context generation failed.")
+        save_schema_context(dataset_id, schema_context)
+        refresh_schema_notes(dataset_id)
+
+    def _append(self, job: Dict[str, Any], dataset_id: str, dataset_path: str, archive_path: str, members: list):
+        """
+        Adds the archive's files to an existing dataset. Only columns missing from the column map
+        go to the LLM, and the schema context is only rewritten by the LLM when the set of
+        columns changes; otherwise its deterministic notes are refreshed.
+        """
+        self._update(job, stage='sampling')
+        raw_schemas = sample_archive(archive_path, members)
+        if not raw_schemas:
+            raise RuntimeError("No readable .ndjson files were found in the archive.")
+
+        self._update(job, stage='column_map')
+        known_map = load_column_map(dataset_path)
+        if generate_column_map(raw_schemas, dataset_id, known_map=known_map) is None:
+            raise RuntimeError("Column map generation failed.")
+
+        columns_before = _dataset_columns(read_manifest(dataset_path))
+        self._update(job, stage='converting')
+        manifest = self._convert(job, dataset_path, archive_path, members)
+        if _dataset_columns(manifest) != columns_before:
+            print(f"Columns of dataset '{dataset_id}' changed; regenerating its schema context.")
+            if generate_schema_context(sample_columnar(dataset_path), {}, dataset_id) is None:
+                raise RuntimeError("Schema context generation failed.")
+        refresh_schema_notes(dataset_id)
+
+
+ingest_queue = IngestJobQueue(Config.INGEST_MAX_CONCURRENT_JOBS)
@@ -0,0 +1,269 @@
+import os
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableLambda
+
+from ..config import Config
+from .stage_limits import llm_stage
+from .instrumentation import stage, record_tokens
+
+# Rough prompt size before the API reports the real usage; corrected once the call returns.
+CHARS_PER_TOKEN = 4
+LATENCY_SAMPLES = 1024
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket of `per_minute` units. `acquire` blocks until the amount is
+    available; `adjust` settles the difference between an estimate and the actual amount, which
+    may leave the bucket in debt. A limit of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float) -> float:
+        """Takes `amount` from the bucket, waiting for it if necessary. Returns the seconds waited."""
+        if not self.capacity:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                delay = (amount - self.available) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def adjust(self, amount: float):
+        if not self.capacity:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.available -= amount
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.errors = 0
+        self.throttled_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1) if latencies else None
+
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "errors": self.errors,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": round(latencies[-1] * 1000, 1) if latencies else None,
+            },
+        }
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class LLMGateway:
+    """
+    Single entry point for chat model calls. Clients are created once per model and settings and
+    share one pooled HTTP connection pool. Every call passes the LLM stage limit and per-model
+    request and token buckets (RPM/TPM), is retried with exponential backoff on rate limits,
+    connection errors and server errors, and is recorded in per-model latency and token metrics.
+    Identical non-streaming prompts already in flight are coalesced into one API call.
+    """
+
+    def __init__(self, base_url: Optional[str], requests_per_minute: int, tokens_per_minute: int,
+                 max_concurrency: int, max_retries: int, timeout: float, expected_output_tokens: int):
+        self.base_url = base_url
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.expected_output_tokens = expected_output_tokens
+        self._max_concurrency = max_concurrency
+        self._reset()
+
+    def _reset(self):
+        # Pooled connections and locks must not be shared with a forked child.
+        self._http_client = None
+        self._clients = {}
+        self._buckets = {}
+        self._stats = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _client(self, model: str, temperature: float, streaming: bool) -> ChatOpenAI:
+        key = (model, temperature, streaming)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if self._http_client is None:
+                    self._http_client = httpx.Client(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=self._max_concurrency,
+                                            max_keepalive_connections=self._max_concurrency),
+                    )
+                client = ChatOpenAI(model=model, temperature=temperature, streaming=streaming,
+                                    base_url=self.base_url, http_client=self._http_client,
+                                    max_retries=0, timeout=self.timeout)
+                self._clients[key] = client
+            return client
+
+    def _model_state(self, model: str):
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = (TokenBucket(self.requests_per_minute), TokenBucket(self.tokens_per_minute))
+                self._stats[model] = _ModelStats()
+            return self._buckets[model], self._stats[model]
+
+    def chat(self, model: str, temperature: float = 0, streaming: bool = False) -> RunnableLambda:
+        """A runnable that takes a prompt value or messages, like `ChatOpenAI`, and calls the model through the gateway."""
+        def call(prompt, config):
+            return self.invoke(model, prompt, temperature=temperature, streaming=streaming, config=config)
+        return RunnableLambda(call, name=f"llm_gateway:{model}")
+
+    def invoke(self, model: str, prompt, temperature: float = 0, streaming: bool = False, config=None):
+        text = prompt.to_string() if hasattr(prompt, 'to_string') else str(prompt)
+        key = hashlib.sha256(f"{model}\0{temperature}\0{text}".encode('utf-8')).hexdigest()
+        (requests, tokens), stats = self._model_state(model)
+
+        # Streaming calls deliver tokens to their own callbacks, so they are never shared.
+        leader = streaming
+        if not streaming:
+            with self._lock:
+                in_flight = self._in_flight.get(key)
+                if in_flight is None:
+                    in_flight = self._in_flight[key] = _InFlight()
+                    leader = True
+        if not leader:
+            with stage("llm.wait", model=model, coalesced=True):
+                in_flight.done.wait()
+            with self._lock:
+                stats.coalesced += 1
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result
+
+        try:
+            with stage("llm.call", model=model) as span:
+                result = self._call(model, prompt, len(text) // CHARS_PER_TOKEN, temperature, streaming, config,
+                                    requests, tokens, stats, span)
+            if not streaming:
+                in_flight.result = result
+            return result
+        except Exception as e:
+            if not streaming:
+                in_flight.error = e
+            raise
+        finally:
+            if not streaming:
+                with self._lock:
+                    self._in_flight.pop(key, None)
+                in_flight.done.set()
+
+    def _call(self, model, prompt, prompt_tokens, temperature, streaming, config, requests, tokens, stats, span):
+        client = self._client(model, temperature, streaming)
+        estimate = prompt_tokens + self.expected_output_tokens
+        for attempt in range(self.max_retries + 1):
+            throttled = requests.acquire(1) + tokens.acquire(estimate)
+            started = time.perf_counter()
+            try:
+                with llm_stage.slot():
+                    response = client.invoke(prompt, config=config)
+            except _RETRYABLE_ERRORS as e:
+                with self._lock:
+                    stats.throttled_seconds += throttled
+                    if attempt == self.max_retries:
+                        stats.errors += 1
+                    else:
+                        stats.retries += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(Config.LLM_RETRY_MAX_SECONDS, Config.LLM_RETRY_BASE_SECONDS * 2 ** attempt)
+                print(f"LLM call to {model} failed ({type(e).__name__}); retrying in {delay:.1f}s")
+                time.sleep(delay * random.uniform(1.0, 1.25))
+                continue
+            except Exception:
+                with self._lock:
+                    stats.errors += 1
+                raise
+
+            usage = getattr(response, 'usage_metadata', None) or {}
+            input_tokens = usage.get('input_tokens', prompt_tokens)
+            output_tokens = usage.get('output_tokens', len(str(response.content)) // CHARS_PER_TOKEN)
+            tokens.adjust(input_tokens + output_tokens - estimate)
+            record_tokens(model, input_tokens, output_tokens)
+            span.update(input_tokens=input_tokens, output_tokens=output_tokens, attempts=attempt + 1)
+            with self._lock:
+                stats.calls += 1
+                stats.throttled_seconds += throttled
+                stats.input_tokens += input_tokens
+                stats.output_tokens += output_tokens
+                stats.latencies.append(time.perf_counter() - started)
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {model: stats.as_dict() for model, stats in self._stats.items()}
+
+
+llm_gateway = LLMGateway(
+    base_url=Config.OPENAI_BASE_URL,
+    requests_per_minute=Config.LLM_REQUESTS_PER_MINUTE,
+    tokens_per_minute=Config.LLM_TOKENS_PER_MINUTE,
+    max_concurrency=Config.LLM_MAX_CONCURRENCY,
+    max_retries=Config.LLM_MAX_RETRIES,
+    timeout=Config.LLM_TIMEOUT_SECONDS,
+    expected_output_tokens=Config.LLM_EXPECTED_OUTPUT_TOKENS,
+)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=llm_gateway._reset)
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from ..config import Config
+from .instrumentation import record_cache
+
+_SYNONYMS = {
+    'avg': 'average', 'mean': 'average',
+    'per': 'by', 'each': 'by',
+    'max': 'maximum', 'highest': 'maximum', 'largest': 'maximum', 'biggest': 'maximum', 'peak': 'maximum',
+    'min': 'minimum', 'lowest': 'minimum', 'smallest': 'minimum',
+    'total': 'sum',
+    'number': 'count',
+    'temp': 'temperature',
+    'std': 'stddev', 'deviation': 'stddev',
+    'greater': 'above', 'more': 'above', 'exceeding': 'above',
+    'less': 'below', 'fewer': 'below',
+}
+_STOPWORDS = {
+    'a', 'an', 'the', 'of', 'in', 'on', 'for', 'to', 'is', 'are', 'was', 'were', 'be', 'what', 'which',
+    'show', 'me', 'please', 'give', 'tell', 'find', 'get', 'list', 'can', 'you', 'i', 'want', 'see',
+    'value', 'values', 'data', 'and', 'with', 'all', 'across', 'standard', 'many', 'much', 'calculate',
+    'compute', 'display', 'did', 'does', 'do', 'had', 'has', 'have', 'than',
+}
+# Bumped whenever normalize_query changes, so keys written by an older version are dropped.
+_KEY_VERSION = 2
+
+
+def normalize_query(query: str) -> tuple:
+    """
+    Lower-cases and tokenizes a query, canonicalizes synonyms and plurals and drops stopwords.
+    Word order is kept, since "co2 above humidity" and "humidity above co2" ask different things.
+    """
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', query.lower()):
+        token = _SYNONYMS.get(token, token)
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(_SYNONYMS.get(token, token))
+    return tuple(tokens)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    """
+    Persistent two-level cache in SQLite.
+
+    Level one maps (schema-context hash, normalized query) to generated code. Queries only share
+    code when every content word matches in order after normalization: rephrasings that differ in
+    stopwords, synonyms or plurals hit, while swapped operands, a different comparison or another
+    column miss, because serving code written for another question is worse than a miss. Level two maps
+    (dataset fingerprint, code hash) to the analysis result and visualization. Entries expire
+    after a TTL and are evicted least-recently-used once the size limits are exceeded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.code_hits = 0
+        self.code_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS code_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    schema_hash TEXT NOT NULL,
+                    norm_query TEXT NOT NULL,
+                    dataset_id TEXT,
+                    code TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    UNIQUE (schema_hash, norm_query)
+                );
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    fingerprint TEXT NOT NULL,
+                    code_hash TEXT NOT NULL,
+                    dataset_id TEXT,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (fingerprint, code_hash)
+                );
+                CREATE INDEX IF NOT EXISTS code_cache_dataset ON code_cache (dataset_id);
+                CREATE INDEX IF NOT EXISTS result_cache_dataset ON result_cache (dataset_id);
+            ''')
+            if conn.execute('PRAGMA user_version').fetchone()[0] < _KEY_VERSION:
+                with conn:
+                    conn.execute('DELETE FROM code_cache')
+                    conn.execute(f'PRAGMA user_version = {_KEY_VERSION}')
+            self._local.conn = conn
+        return conn
+
+    def get_code(self, schema_context: str, query: str) -> Optional[str]:
+        if not Config.QUERY_CACHE_ENABLED:
+            return None
+        conn = self._connect()
+        schema_hash = _sha256(schema_context)
+        row = conn.execute('SELECT id, code FROM code_cache WHERE schema_hash = ? AND norm_query = ? AND created_at >= ?',
+                           (schema_hash, ' '.join(normalize_query(query)),
+                            time.time() - Config.QUERY_CACHE_TTL_SECONDS)).fetchone()
+        if row is None:
+            self.code_misses += 1
+            record_cache('query_code', False)
+            return None
+        with conn:
+            conn.execute('UPDATE code_cache SET accessed_at = ? WHERE id = ?', (time.time(), row[0]))
+        self.code_hits += 1
+        record_cache('query_code', True)
+        return row[1]
+
+    def put_code(self, schema_context: str, query: str, code: str, dataset_id: str):
+        if not Config.QUERY_CACHE_ENABLED:
+            return
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('''
+                INSERT INTO code_cache (schema_hash, norm_query, dataset_id, code, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (schema_hash, norm_query) DO UPDATE SET
+                    code = excluded.code, created_at = excluded.created_at, accessed_at = excluded.accessed_at
+            ''', (_sha256(schema_context), ' '.join(normalize_query(query)), dataset_id, code, now, now))
+            conn.execute('DELETE FROM code_cache WHERE created_at < ?', (now - Config.QUERY_CACHE_TTL_SECONDS,))
+            conn.execute('''
+                DELETE FROM code_cache WHERE id IN (
+                    SELECT id FROM code_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (Config.QUERY_CACHE_MAX_CODE_ENTRIES,))
+
+    def get_result(self, fingerprint: str, code: str) -> Optional[Dict[str, Any]]:
+        if not Config.QUERY_CACHE_ENABLED:
+            return None
+        conn = self._connect()
+        code_hash = _sha256(code)
+        row = conn.execute('SELECT payload FROM result_cache WHERE fingerprint = ? AND code_hash = ? AND created_at >= ?',
+                           (fingerprint, code_hash, time.time() - Config.QUERY_CACHE_TTL_SECONDS)).fetchone()
+        if row is None:
+            self.result_misses += 1
+            record_cache('query_result', False)
+            return None
+        with conn:
+            conn.execute('UPDATE result_cache SET accessed_at = ? WHERE fingerprint = ? AND code_hash = ?',
+                         (time.time(), fingerprint, code_hash))
+        self.result_hits += 1
+        record_cache('query_result', True)
+        return json.loads(row[0])
+
+    def put_result(self, fingerprint: str, code: str, dataset_id: str, analysis_result: Dict[str, Any],
+                   visualization_output: Dict[str, Any]):
+        if not Config.QUERY_CACHE_ENABLED:
+            return
+        payload = json.dumps({
+            "analysis_result": analysis_result,
+            "visualization_output": visualization_output,
+        }, default=str)
+        if len(payload) > Config.QUERY_CACHE_MAX_RESULT_BYTES:
+            return
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO result_cache (fingerprint, code_hash, dataset_id, payload, size, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (fingerprint, _sha256(code), dataset_id, payload, len(payload), now, now))
+            conn.execute('DELETE FROM result_cache WHERE created_at < ?', (now - Config.QUERY_CACHE_TTL_SECONDS,))
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM result_cache').fetchone()[0]
+            while total > Config.QUERY_CACHE_MAX_RESULT_BYTES:
+                oldest = conn.execute('SELECT fingerprint, code_hash, size FROM result_cache '
+                                      'ORDER BY accessed_at LIMIT 1').fetchone()
+                conn.execute('DELETE FROM result_cache WHERE fingerprint = ? AND code_hash = ?', oldest[:2])
+                total -= oldest[2]
+
+    def invalidate_dataset(self, dataset_id: str):
+        """Drops every cached code and result entry recorded for a dataset."""
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM code_cache WHERE dataset_id = ?', (dataset_id,))
+            conn.execute('DELETE FROM result_cache WHERE dataset_id = ?', (dataset_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": Config.QUERY_CACHE_ENABLED,
+            "code_hits": self.code_hits,
+            "code_misses": self.code_misses,
+            "result_hits": self.result_hits,
+            "result_misses": self.result_misses,
+        }
+
+
+query_cache = QueryCache(Config.QUERY_CACHE_PATH)
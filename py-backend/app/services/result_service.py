@@ -0,0 +1,232 @@
+import io
+import os
+import re
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config import Config
+
+RESULT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def table_to_frame(table) -> Optional[pd.DataFrame]:
+    """The result table as a DataFrame, or None if it has no tabular shape."""
+    if isinstance(table, pd.DataFrame):
+        return table
+    if isinstance(table, list) and table and all(isinstance(row, dict) for row in table):
+        return pd.DataFrame.from_records(table)
+    return None
+
+
+def _utc_offset(minutes: int) -> str:
+    sign = '-' if minutes < 0 else '+'
+    hours, minutes = divmod(abs(minutes), 60)
+    return f"{sign}{hours:02d}:{minutes:02d}"
+
+
+def _iso_datetimes(series: pd.Series) -> np.ndarray:
+    """ISO 8601 strings matching `Timestamp.isoformat()`, built per column rather than per cell."""
+    wall = series.dt.tz_localize(None) if series.dt.tz is not None else series
+    wall_values = wall.to_numpy(dtype='datetime64[ns]')
+    whole = np.datetime_as_string(wall_values, unit='s')
+    has_fraction = wall_values.astype('datetime64[us]') != wall_values.astype('datetime64[s]')
+    values = np.where(has_fraction, np.datetime_as_string(wall_values, unit='us'), whole).astype(object)
+    if series.dt.tz is not None:
+        utc_values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        offsets = (wall_values - utc_values).astype('timedelta64[m]').astype(np.int64)
+        offsets[np.isnat(wall_values)] = 0
+        unique_offsets, inverse = np.unique(offsets, return_inverse=True)
+        suffixes = np.array([_utc_offset(int(m)) for m in unique_offsets], dtype=object)[inverse]
+        values = values + suffixes
+    values[series.isna().to_numpy()] = None
+    return values
+
+
+def _float32_values(values: np.ndarray) -> np.ndarray:
+    """
+    float32 values as the float64 nearest to their shortest repr, so 1147.59 does not come back
+    as 1147.5899658203125: each value is rounded to the fewest significant digits (6 to 9) that
+    still round-trip to the same float32, a whole column at a time rather than via a string per value.
+    """
+    exact = values.astype(np.float64)
+    result = exact.copy()
+    pending = np.flatnonzero(np.isfinite(exact) & (exact != 0))
+    exponents = np.floor(np.log10(np.abs(exact[pending]))).astype(np.int64)
+    # Powers of ten up to 1e22 are exact doubles; the rare values that need larger ones are formatted one by one.
+    extreme = (exponents < -14) | (exponents > 26)
+    for i in pending[extreme]:
+        result[i] = float(str(values[i]))
+    pending, exponents = pending[~extreme], exponents[~extreme]
+    with np.errstate(over='ignore', invalid='ignore'):
+        for digits in range(6, 10):
+            if not pending.size:
+                break
+            shift = digits - 1 - exponents
+            scale = 10.0 ** np.abs(shift)
+            x = exact[pending]
+            # Dividing or multiplying a whole number by an exact power of ten rounds correctly.
+            candidates = np.where(shift >= 0, np.round(x * scale) / scale, np.round(x / scale) * scale)
+            done = candidates.astype(np.float32) == values[pending]
+            result[pending[done]] = candidates[done]
+            pending, exponents = pending[~done], exponents[~done]
+    return result
+
+
+def _json_column(series: pd.Series) -> list:
+    """Converts one column to JSON-ready Python values; missing values and non-finite floats become None."""
+    dtype = series.dtype
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return _iso_datetimes(series).tolist()
+    if isinstance(dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+        dtype = series.dtype
+    if pd.api.types.is_float_dtype(dtype):
+        if dtype == np.float32:
+            values = _float32_values(series.to_numpy())
+        else:
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        mask = ~np.isfinite(values)
+        if mask.any():
+            values = values.astype(object)
+            values[mask] = None
+        return values.tolist()
+    if pd.api.types.is_timedelta64_dtype(dtype):
+        values = series.astype(str).to_numpy(dtype=object, copy=True)
+        values[series.isna().to_numpy()] = None
+        return values.tolist()
+    if isinstance(dtype, np.dtype) and dtype.kind in 'iub':
+        return series.tolist()
+    values = series.to_numpy(dtype=object, copy=True)
+    mask = pd.isna(series).to_numpy()
+    if mask.any():
+        values[mask] = None
+    # Mixed columns, such as those of `describe(include='all')`, can hold numpy scalars.
+    return [value.item() if isinstance(value, np.generic) else value for value in values.tolist()]
+
+
+def frame_to_records(df: pd.DataFrame) -> list:
+    """Serializes a DataFrame to JSON-ready records, converting column by column."""
+    columns = [str(col) for col in df.columns]
+    values = [_json_column(df.iloc[:, i]) for i in range(df.shape[1])]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def result_path(result_id: str) -> str:
+    return os.path.join(Config.RESULTS_FOLDER, f"{result_id}.parquet")
+
+
+def result_exists(result_id: str) -> bool:
+    return bool(RESULT_ID_PATTERN.match(result_id)) and os.path.exists(result_path(result_id))
+
+
+def store_result_table(df: pd.DataFrame) -> str:
+    """Writes a full result table to the results folder and returns its id."""
+    os.makedirs(Config.RESULTS_FOLDER, exist_ok=True)
+    prune_results()
+    result_id = uuid.uuid4().hex
+    path = result_path(result_id)
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    pq.write_table(table, path + '.tmp', row_group_size=Config.RESULT_PAGE_ROWS, compression='zstd')
+    os.replace(path + '.tmp', path)
+    return result_id
+
+
+def prune_results():
+    """Removes stored result tables older than RESULT_TTL_SECONDS."""
+    oldest_allowed = time.time() - Config.RESULT_TTL_SECONDS
+    try:
+        names = os.listdir(Config.RESULTS_FOLDER)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(Config.RESULTS_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < oldest_allowed:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _page_info(result_id: str, total_rows: int, columns: list, next_offset: Optional[int]) -> Dict[str, Any]:
+    return {
+        "result_id": result_id,
+        "total_rows": total_rows,
+        "columns": columns,
+        "next_cursor": str(next_offset) if next_offset is not None else None,
+        "page_url": f"/api/results/{result_id}",
+        "arrow_url": f"/api/results/{result_id}/arrow",
+    }
+
+
+def prepare_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Caps the inline `table` of an analysis result. Tables longer than RESULT_INLINE_MAX_ROWS
+    are stored in full on the server; the result keeps their first page as a DataFrame and a
+    `table_info` entry describing where the rest can be paged from.
+    """
+    df = table_to_frame(result.get('table')) if isinstance(result, dict) else None
+    if df is None:
+        return result
+    if len(df) > Config.RESULT_INLINE_MAX_ROWS:
+        result_id = store_result_table(df)
+        page_rows = Config.RESULT_PAGE_ROWS
+        result['table_info'] = _page_info(result_id, len(df), [str(col) for col in df.columns],
+                                          page_rows if len(df) > page_rows else None)
+        df = df.iloc[:page_rows]
+    result['table'] = df
+    return result
+
+
+def serialize_table(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Makes the `table` of an analysis result JSON-friendly."""
+    df = table_to_frame(result.get('table')) if isinstance(result, dict) else None
+    if df is not None:
+        result['table'] = frame_to_records(df)
+    return result
+
+
+def read_result_page(result_id: str, offset: int, limit: int) -> Dict[str, Any]:
+    """Reads rows `[offset, offset + limit)` of a stored result, touching only the row groups that hold them."""
+    parquet_file = pq.ParquetFile(result_path(result_id))
+    metadata = parquet_file.metadata
+    total_rows = metadata.num_rows
+    groups, group_start, first_group_start = [], 0, None
+    for i in range(metadata.num_row_groups):
+        group_rows = metadata.row_group(i).num_rows
+        if group_start + group_rows > offset and group_start < offset + limit:
+            groups.append(i)
+            if first_group_start is None:
+                first_group_start = group_start
+        group_start += group_rows
+
+    columns = parquet_file.schema_arrow.names
+    if groups:
+        table = parquet_file.read_row_groups(groups).slice(offset - first_group_start, limit)
+        rows = frame_to_records(table.to_pandas())
+    else:
+        rows = []
+    next_offset = offset + len(rows) if offset + len(rows) < total_rows else None
+    page = _page_info(result_id, total_rows, columns, next_offset)
+    page["offset"] = offset
+    page["rows"] = rows
+    return page
+
+
+def result_arrow_stream(result_id: str, batch_rows: int = 64 * 1024):
+    """Yields a stored result as an Arrow IPC stream, one record batch at a time."""
+    parquet_file = pq.ParquetFile(result_path(result_id))
+    buffer = io.BytesIO()
+    writer = pa.ipc.new_stream(buffer, parquet_file.schema_arrow)
+    for batch in parquet_file.iter_batches(batch_size=batch_rows):
+        writer.write_batch(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    writer.close()
+    yield buffer.getvalue()
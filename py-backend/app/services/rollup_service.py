@@ -0,0 +1,180 @@
+import os
+import re
+from typing import Dict, Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config import Config
+
+ROLLUP_DIR = '_rollups'
+GRANULARITIES = {'hour': 'h', 'day': 'D'}
+ROW_COUNT_COLUMN = 'row_count'
+# Per measure and bucket; every statistic merges by summing, except min and max.
+STATISTICS = ('count', 'sum', 'min', 'max', 'sumsq')
+_MERGE_FUNCTIONS = {'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max', 'sumsq': 'sum'}
+_TIME_NAME_PREFERENCE = ('timestamp', 'time', 'datetime', 'date')
+_IDENTIFIER_NAME = re.compile(r'(^|_)(id|index|idx)$', re.IGNORECASE)
+
+
+def _is_measure(name: str, arrow_type: pa.DataType) -> bool:
+    return (pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)) and not _IDENTIFIER_NAME.search(name)
+
+
+def rollup_columns(schema: pa.Schema) -> tuple:
+    """The time column and the numeric measure columns a file is rolled up by, or `(None, [])` if it has no timestamp."""
+    time_columns = [field.name for field in schema if pa.types.is_timestamp(field.type)]
+    if not time_columns:
+        return None, []
+    time_column = next((name for preferred in _TIME_NAME_PREFERENCE for name in time_columns
+                        if name.lower() == preferred), time_columns[0])
+    measures = [field.name for field in schema if _is_measure(field.name, field.type)]
+    return time_column, measures[:Config.ROLLUP_MAX_MEASURES]
+
+
+def _bucket(times: pd.Series, granularity: str) -> pd.Series:
+    return times.dt.floor(GRANULARITIES[granularity], ambiguous='NaT', nonexistent='shift_backward')
+
+
+def _aggregate(df: pd.DataFrame, time_column: str, measures: list, granularity: str) -> pd.DataFrame:
+    """count/sum/min/max/sumsq per measure for every time bucket of `df`."""
+    buckets = _bucket(df[time_column], granularity).rename(time_column)
+    # Sums are accumulated in float64; minima and maxima keep the stored dtype.
+    values = df[measures].astype('float64')
+    grouped = pd.concat([values, values.pow(2).add_suffix('_sumsq')], axis=1).groupby(buckets, sort=True)
+    extremes = df[measures].groupby(buckets, sort=True)
+    parts = [
+        grouped.size().rename(ROW_COUNT_COLUMN),
+        grouped[measures].count().add_suffix('_count'),
+        grouped[measures].sum().add_suffix('_sum'),
+        extremes.min().add_suffix('_min'),
+        extremes.max().add_suffix('_max'),
+        grouped[[f'{m}_sumsq' for m in measures]].sum(),
+    ]
+    return pd.concat(parts, axis=1).reset_index()
+
+
+def merge_rollups(frames: list, keys: list, measures: list) -> pd.DataFrame:
+    """
+    Combines partial rollups with the same keys into one row per key: counts, sums and sums of
+    squares add up, minima and maxima are taken over the parts. This is what lets rollups be
+    built batch by batch and extended when data is appended.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=keys + [ROW_COUNT_COLUMN])
+    combined = pd.concat(frames, ignore_index=True)
+    functions = {ROW_COUNT_COLUMN: 'sum'}
+    for measure in measures:
+        for stat in STATISTICS:
+            column = f'{measure}_{stat}'
+            if column in combined:
+                functions[column] = _MERGE_FUNCTIONS[stat]
+    return combined.groupby(keys, sort=True).agg(functions).reset_index()
+
+
+def _coarsen(rollup: pd.DataFrame, time_column: str, measures: list, granularity: str) -> pd.DataFrame:
+    coarser = rollup.assign(**{time_column: _bucket(rollup[time_column], granularity)})
+    return merge_rollups([coarser.dropna(subset=[time_column])], [time_column], measures)
+
+
+def build_file_rollups(parquet_path: str, rollup_path: str, batch_rows: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Precomputes hourly and daily rollups of one columnar file and writes them to `rollup_path`.
+    The file is read in batches of its time and measure columns only; each batch is aggregated
+    by hour and the partial results are merged, and the daily rollup is merged from the hourly one.
+    Returns the rollup entry for the manifest, or None if the file has no timestamp column.
+    """
+    batch_rows = batch_rows or Config.ROLLUP_BATCH_ROWS
+    parquet_file = pq.ParquetFile(parquet_path)
+    time_column, measures = rollup_columns(parquet_file.schema_arrow)
+    if time_column is None:
+        return None
+
+    partials = []
+    for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=[time_column] + measures):
+        df = batch.to_pandas()
+        partials.append(_aggregate(df[df[time_column].notna()], time_column, measures, 'hour'))
+    rollups = {'hour': merge_rollups(partials, [time_column], measures)}
+    rollups['day'] = _coarsen(rollups['hour'], time_column, measures, 'day')
+
+    os.makedirs(rollup_path, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(parquet_path))[0]
+    entry = {"time_column": time_column, "measures": measures}
+    for granularity, rollup in rollups.items():
+        name = f"{stem}.{granularity}.parquet"
+        path = os.path.join(rollup_path, name)
+        pq.write_table(pa.Table.from_pandas(rollup, preserve_index=False), path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+        entry[granularity] = {"path": name, "rows": len(rollup)}
+    return entry
+
+
+def remove_file_rollups(rollup_path: str, entry: Optional[Dict[str, Any]]):
+    """Deletes the rollup files of a dataset file that is being replaced or removed."""
+    for granularity in GRANULARITIES:
+        if entry and granularity in entry:
+            try:
+                os.remove(os.path.join(rollup_path, entry[granularity]['path']))
+            except FileNotFoundError:
+                pass
+
+
+def rollup_files(dataset_path: str, manifest: Dict[str, Any], granularity: str) -> Dict[str, str]:
+    """`{filename: rollup parquet path}` for the files of a dataset that have rollups at `granularity`."""
+    rollup_path = os.path.join(dataset_path, ROLLUP_DIR)
+    return {
+        filename: os.path.join(rollup_path, info['rollups'][granularity]['path'])
+        for filename, info in manifest['files'].items()
+        if info.get('rollups')
+    }
+
+
+def load_rollups(dataset_path: str, manifest: Optional[Dict[str, Any]], layout: Dict[str, Any]) -> Dict[str, pd.DataFrame]:
+    """
+    The dataset's rollups as `{"hour": DataFrame, "day": DataFrame}`, one row per source and
+    bucket, with the same categorical source and context columns as the combined frame.
+    Empty if no file has rollups.
+    """
+    if manifest is None:
+        return {}
+    rollups = {}
+    for granularity in GRANULARITIES:
+        paths = rollup_files(dataset_path, manifest, granularity)
+        if not paths:
+            return {}
+        frames = []
+        for filename, path in paths.items():
+            df = pq.read_table(path).to_pandas()
+            df.insert(0, layout['source_column'], filename)
+            df.insert(1, layout['context_column'], layout['contexts'].get(filename, filename))
+            frames.append(df)
+        rollup = pd.concat(frames, ignore_index=True)
+        for column in (layout['source_column'], layout['context_column']):
+            rollup[column] = rollup[column].astype('category')
+        rollups[granularity] = rollup
+    return rollups
+
+
+def describe_rollups(manifest: Optional[Dict[str, Any]], layout: Dict[str, Any]) -> Optional[str]:
+    """Deterministic description of the rollups for the schema context, or None if the dataset has none."""
+    entries = [info['rollups'] for info in (manifest or {"files": {}})['files'].values() if info.get('rollups')]
+    if not entries:
+        return None
+    time_columns = sorted({entry['time_column'] for entry in entries})
+    measures = []
+    for entry in entries:
+        measures += [m for m in entry['measures'] if m not in measures]
+    hour_rows = sum(entry['hour']['rows'] for entry in entries)
+    day_rows = sum(entry['day']['rows'] for entry in entries)
+    return "\n".join([
+        f"Rollups: `rollups['hour']` ({hour_rows} rows) and `rollups['day']` ({day_rows} rows) hold precomputed "
+        f"aggregates per `{layout['source_column']}`/`{layout['context_column']}` and time bucket "
+        f"(column {', '.join(f'`{c}`' for c in time_columns)}, the start of the hour or day).",
+        f"- `{ROW_COUNT_COLUMN}`: rows in the bucket.",
+        "- For each measure m: `m_count` (non-null values), `m_sum`, `m_min`, `m_max`, `m_sumsq` (sum of squares).",
+        f"- Measures: {', '.join(f'`{m}`' for m in measures)}.",
+        "- Mean = m_sum / m_count; sample std = sqrt((m_sumsq - m_sum**2 / m_count) / (m_count - 1)). "
+        "To combine buckets or sources, add counts, sums and sums of squares and take the min of minima and max of maxima.",
+    ])
@@ -1,38 +1,157 @@
 import pandas as pd
+import pyarrow.parquet as pq
+import io
 import os
 import json
-from langchain_openai import ChatOpenAI
+import zipfile
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 
-def generate_intelligent_schema(file_paths: list[str], dataset_id: str):
+from ..config import Config
+from .ingest_service import COLUMNAR_DIR, describe_combined, read_manifest
+from .rollup_service import describe_rollups
+from .llm_gateway import llm_gateway
+
+SAMPLE_ROWS = 10
+# The deterministic notes appended to the LLM-written schema context start with this line.
+NOTES_SECTION_START = "\n\nCombined data: "
+
+class SchemaContextCache:
     """
-    Runs a multi-step, AI-powered process to analyze a dataset, clean its schema,
-    and generate a rich, semantic context for the main agent. This context is saved
-    to a file for persistent use.
+    LRU cache of schema context texts. Every lookup checks the file's size and modification
+    time, so a context rewritten by another process is re-read; writers here also invalidate it.
     """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dataset_id: str) -> Optional[str]:
+        """The dataset's schema context, or None if it has none yet."""
+        try:
+            stat = os.stat(_context_path(dataset_id))
+        except FileNotFoundError:
+            self.invalidate(dataset_id)
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(dataset_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(dataset_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        with open(_context_path(dataset_id), 'r', encoding='utf-8') as f:
+            context = f.read()
+        with self._lock:
+            self._entries[dataset_id] = (version, context)
+            self._entries.move_to_end(dataset_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return context
+
+    def invalidate(self, dataset_id: str):
+        with self._lock:
+            self._entries.pop(dataset_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def _context_path(dataset_id: str) -> str:
+    return os.path.join('uploads', dataset_id, '_schema_context.json')
+
+def _sample_file(source):
+    df = pd.read_json(source, lines=True, nrows=SAMPLE_ROWS)
+
+    for col in df.select_dtypes(include=['datetime64[ns, UTC]', 'datetime64[ns]']).columns:
+        df[col] = df[col].astype(str)
+
+    return {
+        'original_columns': df.columns.tolist(),
+        'sample_data': df.head(3).to_dict(orient='records')
+    }
+
+def _sample_columnar(path: str):
+    batch = next(pq.ParquetFile(path).iter_batches(batch_size=3), None)
+    df = batch.to_pandas() if batch is not None else pd.DataFrame()
+    for col in df.select_dtypes(include=['datetime64[ns, UTC]', 'datetime64[ns]', 'datetimetz']).columns:
+        df[col] = df[col].astype(str)
+    return {
+        'original_columns': df.columns.tolist(),
+        'sample_data': df.to_dict(orient='records')
+    }
+
+def _sample_member(zip_path: str, member: str):
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(member) as f:
+        head = b''.join(itertools.islice(f, SAMPLE_ROWS))
+    return _sample_file(io.BytesIO(head))
+
+def _sample_in_parallel(tasks: dict) -> dict:
     raw_schemas = {}
-    for file_path in file_paths:
+    if not tasks:
+        return raw_schemas
+    with ThreadPoolExecutor(max_workers=min(Config.SCHEMA_SAMPLING_WORKERS, len(tasks))) as executor:
+        futures = {name: executor.submit(task) for name, task in tasks.items()}
+    for name, future in futures.items():
         try:
-            df = pd.read_json(file_path, lines=True, nrows=10)
-            
-            for col in df.select_dtypes(include=['datetime64[ns, UTC]', 'datetime64[ns]']).columns:
-                df[col] = df[col].astype(str)
-
-            filename = os.path.basename(file_path)
-            raw_schemas[filename] = {
-                'original_columns': df.columns.tolist(),
-                'sample_data': df.head(3).to_dict(orient='records')
-            }
+            raw_schemas[name] = future.result()
         except Exception as e:
-            print(f"Initial scan failed for {file_path}: {e}")
-            continue
+            print(f"Initial scan failed for {name}: {e}")
+    return raw_schemas
 
-    if not raw_schemas:
-        print("Could not generate any raw schemas from the provided files.")
-        return
+def sample_files(file_paths: list[str]) -> dict:
+    """Reads the column names and a few sample rows of every file, scanning the files in parallel."""
+    return _sample_in_parallel({
+        os.path.basename(file_path): (lambda file_path=file_path: _sample_file(file_path))
+        for file_path in file_paths
+    })
+
+def sample_archive(zip_path: str, members: list[str]) -> dict:
+    """Like `sample_files`, but reads only the first lines of each NDJSON member of a zip."""
+    return _sample_in_parallel({
+        os.path.basename(member): (lambda member=member: _sample_member(zip_path, member))
+        for member in members
+    })
+
+def sample_columnar(dataset_path: str) -> dict:
+    """Like `sample_files`, but reads the converted files of a dataset, whose columns already carry their cleaned names."""
+    manifest = read_manifest(dataset_path) or {"files": {}}
+    columnar_path = os.path.join(dataset_path, COLUMNAR_DIR)
+    return _sample_in_parallel({
+        filename: (lambda path=os.path.join(columnar_path, info['path']): _sample_columnar(path))
+        for filename, info in manifest['files'].items()
+    })
+
+def _unseen_columns(raw_schemas: dict, known_map: dict) -> dict:
+    unseen = {}
+    for filename, schema in raw_schemas.items():
+        columns = [col for col in schema['original_columns'] if col not in known_map]
+        if columns:
+            unseen[filename] = {
+                'original_columns': columns,
+                'sample_data': [{col: row.get(col) for col in columns} for row in schema['sample_data']]
+            }
+    return unseen
 
-    map_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+def generate_column_map(raw_schemas: dict, dataset_id: str, known_map: Optional[dict] = None):
+    """
+    Asks the LLM for snake_case names of the original columns and saves the mapping. Returns None on failure.
+    With `known_map`, only columns it does not cover are sent to the LLM and the result extends it.
+    """
+    known_map = known_map or {}
+    raw_schemas = _unseen_columns(raw_schemas, known_map)
+    if not raw_schemas:
+        return known_map
+    map_llm = llm_gateway.chat("gpt-4o-mini")
     map_prompt = ChatPromptTemplate.from_template(
         """
         You are a data cleaning expert. A user has uploaded a dataset with the following files and columns.
@@ -46,15 +165,43 @@ def generate_intelligent_schema(file_paths: list[str], dataset_id: str):
     map_chain = map_prompt | map_llm | JsonOutputParser()
     
     try:
-        column_map = map_chain.invoke({"raw_schema": json.dumps(raw_schemas, indent=2)})
+        column_map = {**known_map, **map_chain.invoke({"raw_schema": json.dumps(raw_schemas, indent=2)})}
         map_path = os.path.join('uploads', dataset_id, '_column_map.json')
         with open(map_path, 'w', encoding='utf-8') as f:
             json.dump(column_map, f, indent=2)
     except Exception as e:
         print(f"Failed to generate and save column map: {e}")
-        return
+        return None
+    return column_map
+
+def _describe_layout(layout: dict) -> str:
+    lines = [
+        "Combined data: `combined` holds the rows of every file in one table, with two added categorical columns:",
+        f"- `{layout['source_column']}`: the filename the row came from.",
+        f"- `{layout['context_column']}`: the context parsed from the filename. Values per file:",
+    ]
+    lines += [f"  - '{filename}' -> '{context}'" for filename, context in layout['contexts'].items()]
+    return "\n".join(lines)
+
+def describe_combined_frame(raw_schemas: dict, column_map: dict) -> str:
+    """Deterministic description of the combined frame that generated code receives next to the per-file DataFrames."""
+    columns = {column_map.get(col, col) for schema in raw_schemas.values() for col in schema['original_columns']}
+    return _describe_layout(describe_combined(list(raw_schemas), columns))
+
+def save_schema_context(dataset_id: str, context: str):
+    """Publishes `context` as the dataset's schema context, replacing the file atomically."""
+    context_path = _context_path(dataset_id)
+    with open(context_path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(context)
+    os.replace(context_path + '.tmp', context_path)
+    schema_context_cache.invalidate(dataset_id)
 
-    context_llm = ChatOpenAI(model="gpt-4o", temperature=0)
+def generate_schema_context(raw_schemas: dict, column_map: dict, dataset_id: str, save: bool = True):
+    """
+    Asks the LLM for a natural-language description of the dataset and, unless `save` is False,
+    saves it as the schema context. Returns the context, or None on failure.
+    """
+    context_llm = llm_gateway.chat("gpt-4o")
     context_prompt = ChatPromptTemplate.from_template(
         """
         You are a senior data analyst. A user has uploaded a dataset.
@@ -81,8 +228,49 @@ def generate_intelligent_schema(file_paths: list[str], dataset_id: str):
 
     try:
         final_context = context_chain.invoke({"semantic_info": json.dumps(semantic_info, indent=2)})
-        context_path = os.path.join('uploads', dataset_id, '_schema_context.json')
-        with open(context_path, 'w', encoding='utf-8') as f:
-            f.write(final_context)
+        final_context = f"{final_context.rstrip()}\n\n{describe_combined_frame(raw_schemas, column_map)}"
+        if save:
+            save_schema_context(dataset_id, final_context)
     except Exception as e:
         print(f"Failed to generate and save schema context: {e}")
+        return None
+    return final_context
+
+def generate_intelligent_schema(file_paths: list[str], dataset_id: str):
+    """
+    Runs a multi-step, AI-powered process to analyze a dataset, clean its schema,
+    and generate a rich, semantic context for the main agent. This context is saved
+    to a file for persistent use.
+    """
+    raw_schemas = sample_files(file_paths)
+    if not raw_schemas:
+        print("Could not generate any raw schemas from the provided files.")
+        return
+
+    column_map = generate_column_map(raw_schemas, dataset_id)
+    if column_map is None:
+        return
+
+    generate_schema_context(raw_schemas, column_map, dataset_id)
+
+def refresh_schema_notes(dataset_id: str):
+    """
+    Rewrites the deterministic notes at the end of the saved schema context (the combined frame
+    and the rollups) from the current manifest, keeping the LLM-written description.
+    """
+    dataset_path = os.path.join('uploads', dataset_id)
+    context_path = _context_path(dataset_id)
+    manifest = read_manifest(dataset_path)
+    if manifest is None or not os.path.exists(context_path):
+        return
+    columns = {col for info in manifest['files'].values() for col in info.get('dtypes', {})}
+    layout = manifest.get('combined') or describe_combined(list(manifest['files']), columns)
+    with open(context_path, 'r', encoding='utf-8') as f:
+        context = f.read().split(NOTES_SECTION_START)[0].rstrip()
+    context = f"{context}\n\n{_describe_layout(layout)}"
+    rollups = describe_rollups(manifest, layout)
+    if rollups:
+        context = f"{context}\n\n{rollups}"
+    save_schema_context(dataset_id, context)
+
+schema_context_cache = SchemaContextCache(Config.SCHEMA_CONTEXT_CACHE_SIZE)
@@ -1,19 +1,259 @@
+import os
+import re
+import json
+import time
 import uuid
+import shutil
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..config import Config
+
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+# Summaries and code kept per turn are cut to this many characters.
+TURN_TEXT_MAX_CHARS = 2000
+
+
+def _clip(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    text = str(text)
+    return text if len(text) <= TURN_TEXT_MAX_CHARS else text[:TURN_TEXT_MAX_CHARS] + "..."
+
+
+def _remove(path: Optional[str]):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
 
 class SessionManager:
-    def __init__(self):
-        self.sessions = {}
+    """
+    Conversation sessions in SQLite, so they survive restarts and are shared by every gunicorn
+    worker. A session belongs to one dataset and keeps its recent turns (query, summary and
+    generated code) and a handle to the last result table, written as Parquet to the results
+    folder, which follow-up queries can analyze instead of the full dataset.
+
+    Sessions idle for longer than the TTL expire. Beyond the session count or the stored-bytes
+    cap (history, code and result files together) the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, results_folder: str, ttl_seconds: int, max_sessions: int, max_bytes: int,
+                 history_turns: int):
+        self.path = path
+        self.results_folder = results_folder
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.history_turns = history_turns
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def create_session(self) -> str:
-        session_id = str(uuid.uuid4())
-        self.sessions[session_id] = {}
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    dataset_id TEXT NOT NULL,
+                    history TEXT NOT NULL,
+                    last_code TEXT,
+                    last_engine TEXT,
+                    result_path TEXT,
+                    result_columns TEXT,
+                    result_rows INTEGER,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed_at);
+                CREATE INDEX IF NOT EXISTS sessions_dataset ON sessions (dataset_id);
+            ''')
+            self._local.conn = conn
+        return conn
+
+    def _reset_connections(self):
+        # SQLite connections must not be shared with a forked child.
+        self._local = threading.local()
+
+    def _row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        session = dict(row)
+        session['history'] = json.loads(session['history'])
+        session['result_columns'] = json.loads(session['result_columns']) if session['result_columns'] else None
+        return session
+
+    def create_session(self, dataset_id: str) -> str:
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('INSERT INTO sessions (session_id, dataset_id, history, size, created_at, accessed_at) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (session_id, dataset_id, '[]', 2, now, now))
+        self.prune()
         return session_id
 
-    def get_session_data(self, session_id: str, key: str):
-        return self.sessions.get(session_id, {}).get(key)
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session's state, refreshing its last access, or None if it does not exist or has expired."""
+        if not session_id or not SESSION_ID_PATTERN.match(session_id):
+            self.misses += 1
+            return None
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None or row['accessed_at'] < now - self.ttl_seconds:
+            if row is not None:
+                self.delete_session(session_id)
+            self.misses += 1
+            return None
+        with conn:
+            conn.execute('UPDATE sessions SET accessed_at = ? WHERE session_id = ?', (now, session_id))
+        self.hits += 1
+        return self._row(row)
+
+    def _store_result(self, session_id: str, frame: Optional[pd.DataFrame], stored_path: Optional[str]) -> Optional[str]:
+        """Writes the session's result table to a new file, from a DataFrame or a copy of an already stored result."""
+        if frame is None and stored_path is None:
+            return None
+        os.makedirs(self.results_folder, exist_ok=True)
+        path = os.path.join(self.results_folder, f"{session_id}.{uuid.uuid4().hex[:8]}.parquet")
+        if stored_path is not None:
+            try:
+                os.link(stored_path, path)
+            except OSError:
+                shutil.copyfile(stored_path, path)
+        else:
+            table = pa.Table.from_pandas(frame.reset_index(drop=True), preserve_index=False)
+            pq.write_table(table, path + '.tmp', compression='zstd')
+            os.replace(path + '.tmp', path)
+        return path
+
+    def record_turn(self, session_id: str, query: str, summary: Optional[str], code: Optional[str] = None,
+                    engine: Optional[str] = None, frame: Optional[pd.DataFrame] = None,
+                    stored_path: Optional[str] = None) -> bool:
+        """
+        Appends a turn to the session's history, keeping the last `history_turns`. A turn that
+        produced code and a result table (`frame`, or the Parquet file at `stored_path`) replaces
+        the session's last code and result; other turns leave them as they are. Returns False if
+        the session no longer exists.
+        """
+        try:
+            result_path = self._store_result(session_id, frame, stored_path)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Storing the result of session '{session_id}' failed: {e}")
+            result_path = None
+        conn = self._connect()
+        replaced = None
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            if row is None:
+                _remove(result_path)
+                return False
+            session = self._row(row)
+            history = session['history'] + [{"query": query, "summary": _clip(summary), "code": _clip(code),
+                                              "at": time.time()}]
+            history = history[-self.history_turns:]
+            values = {
+                "history": json.dumps(history),
+                "last_code": code if code is not None else session['last_code'],
+                "last_engine": engine if code is not None else session['last_engine'],
+                "result_path": session['result_path'],
+                "result_columns": row['result_columns'],
+                "result_rows": session['result_rows'],
+            }
+            if result_path is not None:
+                replaced = session['result_path']
+                metadata = pq.read_metadata(result_path)
+                values['result_path'] = result_path
+                values['result_columns'] = json.dumps(pq.read_schema(result_path).names)
+                values['result_rows'] = metadata.num_rows
+            result_bytes = os.path.getsize(values['result_path']) if values['result_path'] else 0
+            values['size'] = len(values['history']) + len(values['last_code'] or '') + result_bytes
+            if values['size'] > self.max_bytes and result_path is not None:
+                # A result too large for the whole store is not kept.
+                replaced = result_path
+                values.update(result_path=session['result_path'], result_columns=row['result_columns'],
+                              result_rows=session['result_rows'], size=values['size'] - result_bytes)
+            values['accessed_at'] = time.time()
+            assignments = ', '.join(f"{key} = ?" for key in values)
+            conn.execute(f'UPDATE sessions SET {assignments} WHERE session_id = ?', list(values.values()) + [session_id])
+        if replaced != values['result_path']:
+            _remove(replaced)
+        self.prune()
+        return True
+
+    def load_result(self, session: Dict[str, Any]) -> Optional[pd.DataFrame]:
+        path = session.get('result_path')
+        if not path or not os.path.exists(path):
+            return None
+        return pq.read_table(path).to_pandas()
+
+    def delete_session(self, session_id: str) -> bool:
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT result_path FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+        if row is not None:
+            _remove(row[0])
+        return row is not None
+
+    def prune(self) -> int:
+        """Deletes expired sessions, then the least recently used beyond the count and byte caps. Returns how many."""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            expired = conn.execute('SELECT session_id, result_path FROM sessions WHERE accessed_at < ?',
+                                   (time.time() - self.ttl_seconds,)).fetchall()
+            evicted, kept, total = [], 0, 0
+            for row in conn.execute('SELECT session_id, result_path, size FROM sessions WHERE accessed_at >= ? '
+                                    'ORDER BY accessed_at DESC', (time.time() - self.ttl_seconds,)):
+                if kept < self.max_sessions and total + row['size'] <= self.max_bytes:
+                    kept += 1
+                    total += row['size']
+                else:
+                    evicted.append(row)
+            removed = list(expired) + evicted
+            conn.executemany('DELETE FROM sessions WHERE session_id = ?', [(row['session_id'],) for row in removed])
+        for row in removed:
+            _remove(row['result_path'])
+        self.evictions += len(evicted)
+        return len(removed)
+
+    def stats(self) -> Dict[str, Any]:
+        count, size = self._connect().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions').fetchone()
+        return {
+            "sessions": count,
+            "bytes": size,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
 
-    def update_session_data(self, session_id: str, key: str, value):
-        if session_id in self.sessions:
-            self.sessions[session_id][key] = value
 
-session_manager = SessionManager()
\ No newline at end of file
+session_manager = SessionManager(
+    Config.SESSION_STORE_PATH,
+    Config.SESSION_RESULTS_FOLDER,
+    ttl_seconds=Config.SESSION_TTL_SECONDS,
+    max_sessions=Config.SESSION_MAX_COUNT,
+    max_bytes=Config.SESSION_MAX_BYTES,
+    history_turns=Config.SESSION_HISTORY_TURNS,
+)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=session_manager._reset_connections)
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+from typing import Dict, Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import duckdb
+except ImportError:  # without DuckDB every dataset uses the pandas engine
+    duckdb = None
+
+from ..config import Config
+from .ingest_service import COLUMNAR_DIR, read_manifest, describe_combined
+from .rollup_service import GRANULARITIES, rollup_files
+
+ENGINES = ('pandas', 'duckdb')
+ENGINE_FILENAME = '_engine.json'
+
+
+def view_name(filename: str, taken: set = frozenset()) -> str:
+    """SQL-friendly view name for a dataset file, e.g. 'sensor_data_Room 1.ndjson' -> 'sensor_data_room_1'."""
+    name = re.sub(r'[^a-z0-9_]+', '_', os.path.splitext(filename)[0].lower()).strip('_') or 'data'
+    if name[0].isdigit():
+        name = f"f_{name}"
+    candidate, suffix = name, 2
+    while candidate in taken:
+        candidate, suffix = f"{name}_{suffix}", suffix + 1
+    return candidate
+
+
+def dataset_views(dataset_path: str, manifest: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, str]]:
+    """One view per columnar file of a dataset: `{view_name: {"file": original filename, "path": parquet path}}`."""
+    manifest = manifest or read_manifest(dataset_path)
+    if manifest is None:
+        return {}
+    views = {}
+    for filename, info in manifest['files'].items():
+        name = view_name(filename, views.keys())
+        views[name] = {"file": filename, "path": os.path.abspath(os.path.join(dataset_path, COLUMNAR_DIR, info['path']))}
+    return views
+
+
+def _combined_layout(dataset_path: str, views: Dict[str, Dict[str, str]],
+                     manifest: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    manifest = manifest or read_manifest(dataset_path) or {"files": {}}
+    if manifest.get("combined"):
+        return manifest["combined"]
+    columns = {col for info in manifest["files"].values() for col in info.get("dtypes", {})}
+    return describe_combined([info['file'] for info in views.values()], columns)
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _union_with_source(parts: Dict[str, str], layout: Dict[str, Any]) -> str:
+    """UNION ALL BY NAME of `{filename: FROM clause}` with literal source and context columns."""
+    return " UNION ALL BY NAME ".join(
+        f"SELECT *, {_sql_literal(filename)} AS \"{layout['source_column']}\", "
+        f"{_sql_literal(layout['contexts'].get(filename, filename))} AS \"{layout['context_column']}\" FROM {source}"
+        for filename, source in parts.items()
+    )
+
+
+def _rollup_view_names(views) -> Dict[str, str]:
+    taken = set(views) | {view_name('combined', views)}
+    names = {}
+    for granularity in GRANULARITIES:
+        names[granularity] = view_name(f'rollup_{granularity}', taken)
+        taken.add(names[granularity])
+    return names
+
+
+def describe_views(dataset_path: str) -> str:
+    """Lists the views of a dataset and the file each one reads, for the SQL code generation prompt."""
+    views = dataset_views(dataset_path)
+    layout = _combined_layout(dataset_path, views)
+    lines = [f"- `{view_name('combined', views.keys())}`: every file's rows in one view, with `{layout['source_column']}` "
+             f"(the filename) and `{layout['context_column']}` (e.g. '{next(iter(layout['contexts'].values()), '')}') columns"]
+    manifest = read_manifest(dataset_path)
+    if manifest and any(info.get('rollups') for info in manifest['files'].values()):
+        lines += [f"- `{name}`: the `rollups['{granularity}']` aggregates described in the schema context"
+                  for granularity, name in _rollup_view_names(views.keys()).items()]
+    lines += [f"- `{name}` (file '{info['file']}')" for name, info in views.items()]
+    return "\n".join(lines)
+
+
+def read_engine_setting(dataset_path: str) -> str:
+    try:
+        with open(os.path.join(dataset_path, ENGINE_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f).get('engine', 'auto')
+    except FileNotFoundError:
+        return 'auto'
+
+
+def write_engine_setting(dataset_path: str, engine: str):
+    """Pins a dataset to an engine, or returns it to automatic selection with 'auto'."""
+    path = os.path.join(dataset_path, ENGINE_FILENAME)
+    if engine == 'auto':
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({"engine": engine}, f)
+    os.replace(path + '.tmp', path)
+
+
+def select_engine(dataset_id: str) -> str:
+    """
+    The engine a dataset's queries run on: its pinned setting, else Config.QUERY_ENGINE, where
+    'auto' picks DuckDB once the columnar files exceed DUCKDB_AUTO_THRESHOLD_BYTES. Datasets
+    without columnar files, or installs without DuckDB, always use pandas.
+    """
+    dataset_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id)
+    manifest = read_manifest(dataset_path)
+    if duckdb is None or manifest is None:
+        return 'pandas'
+    engine = read_engine_setting(dataset_path)
+    if engine == 'auto':
+        engine = Config.QUERY_ENGINE
+    if engine == 'auto':
+        total_bytes = sum(info['bytes'] for info in manifest['files'].values())
+        engine = 'duckdb' if total_bytes > Config.DUCKDB_AUTO_THRESHOLD_BYTES else 'pandas'
+    return engine if engine in ENGINES else 'pandas'
+
+
+class SQLDataset:
+    """
+    What generated code receives under the DuckDB engine: an in-memory DuckDB database with
+    one view per dataset file over its Parquet data, a combined view and the rollup views. Queries scan only the columns and row
+    groups they need, spill to disk beyond the memory limit, and stream their results back.
+    """
+
+    def __init__(self, dataset_path: str):
+        os.makedirs(Config.DUCKDB_TEMP_FOLDER, exist_ok=True)
+        self._conn = duckdb.connect(database=':memory:', config={
+            'memory_limit': f"{Config.DUCKDB_MEMORY_LIMIT_MB}MB",
+            'threads': Config.DUCKDB_THREADS,
+            'temp_directory': os.path.abspath(Config.DUCKDB_TEMP_FOLDER),
+        })
+        # The manifest is read once, so every view belongs to the same dataset version even if
+        # files are appended while the query runs; replaced files are kept for a retention period.
+        manifest = read_manifest(dataset_path)
+        self.version = manifest.get('version', 1) if manifest else None
+        self.views = dataset_views(dataset_path, manifest)
+        for name, info in self.views.items():
+            self._conn.execute(f"CREATE VIEW \"{name}\" AS SELECT * FROM read_parquet({_sql_literal(info['path'])})")
+
+        # One view over every file, with the same source and context columns as the pandas combined frame,
+        # and one per rollup granularity over the precomputed rollup files.
+        self.combined_view = view_name('combined', self.views.keys())
+        self.rollup_views = {}
+        if not self.views:
+            return
+        layout = _combined_layout(dataset_path, self.views, manifest)
+        parts = {info['file']: f"\"{name}\"" for name, info in self.views.items()}
+        self._conn.execute(f"CREATE VIEW \"{self.combined_view}\" AS {_union_with_source(parts, layout)}")
+        for granularity, name in _rollup_view_names(self.views.keys()).items():
+            paths = rollup_files(dataset_path, manifest, granularity)
+            if paths:
+                parts = {filename: f"read_parquet({_sql_literal(path)})" for filename, path in paths.items()}
+                self._conn.execute(f"CREATE VIEW \"{name}\" AS {_union_with_source(parts, layout)}")
+                self.rollup_views[granularity] = name
+
+    def query(self, sql: str, params: Optional[list] = None) -> pd.DataFrame:
+        """Runs a DuckDB SQL query and returns its result as a DataFrame."""
+        reader = self._conn.execute(sql, params).fetch_record_batch(Config.RESULT_PAGE_ROWS)
+        batches, rows = [], 0
+        for batch in reader:
+            rows += batch.num_rows
+            if rows > Config.DUCKDB_MAX_RESULT_ROWS:
+                raise ValueError(f"Query returned more than {Config.DUCKDB_MAX_RESULT_ROWS} rows; "
+                                 "aggregate or add a LIMIT in SQL.")
+            batches.append(batch)
+        return pa.Table.from_batches(batches, schema=reader.schema).to_pandas()
+
+    def close(self):
+        self._conn.close()
+
+
+def open_sql_dataset(dataset_id: str) -> SQLDataset:
+    if duckdb is None:
+        raise RuntimeError("The DuckDB engine is not installed.")
+    return SQLDataset(os.path.join(Config.UPLOADS_FOLDER, dataset_id))
+
+
+def engine_info(dataset_id: str) -> Dict[str, Any]:
+    dataset_path = os.path.join(Config.UPLOADS_FOLDER, dataset_id)
+    manifest = read_manifest(dataset_path)
+    return {
+        "dataset_id": dataset_id,
+        "setting": read_engine_setting(dataset_path),
+        "engine": select_engine(dataset_id),
+        "columnar_bytes": sum(info['bytes'] for info in manifest['files'].values()) if manifest else None,
+        "duckdb_available": duckdb is not None,
+    }
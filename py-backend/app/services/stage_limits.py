@@ -0,0 +1,74 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any
+
+from ..config import Config
+from .instrumentation import metrics
+
+
+class StageLimiter:
+    """
+    Bounds how many queries run one stage of the pipeline at once in this process, and records
+    how long they waited for it. LLM calls and generated-code execution have separate limits, so
+    a burst of slow LLM calls does not hold back execution and vice versa.
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self._reset()
+
+    def _reset(self):
+        # Slots held by threads of the parent do not exist in a forked child.
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.entered = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @contextmanager
+    def slot(self):
+        """Holds one slot of the stage for the duration of the block; yields the seconds waited for it."""
+        started = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        self._slots.acquire()
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.waiting -= 1
+            self.active += 1
+            self.entered += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        try:
+            yield waited
+        finally:
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "waiting": self.waiting,
+                "entered": self.entered,
+                "avg_wait_ms": round(self.wait_seconds / self.entered * 1000, 1) if self.entered else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 1),
+            }
+
+
+llm_stage = StageLimiter('llm', Config.LLM_MAX_CONCURRENCY)
+cpu_stage = StageLimiter('cpu', Config.CPU_STAGE_CONCURRENCY)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=llm_stage._reset)
+    os.register_at_fork(after_in_child=cpu_stage._reset)
+metrics.gauge('stage_active', "Queries running a stage in this process.",
+              lambda: {stage.name: stage.active for stage in (llm_stage, cpu_stage)})
+metrics.gauge('stage_waiting', "Queries waiting for a slot of a stage in this process.",
+              lambda: {stage.name: stage.waiting for stage in (llm_stage, cpu_stage)})
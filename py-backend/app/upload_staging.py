@@ -0,0 +1,41 @@
+import os
+import tempfile
+from flask import Request, request
+
+from .config import Config
+
+
+class UploadRequest(Request):
+    """
+    Request class that spools uploaded files to named files in the staging folder.
+
+    Werkzeug writes the upload body to disk once while parsing the form; the view can then
+    move that file into place with `stage_upload` instead of copying it a second time.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = tempfile.NamedTemporaryFile('wb+', dir=Config.UPLOAD_STAGING_FOLDER, suffix='.upload', delete=False)
+        if not hasattr(self, 'staged_upload_paths'):
+            self.staged_upload_paths = []
+        self.staged_upload_paths.append(spool.name)
+        return spool
+
+
+def stage_upload(file, dest_path: str):
+    """Moves an uploaded file to `dest_path`, renaming the spooled upload when possible."""
+    spool_path = getattr(file.stream, 'name', None)
+    if isinstance(spool_path, str) and os.path.exists(spool_path):
+        file.stream.flush()
+        file.stream.close()
+        os.replace(spool_path, dest_path)
+    else:
+        file.save(dest_path)
+
+
+def discard_staged_uploads(exc=None):
+    """Teardown handler removing spooled uploads that a view did not move into place."""
+    for spool_path in getattr(request, 'staged_upload_paths', []):
+        try:
+            os.remove(spool_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,371 @@
+"""
+End-to-end benchmark of the whole pipeline, offline: synthetic NDJSON datasets and a
+deterministic fake OpenAI server (benchmarks/fake_llm.py) behind the real LLM gateway.
+
+For every data size, in a fresh process:
+  1. `generate_intelligent_schema` on the NDJSON files (sampling + column map + schema context);
+  2. upload through `POST /api/upload` and wait for the ingest job;
+  3. `run_agent` for each canned query, traced, sequentially (the first run is cold);
+  4. `POST /api/query` from concurrent clients through the Flask routes.
+
+It reports latency percentiles, throughput, peak RSS of the server process and its worker
+processes, and a per-stage breakdown from the instrumentation metrics. Results are written as
+JSON so runs can be compared across commits:
+
+    python benchmarks/e2e_benchmark.py --sizes 10000,100000,1000000 --output before.json
+    python benchmarks/e2e_benchmark.py --sizes 10000,100000,1000000 --baseline before.json
+    python benchmarks/e2e_benchmark.py --compare before.json after.json
+
+Comparisons exit with status 1 when a metric got worse by more than --threshold percent.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import resource
+import subprocess
+import multiprocessing as mp
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_data import generate_ndjson, zip_files
+from fake_llm import FakeLLMServer
+
+RESULTS_VERSION = 1
+QUERIES = [
+    "average co2 by room",
+    "hourly average temperature",
+    "which sensors raised the most alarm readings",
+    "humidity by room and status",
+    "show the raw rows",
+]
+# (path in a size's results, True if higher is better) for the comparison table.
+COMPARED_METRICS = [
+    (("schema", "p50_ms"), False),
+    (("ingest", "seconds"), False),
+    (("ingest", "rows_per_second"), True),
+    (("agent", "cold_ms"), False),
+    (("agent", "p50_ms"), False),
+    (("agent", "p95_ms"), False),
+    (("http", "throughput_rps"), True),
+    (("http", "p50_ms"), False),
+    (("http", "p95_ms"), False),
+    (("peak_rss_mb", "server"), False),
+    (("peak_rss_mb", "workers"), False),
+]
+
+
+def summarize(seconds: list) -> dict:
+    """Latency percentiles in milliseconds."""
+    if not seconds:
+        return {"count": 0}
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p90_ms": round(float(np.percentile(ms, 90)), 1),
+        "p95_ms": round(float(np.percentile(ms, 95)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+def _stage_totals() -> dict:
+    from app.services.instrumentation import metrics
+    return {key[0]: totals for key, totals in metrics.stage_seconds.totals().items()}
+
+
+def _stage_breakdown(before: dict, after: dict, prefixes: tuple, per: int = 1) -> dict:
+    """Milliseconds spent per stage between two snapshots, divided by `per` requests."""
+    breakdown = {}
+    for stage, (count, total) in sorted(after.items()):
+        if not stage.startswith(prefixes):
+            continue
+        count_before, total_before = before.get(stage, (0, 0.0))
+        if count > count_before:
+            breakdown[stage] = round((total - total_before) * 1000 / max(1, per), 2)
+    return breakdown
+
+
+def _benchmark_size(rows: int, options: dict) -> dict:
+    from app import create_app
+    from app.services.agent_service import run_agent
+    from app.services.schema_service import generate_intelligent_schema, schema_context_cache
+    from app.services.executor_service import executor_pool
+
+    app = create_app()
+    client = app.test_client()
+    result = {"rows": rows}
+
+    started = time.perf_counter()
+    paths = generate_ndjson('source', rows, options['files'], options['columns'], options['cardinality'])
+    result["ndjson_bytes"] = sum(os.path.getsize(path) for path in paths)
+    print(f"  generated {result['ndjson_bytes'] / 1024**2:.1f} MB of NDJSON in {time.perf_counter() - started:.1f}s")
+
+    # 1. Schema inference straight from the NDJSON files.
+    latencies = []
+    for i in range(options['schema_repeat']):
+        dataset_id = f"schema_benchmark_{i}"
+        os.makedirs(os.path.join('uploads', dataset_id), exist_ok=True)
+        started = time.perf_counter()
+        generate_intelligent_schema(paths, dataset_id)
+        latencies.append(time.perf_counter() - started)
+        shutil.rmtree(os.path.join('uploads', dataset_id))
+    result["schema"] = summarize(latencies)
+
+    # 2. Upload and ingest through the routes.
+    before = _stage_totals()
+    started = time.perf_counter()
+    response = client.post('/api/upload', data={'file': (zip_files(paths), 'benchmark.zip')},
+                           content_type='multipart/form-data')
+    if response.status_code != 202:
+        raise RuntimeError(f"Upload failed: {response.status_code} {response.get_json()}")
+    dataset_id = response.get_json()['dataset_id']
+    deadline = time.perf_counter() + options['ingest_timeout']
+    while True:
+        job = client.get(f'/api/datasets/{dataset_id}/status').get_json()
+        if job['status'] in ('done', 'failed') or time.perf_counter() > deadline:
+            break
+        time.sleep(0.05)
+    if job['status'] != 'done':
+        raise RuntimeError(f"Ingest did not finish: {job}")
+    seconds = time.perf_counter() - started
+    result["ingest"] = {
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds),
+        "mb_per_second": round(result["ndjson_bytes"] / 1024**2 / seconds, 1),
+        "stages_ms": _stage_breakdown(before, _stage_totals(), ('upload.', 'ingest.')),
+    }
+    print(f"  ingested in {seconds:.2f}s")
+
+    if options['engine'] != 'auto':
+        client.put(f'/api/datasets/{dataset_id}/engine', json={'engine': options['engine']})
+    result["engine"] = client.get(f'/api/datasets/{dataset_id}/engine').get_json().get('engine')
+
+    # 3. The agent, sequentially; the first query pays for loading the dataset and forking the executor.
+    schema_context = schema_context_cache.get(dataset_id)
+    latencies, stages, errors = [], {}, []
+    for i in range(options['agent_repeat'] * len(QUERIES)):
+        query = QUERIES[i % len(QUERIES)]
+        started = time.perf_counter()
+        answer = run_agent(dataset_id, query, schema_context, trace=True)
+        latencies.append(time.perf_counter() - started)
+        if answer['summary'].startswith("An error occurred"):
+            errors.append(f"{query}: {answer['summary']}")
+        for stage, ms in answer['trace']['by_stage'].items():
+            stages[stage] = stages.get(stage, 0.0) + ms
+    result["agent"] = {
+        "cold_ms": round(latencies[0] * 1000, 1),
+        **summarize(latencies[1:] or latencies),
+        "stages_ms": {stage: round(ms / len(latencies), 2) for stage, ms in sorted(stages.items())},
+        "errors": errors[:10],
+    }
+    print(f"  agent p50 {result['agent']['p50_ms']} ms")
+
+    # 4. Concurrent clients through the query route.
+    def request(i):
+        query = QUERIES[i % len(QUERIES)]
+        started = time.perf_counter()
+        response = app.test_client().post('/api/query', json={'dataset_id': dataset_id, 'query': query})
+        return time.perf_counter() - started, response.status_code
+
+    before = _stage_totals()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+        outcomes = list(pool.map(request, range(options['requests'])))
+    elapsed = time.perf_counter() - started
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    result["http"] = {
+        "requests": len(outcomes),
+        "concurrency": options['concurrency'],
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(outcomes) / elapsed, 2),
+        **summarize([seconds for seconds, status in outcomes if status == 200]),
+        "statuses": statuses,
+        "stages_ms": _stage_breakdown(before, _stage_totals(), ('node.', 'llm.', 'code.', 'chart.', 'result.',
+                                                                 'dataset.', 'response.'), per=len(outcomes)),
+    }
+    print(f"  http {result['http']['throughput_rps']} req/s, p95 {result['http'].get('p95_ms')} ms")
+
+    if executor_pool is not None:
+        executor_pool.shutdown()
+    result["peak_rss_mb"] = {
+        "server": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+    return result
+
+
+def _run_size(workdir: str, rows: int, options: dict, conn):
+    os.chdir(workdir)
+    try:
+        conn.send(_benchmark_size(rows, options))
+    except Exception as e:
+        conn.send({"rows": rows, "error": f"{type(e).__name__}: {e}"})
+
+
+def run_size(workdir: str, rows: int, options: dict) -> dict:
+    """Benchmarks one data size in a fresh process, so its peak RSS is its own."""
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    ctx = mp.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_size, args=(workdir, rows, options, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        outcome = parent_conn.recv()
+    except EOFError:
+        outcome = {"rows": rows, "error": "benchmark process died"}
+    process.join()
+    return outcome
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def _metric(size_result: dict, path: tuple):
+    value = size_result
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """Prints the change of every compared metric per data size. Returns the number of regressions."""
+    print(f"\nbaseline {baseline.get('commit') or '?'} ({baseline.get('created_at')}) -> "
+          f"current {current.get('commit') or '?'} ({current.get('created_at')})")
+    baseline_sizes = {entry['rows']: entry for entry in baseline.get('sizes', [])}
+    regressions = 0
+    print(f"{'rows':>10} {'metric':<26} {'baseline':>12} {'current':>12} {'change':>8}")
+    for entry in current.get('sizes', []):
+        before = baseline_sizes.get(entry['rows'])
+        if before is None:
+            continue
+        for path, higher_is_better in COMPARED_METRICS:
+            old, new = _metric(before, path), _metric(entry, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                flag = '  REGRESSION'
+                regressions += 1
+            elif -worse > threshold:
+                flag = '  improved'
+            print(f"{entry['rows']:>10} {'.'.join(path):<26} {old:>12g} {new:>12g} {change:>+7.1f}%{flag}")
+    print(f"\n{regressions} regression(s) beyond {threshold:g}%")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000', help="comma-separated row counts to benchmark")
+    parser.add_argument('--files', type=int, default=4, help="NDJSON files per dataset")
+    parser.add_argument('--columns', type=int, default=8, help="columns per file (at least 6)")
+    parser.add_argument('--cardinality', type=int, default=200, help="distinct sensor ids")
+    parser.add_argument('--engine', choices=('auto', 'pandas', 'duckdb'), default='auto')
+    parser.add_argument('--llm-latency-ms', type=float, default=50, help="simulated latency of every LLM call")
+    parser.add_argument('--schema-repeat', type=int, default=3)
+    parser.add_argument('--agent-repeat', type=int, default=4, help="sequential runs of each canned query")
+    parser.add_argument('--requests', type=int, default=50, help="requests sent to /api/query")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent /api/query clients")
+    parser.add_argument('--query-cache', action='store_true', help="keep the persistent query cache enabled")
+    parser.add_argument('--ingest-timeout', type=float, default=1800)
+    parser.add_argument('--workdir', default=os.path.join('benchmarks', '.e2e_data'))
+    parser.add_argument('--output', help="write the results as JSON to this path")
+    parser.add_argument('--baseline', help="compare this run with an earlier results file")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="only compare two results files")
+    parser.add_argument('--threshold', type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold) else 0)
+
+    server = FakeLLMServer(latency=args.llm_latency_ms / 1000).start()
+    # Inherited by the benchmark processes before they import the app.
+    os.environ.update({
+        'OPENAI_BASE_URL': server.url,
+        'OPENAI_API_KEY': 'benchmark',
+        'LANGCHAIN_TRACING_V2': 'false',
+        'LLM_REQUESTS_PER_MINUTE': '0',
+        'LLM_TOKENS_PER_MINUTE': '0',
+        'QUERY_CACHE_ENABLED': 'true' if args.query_cache else 'false',
+    })
+    options = {key: getattr(args, key) for key in ('files', 'columns', 'cardinality', 'engine', 'schema_repeat',
+                                                   'agent_repeat', 'requests', 'concurrency', 'ingest_timeout')}
+    results = {
+        "benchmark": "e2e",
+        "version": RESULTS_VERSION,
+        "commit": _git('rev-parse', '--short', 'HEAD') or None,
+        "dirty": bool(_git('status', '--porcelain', '--untracked-files=no')),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": dict(options, llm_latency_ms=args.llm_latency_ms, query_cache=args.query_cache),
+        "sizes": [],
+    }
+
+    workdir = os.path.abspath(args.workdir)
+    try:
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            print(f"Benchmarking {rows:,} rows ...")
+            outcome = run_size(os.path.join(workdir, str(rows)), rows, options)
+            if outcome.get('error'):
+                print(f"  failed: {outcome['error']}")
+            results["sizes"].append(outcome)
+    finally:
+        server.stop()
+
+    print(f"\n{'rows':>10} {'schema p50':>11} {'ingest s':>9} {'agent cold':>11} {'agent p50':>10} {'agent p95':>10} "
+          f"{'http req/s':>11} {'http p95':>9} {'RSS MB':>7} {'workers MB':>11}")
+    for entry in results["sizes"]:
+        if entry.get('error'):
+            print(f"{entry['rows']:>10}  {entry['error']}")
+            continue
+        print(f"{entry['rows']:>10} {entry['schema']['p50_ms']:>11} {entry['ingest']['seconds']:>9} "
+              f"{entry['agent']['cold_ms']:>11} {entry['agent']['p50_ms']:>10} {entry['agent']['p95_ms']:>10} "
+              f"{entry['http']['throughput_rps']:>11} {entry['http'].get('p95_ms', '-'):>9} "
+              f"{entry['peak_rss_mb']['server']:>7} {entry['peak_rss_mb']['workers']:>11}")
+        slowest = sorted(entry['agent']['stages_ms'].items(), key=lambda item: -item[1])[:6]
+        print(f"{'':>10} agent stages (ms/query): " + ", ".join(f"{stage} {ms:g}" for stage, ms in slowest))
+        for error in entry['agent']['errors']:
+            print(f"{'':>10} agent error: {error}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, results, args.threshold) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Compares the pandas and DuckDB query engines on a synthetic sensor dataset.
+
+The dataset is written straight into the columnar layout the ingest pipeline produces
+(`uploads/<id>/_columnar/*.parquet` plus `_manifest.json`), so no LLM or NDJSON
+conversion is involved. Every query runs in a fresh process per engine, so the pandas
+numbers include loading the files, as they would for a cold dataset, and peak RSS is
+measured per run.
+
+    python benchmarks/engine_benchmark.py --rows 200000000 --files 8 --memory-limit-mb 8192
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import multiprocessing as mp
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATASET_ID = 'engine_benchmark'
+ROOMS = ['Lobby', 'Lab', 'Office', 'Kitchen', 'Server Room', 'Meeting Room']
+STATUSES = ['ok', 'warn', 'alarm']
+
+QUERIES = {
+    "hourly_co2_by_room": {
+        "pandas": '''def analyze_data(dataframes):
+    df = pd.concat([d.assign(context=name) for name, d in dataframes.items()], ignore_index=True)
+    df["hour"] = df["timestamp"].dt.hour
+    out = df.groupby(["room", "hour"], observed=True)["co2_ppm"].mean().reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "hourly co2"}''',
+        "duckdb": '''def analyze_data(db):
+    union = " UNION ALL ".join(f'SELECT room, timestamp, co2_ppm FROM "{v}"' for v in db.views)
+    out = db.query(f"SELECT room, extract(hour FROM timestamp) AS hour, avg(co2_ppm) AS co2_ppm "
+                   f"FROM ({union}) GROUP BY ALL ORDER BY ALL")
+    return {"table": out.to_dict("records"), "summary_text": "hourly co2"}''',
+    },
+    "max_temperature_by_room": {
+        "pandas": '''def analyze_data(dataframes):
+    df = pd.concat(list(dataframes.values()), ignore_index=True)
+    out = df.groupby("room", observed=True)["temperature_c"].agg(["max", "std"]).reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "max temperature"}''',
+        "duckdb": '''def analyze_data(db):
+    union = " UNION ALL ".join(f'SELECT room, temperature_c FROM "{v}"' for v in db.views)
+    out = db.query(f"SELECT room, max(temperature_c) AS max, stddev_samp(temperature_c) AS std "
+                   f"FROM ({union}) GROUP BY room ORDER BY room")
+    return {"table": out.to_dict("records"), "summary_text": "max temperature"}''',
+    },
+    "daily_alarms": {
+        "pandas": '''def analyze_data(dataframes):
+    df = pd.concat(list(dataframes.values()), ignore_index=True)
+    alarms = df[df["status"] == "alarm"]
+    out = alarms.groupby(alarms["timestamp"].dt.date).size().reset_index(name="alarms")
+    return {"table": out.to_dict("records"), "summary_text": "daily alarms"}''',
+        "duckdb": '''def analyze_data(db):
+    union = " UNION ALL ".join(f'SELECT timestamp, status FROM "{v}"' for v in db.views)
+    out = db.query(f"SELECT CAST(timestamp AS DATE) AS timestamp, count(*) AS alarms "
+                   f"FROM ({union}) WHERE status = 'alarm' GROUP BY 1 ORDER BY 1")
+    return {"table": out.to_dict("records"), "summary_text": "daily alarms"}''',
+    },
+}
+
+
+def generate_dataset(workdir: str, rows: int, files: int, batch_rows: int = 2_000_000) -> int:
+    """Writes `rows` synthetic readings split over `files` Parquet files. Returns the bytes written."""
+    dataset_path = os.path.join(workdir, 'uploads', DATASET_ID)
+    columnar_path = os.path.join(dataset_path, '_columnar')
+    shutil.rmtree(dataset_path, ignore_errors=True)
+    os.makedirs(columnar_path)
+    rng = np.random.default_rng(42)
+    schema = pa.schema([
+        ('timestamp', pa.timestamp('ns', tz='UTC')),
+        ('room', pa.dictionary(pa.int32(), pa.string())),
+        ('co2_ppm', pa.float32()),
+        ('temperature_c', pa.float32()),
+        ('humidity', pa.float32()),
+        ('status', pa.dictionary(pa.int32(), pa.string())),
+    ])
+    manifest = {"format": "parquet", "files": {}}
+    start = np.datetime64('2024-01-01T00:00:00', 'ns')
+    per_file = rows // files
+    for i in range(files):
+        filename = f"sensor_data_{i:02d}.ndjson"
+        path = os.path.join(columnar_path, f"sensor_data_{i:02d}.parquet")
+        written = 0
+        with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+            while written < per_file:
+                n = min(batch_rows, per_file - written)
+                offsets = (np.arange(written, written + n) * 10).astype('timedelta64[s]')
+                writer.write_table(pa.Table.from_arrays([
+                    pa.array(start + offsets, type=schema.field('timestamp').type),
+                    pa.DictionaryArray.from_arrays(pa.array(rng.integers(0, len(ROOMS), n, dtype=np.int32)), ROOMS),
+                    pa.array(rng.normal(800, 150, n).astype(np.float32)),
+                    pa.array(rng.normal(22, 3, n).astype(np.float32)),
+                    pa.array(rng.uniform(20, 70, n).astype(np.float32)),
+                    pa.DictionaryArray.from_arrays(
+                        pa.array(rng.choice(len(STATUSES), n, p=[0.9, 0.08, 0.02]).astype(np.int32)), STATUSES),
+                ], schema=schema))
+                written += n
+        manifest["files"][filename] = {"rows": written, "bytes": os.path.getsize(path),
+                                       "dtypes": {f.name: str(f.type) for f in schema},
+                                       "path": os.path.basename(path)}
+        print(f"  wrote {filename}: {written:,} rows, {os.path.getsize(path) / 1024**2:.0f} MB")
+    with open(os.path.join(columnar_path, '_manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return sum(info["bytes"] for info in manifest["files"].values())
+
+
+def _run_one(workdir: str, engine: str, code: str, memory_limit_mb: int, conn):
+    os.chdir(workdir)
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    from app.services.executor_service import run_analysis_code
+    from app.services.result_service import prepare_result, serialize_table
+    started = time.perf_counter()
+    try:
+        result = serialize_table(prepare_result(run_analysis_code(DATASET_ID, code, engine)))
+        error = result.get('error')
+        rows = len(result.get('table') or [])
+    except MemoryError:
+        error, rows = "MemoryError", 0
+    conn.send({
+        "seconds": round(time.perf_counter() - started, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "rows": rows,
+        "error": error,
+    })
+
+
+def run_query(workdir: str, engine: str, code: str, memory_limit_mb: int) -> dict:
+    ctx = mp.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_one, args=(workdir, engine, code, memory_limit_mb, child_conn))
+    process.start()
+    child_conn.close()
+    try:
+        outcome = parent_conn.recv()
+    except EOFError:
+        outcome = {"seconds": None, "peak_rss_mb": None, "rows": 0, "error": "worker died"}
+    process.join()
+    if process.exitcode not in (0, None) and not outcome.get("error"):
+        outcome["error"] = f"exit code {process.exitcode}"
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000_000, help="synthetic readings to generate")
+    parser.add_argument('--files', type=int, default=6, help="number of dataset files")
+    parser.add_argument('--workdir', default=os.path.join('benchmarks', '.engine_data'))
+    parser.add_argument('--repeat', type=int, default=3, help="runs per query and engine; the median is reported")
+    parser.add_argument('--memory-limit-mb', type=int, default=0, help="address-space limit per run (0 = none)")
+    parser.add_argument('--reuse', action='store_true', help="reuse a dataset generated by an earlier run")
+    parser.add_argument('--output', help="write the results as JSON to this path")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    manifest_path = os.path.join(workdir, 'uploads', DATASET_ID, '_columnar', '_manifest.json')
+    if args.reuse and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            data_bytes = sum(info["bytes"] for info in json.load(f)["files"].values())
+    else:
+        print(f"Generating {args.rows:,} rows in {args.files} files under {workdir} ...")
+        data_bytes = generate_dataset(workdir, args.rows, args.files)
+    in_memory_mb = args.rows * (8 + 4 + 4 * 3 + 4) / 1024**2
+    print(f"Columnar data: {data_bytes / 1024**2:.0f} MB on disk, ~{in_memory_mb:.0f} MB as DataFrames\n")
+
+    results = {"rows": args.rows, "files": args.files, "columnar_bytes": data_bytes,
+               "memory_limit_mb": args.memory_limit_mb, "queries": {}}
+    print(f"{'query':<26} {'engine':<7} {'median s':>9} {'peak RSS MB':>12} {'rows':>6}  error")
+    for name, variants in QUERIES.items():
+        results["queries"][name] = {}
+        for engine, code in variants.items():
+            runs = [run_query(workdir, engine, code, args.memory_limit_mb) for _ in range(args.repeat)]
+            ok = [r for r in runs if not r["error"]]
+            summary = {
+                "median_seconds": float(np.median([r["seconds"] for r in ok])) if ok else None,
+                "peak_rss_mb": max(r["peak_rss_mb"] for r in ok) if ok else None,
+                "rows": ok[0]["rows"] if ok else 0,
+                "errors": [r["error"] for r in runs if r["error"]],
+            }
+            results["queries"][name][engine] = summary
+            median = f"{summary['median_seconds']:.2f}" if ok else "-"
+            rss = f"{summary['peak_rss_mb']:.0f}" if ok else "-"
+            print(f"{name:<26} {engine:<7} {median:>9} {rss:>12} {summary['rows']:>6}  {'; '.join(summary['errors'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
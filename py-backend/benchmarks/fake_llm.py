@@ -0,0 +1,185 @@
+"""
+Deterministic stand-in for the OpenAI chat completions API, so the benchmarks run offline
+through the real LLM gateway (pooled client, buckets, retries). Point the app at it with
+`OPENAI_BASE_URL=<server.url>`. Replies are canned by prompt: column maps, schema contexts,
+intents, `analyze_data` code for both engines, chart functions and chat replies, each after
+a fixed simulated latency. Streaming requests are answered as server-sent events. Rate limits
+and server errors can be injected with `fail_next`.
+"""
+import re
+import json
+import time
+import threading
+from collections import deque
+from typing import Optional
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CHARS_PER_TOKEN = 4
+
+# Canned analyses by keyword of the user query: (pandas code, DuckDB code).
+ANALYSES = {
+    'co2': ('''def analyze_data(dataframes, combined):
+    out = combined.groupby("context", observed=True)["co2_ppm"].mean().reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "Average CO2 per room."}''',
+            '''def analyze_data(db):
+    out = db.query(f'SELECT context, avg(co2_ppm) AS co2_ppm FROM "{db.combined_view}" GROUP BY 1 ORDER BY 1')
+    return {"table": out.to_dict("records"), "summary_text": "Average CO2 per room."}'''),
+    'hourly': ('''def analyze_data(dataframes, combined):
+    hours = pd.to_datetime(combined["timestamp"]).dt.hour
+    out = combined["temperature_c"].groupby(hours).mean().rename_axis("hour").reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "Average temperature by hour."}''',
+               '''def analyze_data(db):
+    out = db.query(f'SELECT extract(hour FROM CAST(timestamp AS TIMESTAMP)) AS hour, avg(temperature_c) AS temperature_c '
+                   f'FROM "{db.combined_view}" GROUP BY 1 ORDER BY 1')
+    return {"table": out.to_dict("records"), "summary_text": "Average temperature by hour."}'''),
+    'alarm': ('''def analyze_data(dataframes, combined):
+    alarms = combined[combined["status"] == "alarm"]
+    out = alarms.groupby("sensor_id", observed=True).size().nlargest(20).rename("alarms").reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "Sensors with the most alarms."}''',
+              '''def analyze_data(db):
+    out = db.query(f'SELECT sensor_id, count(*) AS alarms FROM "{db.combined_view}" WHERE status = \\'alarm\\' '
+                   f'GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT 20')
+    return {"table": out.to_dict("records"), "summary_text": "Sensors with the most alarms."}'''),
+    'humidity': ('''def analyze_data(dataframes, combined):
+    out = combined.groupby(["context", "status"], observed=True)["humidity"].agg(["mean", "std"]).reset_index()
+    return {"table": out.to_dict("records"), "summary_text": "Humidity by room and status."}''',
+                 '''def analyze_data(db):
+    out = db.query(f'SELECT context, status, avg(humidity) AS mean, stddev_samp(humidity) AS std '
+                   f'FROM "{db.combined_view}" GROUP BY ALL ORDER BY ALL')
+    return {"table": out.to_dict("records"), "summary_text": "Humidity by room and status."}'''),
+    'rows': ('''def analyze_data(dataframes, combined):
+    out = combined.head(20000)
+    return {"table": out.to_dict("records"), "summary_text": "Raw readings."}''',
+             '''def analyze_data(db):
+    out = db.query(f'SELECT * FROM "{db.combined_view}" LIMIT 20000')
+    return {"table": out.to_dict("records"), "summary_text": "Raw readings."}'''),
+}
+DEFAULT_ANALYSIS = 'co2'
+
+CHART_CODE = '''import pandas as pd
+import plotly.graph_objects as go
+def generate_plot(data):
+    df = pd.DataFrame(data)
+    return go.Figure(go.Bar(x=df[df.columns[0]], y=df[df.columns[-1]]), layout={"title": "Result"})'''
+
+
+def snake_case(name: str) -> str:
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+def reply_for(messages: list) -> str:
+    """The canned reply to a chat completion request."""
+    prompt = "\n".join(str(message.get('content')) for message in messages)
+    query = prompt.rsplit('User Query:', 1)[-1].strip().lower() if 'User Query:' in prompt else ''
+    if 'snake_case' in prompt:
+        columns = set()
+        for listed in re.findall(r'"original_columns": \[(.*?)\]', prompt, re.S):
+            columns.update(json.loads(f"[{listed}]"))
+        return json.dumps({column: snake_case(column) for column in sorted(columns)})
+    if 'senior data analyst' in prompt:
+        columns = sorted(set(re.findall(r'"cleaned_columns": \[(.*?)\]', prompt, re.S)))
+        names = sorted({name for listed in columns for name in json.loads(f"[{listed}]")})
+        return ("Synthetic sensor readings, one file per room. Columns: "
+                + ", ".join(f"`{name}`" for name in names) + ".")
+    if 'classify the user' in prompt:
+        return 'GENERAL_CONVERSATION' if query in ('hi', 'hello', 'thanks') else 'DATA_ANALYSIS_REQUEST'
+    if 'generate_plot' in prompt:
+        return CHART_CODE
+    if 'analyze_data' in prompt:
+        keyword = next((keyword for keyword in ANALYSES if keyword in query), DEFAULT_ANALYSIS)
+        pandas_code, sql_code = ANALYSES[keyword]
+        return sql_code if 'analyze_data(db' in prompt else pandas_code
+    return "Hello! Upload a dataset and ask me anything about it."
+
+
+class FakeLLMServer:
+    """An OpenAI-compatible chat completions server on a local port, answering after `latency` seconds."""
+
+    def __init__(self, latency: float = 0.0, port: int = 0):
+        self.latency = latency
+        self.requests = 0
+        self._failures = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def start(self) -> 'FakeLLMServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, count: int, status: int = 429, retry_after: Optional[float] = None):
+        """Answers the next `count` requests with HTTP `status`, optionally with a Retry-After header."""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, content_type: str, body: bytes = b'', chunked: bool = False,
+                      headers: Optional[dict] = None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if chunked:
+                    self.send_header('Transfer-Encoding', 'chunked')
+                else:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def _chunk(self, text: str):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.requests += 1
+                    failure = server._failures.popleft() if server._failures else None
+                time.sleep(server.latency)
+                if failure is not None:
+                    status, retry_after = failure
+                    body = json.dumps({"error": {"message": f"Injected failure {status}", "type": "server_error"}})
+                    headers = {'Retry-After': f"{retry_after:g}"} if retry_after is not None else None
+                    self._send(status, 'application/json', body.encode('utf-8'), headers=headers)
+                    return
+                reply = reply_for(request.get('messages', []))
+                model = request.get('model', 'fake')
+                if request.get('stream'):
+                    self._send(200, 'text/event-stream', chunked=True)
+                    for word in re.findall(r'\S+\s*', reply):
+                        self._chunk("data: " + json.dumps({
+                            "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                            "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}],
+                        }) + "\n\n")
+                    self._chunk("data: [DONE]\n\n")
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                prompt_chars = sum(len(str(message.get('content'))) for message in request.get('messages', []))
+                self._send(200, 'application/json', json.dumps({
+                    "id": "fake", "object": "chat.completion", "created": 0, "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_chars // CHARS_PER_TOKEN,
+                              "completion_tokens": len(reply) // CHARS_PER_TOKEN,
+                              "total_tokens": (prompt_chars + len(reply)) // CHARS_PER_TOKEN},
+                }).encode('utf-8'))
+
+        return Handler
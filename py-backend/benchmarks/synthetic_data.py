@@ -0,0 +1,84 @@
+"""
+Synthetic NDJSON sensor datasets for the benchmarks, in the shape users upload: one
+`sensor_data_<Room>.ndjson` file per room with a timestamp, a sensor id, a status and
+numeric readings. Output is deterministic for a given seed.
+
+    python benchmarks/synthetic_data.py --rows 1000000 --files 4 --columns 12 --cardinality 500 out/
+"""
+import os
+import io
+import sys
+import argparse
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+STATUSES = ['ok', 'warn', 'alarm']
+# Columns every file has; `columns` beyond these are filled with extra `Metric N` readings.
+BASE_COLUMNS = ['timestamp', 'Sensor ID', 'Status', 'CO2 (ppm)', 'Temperature C', 'Humidity %']
+CHUNK_ROWS = 200_000
+
+
+def _chunk(rng, start_row: int, n: int, columns: int, cardinality: int) -> pd.DataFrame:
+    start = np.datetime64('2024-01-01T00:00:00', 's')
+    frame = pd.DataFrame({
+        'timestamp': np.datetime_as_string(start + np.arange(start_row, start_row + n) * 10, unit='s'),
+        'Sensor ID': np.char.add('S-', rng.integers(0, cardinality, n).astype(str)),
+        'Status': np.array(STATUSES)[rng.choice(len(STATUSES), n, p=[0.9, 0.08, 0.02])],
+        'CO2 (ppm)': rng.normal(800, 150, n).round(1),
+        'Temperature C': rng.normal(22, 3, n).round(2),
+        'Humidity %': rng.uniform(20, 70, n).round(1),
+    })
+    for i in range(max(0, columns - len(BASE_COLUMNS))):
+        frame[f'Metric {i + 1}'] = rng.normal(100, 25, n).round(3)
+    return frame
+
+
+def generate_ndjson(folder: str, rows: int, files: int = 4, columns: int = len(BASE_COLUMNS),
+                    cardinality: int = 100, seed: int = 42) -> list[str]:
+    """
+    Writes `rows` readings spread over `files` NDJSON files in `folder`, each with `columns`
+    columns and `cardinality` distinct sensor ids. Returns the file paths.
+    """
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(folder, f"sensor_data_Room {i + 1}.ndjson")
+        per_file = rows // files + (1 if i < rows % files else 0)
+        with open(path, 'w', encoding='utf-8') as f:
+            for start_row in range(0, per_file, CHUNK_ROWS):
+                n = min(CHUNK_ROWS, per_file - start_row)
+                lines = _chunk(rng, start_row, n, columns, cardinality).to_json(orient='records', lines=True)
+                f.write(lines if lines.endswith('\n') else lines + '\n')
+        paths.append(path)
+    return paths
+
+
+def zip_files(paths: list[str]) -> io.BytesIO:
+    """The files as an in-memory zip, ready to post to the upload endpoint."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for path in paths:
+            archive.write(path, os.path.basename(path))
+    buffer.seek(0)
+    return buffer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('folder')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--columns', type=int, default=len(BASE_COLUMNS))
+    parser.add_argument('--cardinality', type=int, default=100, help="distinct sensor ids")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    paths = generate_ndjson(args.folder, args.rows, args.files, args.columns, args.cardinality, args.seed)
+    total = sum(os.path.getsize(path) for path in paths)
+    print(f"Wrote {len(paths)} files, {args.rows:,} rows, {total / 1024**2:.1f} MB to {args.folder}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
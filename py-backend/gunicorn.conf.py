@@ -0,0 +1,17 @@
+import os
+
+# Threaded workers: a query holds a thread while it waits on the LLM but little CPU, so each
+# process serves many queries at once. Admission control (QUERY_MAX_IN_FLIGHT and
+# QUERY_QUEUE_MAX_DEPTH) applies per worker process, so keep threads above their sum.
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 96))
+
+# Streamed queries keep their connection open until the answer is complete.
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 300))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 60))
+keepalive = 5
+
+# The app is created in each worker: ingest jobs, SQLite connections and the executor pool are per process.
+preload_app = False
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'benchmarks'))
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from synthetic_data import BASE_COLUMNS, generate_ndjson, zip_files  # noqa: E402
+from fake_llm import FakeLLMServer, snake_case  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def workdir(tmp_path_factory):
+    """Runs the tests in a scratch directory, since uploads, caches and results live in relative folders."""
+    path = tmp_path_factory.mktemp('work')
+    previous = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(previous)
+
+
+@pytest.fixture
+def sensor_files(tmp_path):
+    """Four synthetic NDJSON sensor files with 2,000 readings in total."""
+    return generate_ndjson(str(tmp_path / 'raw'), rows=2000, files=4, cardinality=20)
+
+
+@pytest.fixture
+def make_dataset(tmp_path):
+    """
+    Factory for uploaded datasets: writes synthetic NDJSON files, a column map and their columnar
+    conversion to a new folder under UPLOADS_FOLDER, as after an upload. Returns the dataset path.
+    """
+    from app.config import Config
+    from app.services.ingest_service import COLUMN_MAP_FILENAME, convert_dataset
+
+    def make(rows: int = 2000, files: int = 4, seed: int = 42) -> str:
+        dataset_path = os.path.join(Config.UPLOADS_FOLDER, uuid.uuid4().hex)
+        os.makedirs(dataset_path)
+        paths = generate_ndjson(str(tmp_path / f'raw-{os.path.basename(dataset_path)}'), rows=rows, files=files,
+                                cardinality=20, seed=seed)
+        with open(os.path.join(dataset_path, COLUMN_MAP_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump({column: snake_case(column) for column in BASE_COLUMNS}, f)
+        convert_dataset(dataset_path, paths)
+        return dataset_path
+
+    return make
+
+
+@pytest.fixture
+def sensor_dataset(make_dataset):
+    return make_dataset()
+
+
+@pytest.fixture
+def fake_llm():
+    """A local OpenAI-compatible server with canned replies; set `latency` or call `fail_next` to shape it."""
+    server = FakeLLMServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def app(fake_llm, monkeypatch):
+    """The Flask app with every LLM call going to `fake_llm`."""
+    from app import create_app
+    from app.services.llm_gateway import llm_gateway
+
+    monkeypatch.setattr(llm_gateway, 'base_url', fake_llm.url)
+    llm_gateway._reset()
+    flask_app = create_app()
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    llm_gateway._reset()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def upload(client):
+    """Factory that uploads NDJSON files through `POST /api/upload` and waits for ingest. Returns the dataset id."""
+    def upload_files(paths: list[str]) -> str:
+        response = client.post('/api/upload', data={'file': (zip_files(paths), 'sensors.zip')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 202, response.get_json()
+        dataset_id = response.get_json()['dataset_id']
+        deadline = time.monotonic() + 60
+        while True:
+            job = client.get(f'/api/datasets/{dataset_id}/status').get_json()
+            if job['status'] in ('done', 'failed') or time.monotonic() > deadline:
+                break
+            time.sleep(0.05)
+        assert job['status'] == 'done', job
+        return dataset_id
+
+    return upload_files
+
+
+@pytest.fixture
+def uploaded_dataset(upload, sensor_files):
+    """The synthetic sensor files, uploaded and ingested."""
+    return upload(sensor_files)
@@ -0,0 +1,142 @@
+import time
+import threading
+
+import pytest
+
+from app import admission
+from app.admission import AdmissionController, AdmissionRejected
+from app.services.stage_limits import StageLimiter
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def admit_in_thread(controller: AdmissionController) -> dict:
+    outcome = {}
+
+    def run():
+        try:
+            outcome['ticket'] = controller.admit()
+        except AdmissionRejected as e:
+            outcome['rejected'] = e
+
+    outcome['thread'] = threading.Thread(target=run)
+    outcome['thread'].start()
+    return outcome
+
+
+def test_queued_request_runs_when_a_slot_frees():
+    controller = AdmissionController(max_in_flight=1, max_queue_depth=1, queue_timeout=5)
+    first = controller.admit()
+    waiting = admit_in_thread(controller)
+    wait_for(lambda: controller.queued == 1)
+
+    with pytest.raises(AdmissionRejected) as full:
+        controller.admit()
+    assert full.value.status == 429 and full.value.retry_after >= 1
+
+    time.sleep(0.05)
+    first.release()
+    waiting['thread'].join()
+    assert waiting['ticket'].wait_seconds >= 0.05
+    assert controller.stats()['in_flight'] == 1
+    waiting['ticket'].release()
+    stats = controller.stats()
+    assert (stats['in_flight'], stats['queued'], stats['admitted'], stats['rejected_queue_full']) == (0, 0, 2, 1)
+
+
+def test_queued_request_times_out():
+    controller = AdmissionController(max_in_flight=1, max_queue_depth=4, queue_timeout=0.1)
+    ticket = controller.admit()
+    started = time.perf_counter()
+    with pytest.raises(AdmissionRejected) as timed_out:
+        controller.admit()
+    assert timed_out.value.status == 503
+    assert time.perf_counter() - started >= 0.1
+    assert controller.queued == 0
+    ticket.release()
+    assert controller.stats()['rejected_queue_timeout'] == 1
+
+
+def test_retry_after_follows_service_time_and_queue():
+    controller = AdmissionController(max_in_flight=2, max_queue_depth=8, queue_timeout=5)
+    controller.service_seconds = 4.0
+    assert controller._retry_after() == 2
+    controller.queued = 3
+    assert controller._retry_after() == 8
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController(max_in_flight=1, max_queue_depth=0, queue_timeout=1)
+    ticket = controller.admit()
+    ticket.release()
+    ticket.release()
+    assert controller.in_flight == 0
+    controller.admit().release()
+
+
+def test_stage_limiter_bounds_concurrency():
+    limiter = StageLimiter('test', 2)
+    peak, lock = [0], threading.Lock()
+
+    def work():
+        with limiter.slot():
+            with lock:
+                peak[0] = max(peak[0], limiter.active)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    stats = limiter.stats()
+    assert (stats['active'], stats['waiting'], stats['entered']) == (0, 0, 8)
+    assert stats['max_wait_ms'] > 0
+
+
+@pytest.fixture
+def tight_admission(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_queue_depth=0, queue_timeout=0.05)
+    monkeypatch.setattr(admission, 'query_admission', controller)
+    return controller
+
+
+def test_route_rejects_with_retry_after_when_full(client, uploaded_dataset, tight_admission):
+    ticket = tight_admission.admit()
+    response = client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": "average co2 per room"})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['retry_after'] == int(response.headers['Retry-After'])
+    ticket.release()
+
+    admitted = client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": "average co2 per room"})
+    assert admitted.status_code == 200
+    assert float(admitted.headers['X-Queue-Wait-Ms']) >= 0
+    assert tight_admission.in_flight == 0
+
+
+def test_route_times_out_queued_requests(client, uploaded_dataset, tight_admission):
+    tight_admission.max_queue_depth = 1
+    ticket = tight_admission.admit()
+    response = client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": "average co2 per room"})
+    ticket.release()
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+
+def test_streamed_response_holds_its_slot_until_closed(client, uploaded_dataset, tight_admission):
+    response = client.post('/api/query/stream', json={"dataset_id": uploaded_dataset, "query": "hello"},
+                           buffered=False)
+    assert response.status_code == 200
+    assert tight_admission.in_flight == 1
+    assert client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": "hello"}).status_code == 429
+
+    response.get_data()
+    response.close()
+    assert tight_admission.in_flight == 0
@@ -0,0 +1,87 @@
+import os
+import gzip
+import time
+import hashlib
+
+import pytest
+
+from app.services.chart_store import ChartStore, MIN_COMPRESS_BYTES, chart_store
+
+
+def chart_html(n: int) -> str:
+    return f"<div>chart {n}</div>" + "<script>" + "x" * (MIN_COMPRESS_BYTES * 2) + f"{n}</script>"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChartStore(str(tmp_path / 'charts'), max_bytes=10**9, max_age_seconds=3600, prune_interval=3600)
+
+
+def test_identical_charts_share_one_file(store):
+    first = store.save(chart_html(1), 'html')
+    second = store.save(chart_html(1), 'html')
+
+    assert first == second == f"{hashlib.sha256(chart_html(1).encode()).hexdigest()}.html"
+    assert (store.writes, store.dedup_hits) == (1, 1)
+    assert store.save(chart_html(2), 'html') != first
+    assert store.writes == 2
+
+
+def test_large_charts_are_precompressed(store):
+    large = store.save(chart_html(1), 'html')
+    small = store.save('{"data": []}', 'json')
+
+    with open(os.path.join(store.folder, large + '.gz'), 'rb') as f:
+        assert gzip.decompress(f.read()).decode() == chart_html(1)
+    assert not os.path.exists(os.path.join(store.folder, small + '.gz'))
+    assert store.variant_for(large, 'gzip, deflate') == ('gzip', large + '.gz')
+    assert store.variant_for(large, 'identity') is None
+    assert store.variant_for(small, 'gzip') is None
+
+
+def test_prune_removes_expired_charts_with_their_variants(store):
+    old = store.save(chart_html(1), 'html')
+    fresh = store.save(chart_html(2), 'html')
+    an_hour_ago = time.time() - 7200
+    os.utime(os.path.join(store.folder, old), (an_hour_ago, an_hour_ago))
+
+    assert store.prune() == 1
+    assert not any(name.startswith(old) for name in os.listdir(store.folder))
+    assert os.path.exists(os.path.join(store.folder, fresh))
+
+
+def test_prune_evicts_least_recently_used_over_budget(store):
+    names = []
+    for n in range(4):
+        names.append(store.save(chart_html(n), 'html'))
+        stamp = time.time() - 100 + n
+        os.utime(os.path.join(store.folder, names[-1]), (stamp, stamp))
+    chart_bytes = sum(os.path.getsize(os.path.join(store.folder, name)) for name in os.listdir(store.folder)
+                      if name.startswith(names[0]))
+    store.max_bytes = chart_bytes * 2
+
+    store.save(chart_html(0), 'html')  # reuse refreshes the oldest chart
+    assert store.prune() == 2
+    remaining = {name for name in os.listdir(store.folder) if name.endswith('.html')}
+    assert remaining == {names[0], names[3]}
+
+
+def test_route_serves_immutable_compressed_charts(client):
+    filename = chart_store.save(chart_html(7), 'html')
+    etag = filename.split('.')[0]
+
+    plain = client.get(f'/visualizations/{filename}')
+    assert plain.status_code == 200
+    assert plain.mimetype == 'text/html'
+    assert plain.get_data(as_text=True) == chart_html(7)
+    assert plain.headers['ETag'] == f'"{etag}"'
+    assert 'immutable' in plain.headers['Cache-Control']
+    assert plain.headers['Vary'] == 'Accept-Encoding'
+
+    compressed = client.get(f'/visualizations/{filename}', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.get_data()).decode() == chart_html(7)
+
+    revalidated = client.get(f'/visualizations/{filename}', headers={'If-None-Match': f'"{etag}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+import pytest
+
+from app.services.dataframe_cache import DataFrameCache
+
+
+def test_hits_misses_and_fingerprint_revalidation(sensor_dataset):
+    dataset_id = os.path.basename(sensor_dataset)
+    cache = DataFrameCache(max_bytes=1024**3)
+    cache.get(dataset_id)
+    cache.get(dataset_id)
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+    manifest_path = os.path.join(sensor_dataset, '_columnar', '_manifest.json')
+    stat = os.stat(manifest_path)
+    os.utime(manifest_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    cache.get(dataset_id)
+    assert cache.stats()['misses'] == 2
+
+
+def test_least_recently_used_dataset_is_evicted(make_dataset):
+    first, second = (os.path.basename(make_dataset(seed=seed)) for seed in (1, 2))
+    cache = DataFrameCache(max_bytes=1024**3)
+    cache.get(first)
+    one_dataset = cache.stats()['bytes']
+    cache.max_bytes = int(one_dataset * 1.5)
+    cache.get(second)
+    assert cache.stats()['entries'] == 1
+    assert cache.stats()['evictions'] == 1
+    assert list(cache.fingerprints()) == [second]
+
+
+@pytest.mark.parametrize('copy_on_write', [True, False])
+def test_writes_by_one_query_do_not_reach_the_next(sensor_dataset, copy_on_write):
+    dataset_id = os.path.basename(sensor_dataset)
+    cache = DataFrameCache(max_bytes=1024**3)
+    with pd.option_context('mode.copy_on_write', copy_on_write):
+        original = cache.get(dataset_id)['combined']['co2_ppm'].copy()
+        dataset = cache.get(dataset_id)
+        dataset['combined'].loc[:, 'co2_ppm'] = 0
+        dataset['combined'].drop(columns=['status'], inplace=True)
+        next(iter(dataset['frames'].values())).loc[:, 'co2_ppm'] = 0
+        again = cache.get(dataset_id)
+    assert again['combined']['co2_ppm'].equals(original)
+    assert 'status' in again['combined'].columns
+    assert (next(iter(again['frames'].values()))['co2_ppm'] != 0).any()
@@ -0,0 +1,134 @@
+import os
+import signal
+import threading
+
+import pytest
+
+from app.services.executor_service import ExecutorPool
+
+PID_CODE = '''def analyze_data(dataframes, combined):
+    import os
+    return {"table": [{"pid": os.getpid(), "rows": len(combined)}], "summary_text": "ok"}'''
+
+PARENT_CODE = '''def analyze_data(dataframes):
+    import os
+    return {"table": [{"parent": os.getppid()}], "summary_text": "ok"}'''
+
+LOCK_CODE = '''def analyze_data(dataframes):
+    from tests.test_executor_pool import HELD_BY_A_REQUEST_THREAD
+    return {"table": [{"acquired": HELD_BY_A_REQUEST_THREAD.acquire(timeout=2)}], "summary_text": "ok"}'''
+HELD_BY_A_REQUEST_THREAD = threading.Lock()
+
+
+@pytest.fixture
+def dataset_id(sensor_dataset):
+    return os.path.basename(sensor_dataset)
+
+
+@pytest.fixture
+def pool(dataset_id):
+    pool = ExecutorPool(size=1, timeout=10, memory_limit_bytes=256 * 1024**2)
+    pool.start([dataset_id])
+    yield pool
+    pool.shutdown()
+
+
+def _worker_pid(pool, dataset_id) -> int:
+    result = pool.run(dataset_id, PID_CODE)
+    assert 'error' not in result, result
+    assert result['table']['rows'][0] == 2000
+    return int(result['table']['pid'][0])
+
+
+def _assert_fresh_worker(pool, dataset_id, previous_pid):
+    assert _worker_pid(pool, dataset_id) != previous_pid
+
+
+def test_runs_code_and_reuses_the_worker(pool, dataset_id):
+    pid = _worker_pid(pool, dataset_id)
+    assert _worker_pid(pool, dataset_id) == pid
+
+
+def test_timeout_kills_the_worker(pool, dataset_id):
+    pid = _worker_pid(pool, dataset_id)
+    result = pool.run(dataset_id, "def analyze_data(dataframes):\n    while True:\n        pass", timeout=1)
+    assert result['error'] == "Execution timed out after 1 seconds."
+    _assert_fresh_worker(pool, dataset_id, pid)
+
+
+def test_out_of_memory_replaces_the_worker(pool, dataset_id):
+    pid = _worker_pid(pool, dataset_id)
+    result = pool.run(dataset_id, "def analyze_data(dataframes):\n    return bytearray(2 * 1024**3)")
+    assert result['error'] == "Execution ran out of memory (limit 256 MB)."
+    _assert_fresh_worker(pool, dataset_id, pid)
+
+
+@pytest.mark.parametrize('code, message', [
+    ("def analyze_data(dataframes):\n    import os\n    os._exit(3)", "exit code 3"),
+    ("def analyze_data(dataframes):\n    import os\n    os.kill(os.getpid(), 9)", "probably killed for using too much memory"),
+])
+def test_crashed_worker_is_replaced(pool, dataset_id, code, message):
+    pid = _worker_pid(pool, dataset_id)
+    result = pool.run(dataset_id, code)
+    assert "Execution worker crashed" in result['error'] and message in result['error']
+    _assert_fresh_worker(pool, dataset_id, pid)
+
+
+def test_worker_that_died_while_idle_is_not_reused(pool, dataset_id):
+    pid = _worker_pid(pool, dataset_id)
+    os.kill(pid, signal.SIGKILL)
+    assert pool._idle.queue[0].conn.poll(5)
+    _assert_fresh_worker(pool, dataset_id, pid)
+
+
+def test_broken_pipe_on_send_replaces_the_worker(pool, dataset_id, monkeypatch):
+    pid = _worker_pid(pool, dataset_id)
+    worker = pool._idle.get()
+    os.kill(worker.pid, signal.SIGKILL)
+    assert worker.conn.poll(5)
+    # Dies after the liveness check, so the send itself fails.
+    monkeypatch.setattr(worker, 'is_alive', lambda: True)
+    pool._idle.put(worker)
+    result = pool.run(dataset_id, PID_CODE)
+    assert "Execution worker crashed" in result['error']
+    _assert_fresh_worker(pool, dataset_id, pid)
+
+
+def test_workers_are_forked_by_the_zygote(pool, dataset_id):
+    result = pool.run(dataset_id, PARENT_CODE)
+    assert int(result['table']['parent'][0]) == pool._zygote.pid != os.getpid()
+    assert pool._idle.queue[0].inherited.keys() == {dataset_id}
+
+
+def test_replacement_workers_do_not_inherit_locks_of_web_threads(pool, dataset_id):
+    release = threading.Event()
+
+    def request_thread():
+        with HELD_BY_A_REQUEST_THREAD:
+            release.wait()
+
+    thread = threading.Thread(target=request_thread)
+    thread.start()
+    try:
+        pool.run(dataset_id, "def analyze_data(dataframes):\n    import os\n    os._exit(3)")
+        result = pool.run(dataset_id, LOCK_CODE)
+    finally:
+        release.set()
+        thread.join()
+    assert result['table']['acquired'][0]
+
+
+def test_shared_dataset_refreshes_idle_workers(pool, make_dataset):
+    other_id = os.path.basename(make_dataset(rows=400, files=2))
+    pool.share(other_id)
+    assert other_id in pool._idle.queue[0].inherited
+    assert pool.run(other_id, PID_CODE)['table']['rows'][0] == 400
+
+
+def test_dead_zygote_is_restarted(pool, dataset_id):
+    pid = _worker_pid(pool, dataset_id)
+    old_zygote = pool._zygote.pid
+    os.kill(old_zygote, signal.SIGKILL)
+    pool.run(dataset_id, "def analyze_data(dataframes):\n    import os\n    os._exit(3)")
+    assert pool._zygote.pid != old_zygote
+    _assert_fresh_worker(pool, dataset_id, pid)
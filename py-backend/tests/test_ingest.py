@@ -0,0 +1,74 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from synthetic_data import generate_ndjson
+
+from app.services.ingest_service import convert_ndjson, load_dataset, read_manifest
+
+
+def _convert(tmp_path, records):
+    source = tmp_path / 'data.ndjson'
+    source.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    dest = tmp_path / 'data.parquet'
+    info = convert_ndjson(str(source), str(dest), {})
+    return info, pq.read_table(dest)
+
+
+def test_integer_ids_with_nulls_stay_exact_integers(tmp_path):
+    info, table = _convert(tmp_path, [{"id": 16777217}, {"id": None}, {"id": 5}])
+    assert pa.types.is_integer(table.schema.field('id').type)
+    assert table.column('id').to_pylist() == [16777217, None, 5]
+
+
+def test_epoch_seconds_are_not_downcast(tmp_path):
+    info, table = _convert(tmp_path, [{"ts": 1700000000.123}, {"ts": 1700000001.5}])
+    assert table.schema.field('ts').type == pa.float64()
+    assert table.column('ts').to_pylist() == [1700000000.123, 1700000001.5]
+
+
+def test_floats_are_downcast_only_when_exact(tmp_path):
+    info, table = _convert(tmp_path, [{"exact": 0.5, "decimal": 812.3}, {"exact": None, "decimal": 790.1},
+                                      {"exact": 1.25, "decimal": None}])
+    assert table.schema.field('exact').type == pa.float32()
+    assert table.schema.field('decimal').type == pa.float64()
+    assert table.column('decimal').to_pylist() == [812.3, 790.1, None]
+
+
+def test_nullable_booleans_and_strings(tmp_path):
+    info, table = _convert(tmp_path, [{"flag": True, "name": "a"}, {"flag": None, "name": None}, {"flag": False, "name": "b"}])
+    assert table.schema.field('flag').type == pa.bool_()
+    assert table.column('flag').to_pylist() == [True, None, False]
+    assert table.column('name').to_pylist() == ["a", None, "b"]
+
+
+def test_chunked_conversion_merges_column_statistics(tmp_path):
+    source = tmp_path / 'data.ndjson'
+    records = [{"n": i} for i in range(10)] + [{"n": 2.5}, {"n": None}]
+    source.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    info = convert_ndjson(str(source), str(tmp_path / 'data.parquet'), {}, chunk_rows=4)
+    assert info["rows"] == 12
+    assert info["dtypes"]["n"] == 'float'
+    assert pq.read_table(tmp_path / 'data.parquet').column('n').to_pylist() == list(range(10)) + [2.5, None]
+
+
+def test_converted_dataset_matches_the_ndjson(tmp_path, make_dataset):
+    sensor_dataset = make_dataset(seed=7)
+    sensor_files = generate_ndjson(str(tmp_path / 'expected'), rows=2000, files=4, cardinality=20, seed=7)
+    manifest = read_manifest(sensor_dataset)
+    assert len(manifest["files"]) == 4
+    dtypes = manifest["files"]["sensor_data_Room 1.ndjson"]["dtypes"]
+    assert dtypes["timestamp"].startswith('timestamp')
+    assert dtypes["status"].startswith('dictionary')
+
+    dataset = load_dataset(sensor_dataset)
+    combined = dataset["combined"]
+    expected = pd.concat([pd.read_json(path, lines=True) for path in sensor_files], ignore_index=True)
+    assert len(combined) == len(expected)
+    assert sorted(combined["context"].unique()) == ['Room 1', 'Room 2', 'Room 3', 'Room 4']
+    for source_column, column in (('CO2 (ppm)', 'co2_ppm'), ('Temperature C', 'temperature_c'), ('Humidity %', 'humidity')):
+        assert np.array_equal(combined[column].to_numpy(np.float64), expected[source_column].to_numpy(np.float64))
+    assert (combined["status"].astype(str).to_numpy() == expected["Status"].to_numpy()).all()
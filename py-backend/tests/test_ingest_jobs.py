@@ -0,0 +1,66 @@
+import os
+import time
+
+from app.services import job_service
+from app.services.job_service import read_job, _write_job
+from app.services.schema_service import _context_path, save_schema_context, schema_context_cache
+
+QUERY = "average co2 per room"
+
+
+def query_statuses(client, dataset_id: str) -> list[int]:
+    return [
+        client.post('/api/query', json={"dataset_id": dataset_id, "query": QUERY}).status_code,
+        client.post('/api/query/stream', json={"dataset_id": dataset_id, "query": QUERY}).status_code,
+        client.post('/api/query/batch', json={"dataset_id": dataset_id, "queries": [QUERY]}).status_code,
+    ]
+
+
+def test_queries_wait_for_a_running_ingest_even_with_a_context(client, uploaded_dataset):
+    job = read_job(uploaded_dataset)
+    assert os.path.exists(_context_path(uploaded_dataset))
+    _write_job({**job, 'status': 'running', 'stage': 'converting'})
+
+    assert query_statuses(client, uploaded_dataset) == [409, 409, 409]
+    body = client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": QUERY}).get_json()
+    assert body['job']['stage'] == 'converting'
+
+    _write_job({**job, 'status': 'failed', 'stage': 'converting', 'error': 'boom'})
+    assert query_statuses(client, uploaded_dataset) == [409, 409, 409]
+
+
+def test_queries_keep_running_during_an_append(client, uploaded_dataset):
+    job = read_job(uploaded_dataset)
+    _write_job({**job, 'kind': 'append', 'version': 2, 'status': 'running', 'stage': 'converting'})
+
+    assert query_statuses(client, uploaded_dataset) == [200, 200, 200]
+
+
+def test_schema_context_is_published_after_conversion(client, upload, sensor_files, monkeypatch):
+    seen = {}
+    convert_archive = job_service.convert_archive
+
+    def slow_convert(archive_path, dataset_path, *args, **kwargs):
+        time.sleep(0.5)  # the schema context LLM call finishes in the meantime
+        dataset_id = os.path.basename(dataset_path)
+        seen['context_during_convert'] = os.path.exists(_context_path(dataset_id))
+        seen['status_during_convert'] = client.post('/api/query', json={"dataset_id": dataset_id,
+                                                                        "query": QUERY}).status_code
+        return convert_archive(archive_path, dataset_path, *args, **kwargs)
+
+    monkeypatch.setattr(job_service, 'convert_archive', slow_convert)
+    dataset_id = upload(sensor_files)
+
+    assert seen == {'context_during_convert': False, 'status_during_convert': 409}
+    assert client.post('/api/query', json={"dataset_id": dataset_id, "query": QUERY}).status_code == 200
+
+
+def test_saved_context_replaces_the_file_atomically(sensor_dataset):
+    dataset_id = os.path.basename(sensor_dataset)
+    save_schema_context(dataset_id, "first")
+    assert schema_context_cache.get(dataset_id) == "first"
+    save_schema_context(dataset_id, "second")
+
+    assert schema_context_cache.get(dataset_id) == "second"
+    assert not os.path.exists(_context_path(dataset_id) + '.tmp')
+
@@ -0,0 +1,42 @@
+import pytest
+
+from app.services.intent_classifier import (
+    DATA_ANALYSIS_REQUEST, GENERAL_CONVERSATION, classify_intent, column_terms, evaluate,
+)
+
+# Floors for the labelled eval set; a change to the training data or rules that drops below them is a regression.
+MIN_ACCURACY = 0.95
+MIN_LLM_CALLS_AVOIDED = 0.7
+
+
+def test_eval_set_accuracy_and_llm_calls_avoided():
+    report = evaluate()
+    assert report['examples'] >= 75
+    assert report['accuracy'] >= MIN_ACCURACY, report['mistakes']
+    assert report['llm_calls_avoided'] >= MIN_LLM_CALLS_AVOIDED
+
+
+@pytest.mark.parametrize('query', [
+    "great, can you plot that by hour?",
+    "thanks! and the max?",
+    "hi, how many rows are there",
+    "can you plot that",
+    "could you graph it",
+])
+def test_follow_ups_and_mixed_greetings_never_become_small_talk(query):
+    assert classify_intent(query)['intent'] != GENERAL_CONVERSATION
+
+
+@pytest.mark.parametrize('query', ["thanks so much!", "hello", "good morning", "who are you"])
+def test_plain_greetings_are_decided_by_rules(query):
+    assert classify_intent(query) == {"intent": GENERAL_CONVERSATION, "confidence": 1.0, "source": "rules"}
+
+
+def test_keyword_and_column_are_decided_by_rules():
+    columns = column_terms("Columns: `co2_ppm`, `room_name`.")
+    decision = classify_intent("average ppm for every room", columns)
+    assert decision == {"intent": DATA_ANALYSIS_REQUEST, "confidence": 1.0, "source": "rules"}
+
+
+def test_low_confidence_falls_back_to_the_llm():
+    assert classify_intent("hi, how many rows are there", threshold=1.0)['intent'] is None
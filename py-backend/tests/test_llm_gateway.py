@@ -0,0 +1,109 @@
+import time
+import threading
+
+import openai
+import pytest
+
+from app.config import Config
+from app.services.llm_gateway import LLMGateway, TokenBucket
+
+MODEL = 'gpt-4o'
+
+
+@pytest.fixture
+def make_gateway(fake_llm, monkeypatch):
+    monkeypatch.setattr(Config, 'LLM_RETRY_BASE_SECONDS', 0.01)
+
+    def make(requests_per_minute: int = 0, tokens_per_minute: int = 0, max_retries: int = 3) -> LLMGateway:
+        return LLMGateway(base_url=fake_llm.url, requests_per_minute=requests_per_minute,
+                          tokens_per_minute=tokens_per_minute, max_concurrency=8, max_retries=max_retries,
+                          timeout=10, expected_output_tokens=50)
+
+    return make
+
+
+def _concurrently(func, n: int) -> list:
+    results = [None] * n
+
+    def run(i):
+        results[i] = func(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_prompts_in_flight_are_coalesced(fake_llm, make_gateway):
+    gateway = make_gateway()
+    fake_llm.latency = 0.3
+    replies = _concurrently(lambda i: gateway.invoke(MODEL, "hello there").content, 6)
+    assert fake_llm.requests == 1
+    assert len(set(replies)) == 1
+    stats = gateway.stats()[MODEL]
+    assert (stats['calls'], stats['coalesced']) == (1, 5)
+
+
+def test_different_and_streaming_prompts_are_not_coalesced(fake_llm, make_gateway):
+    gateway = make_gateway()
+    fake_llm.latency = 0.2
+    _concurrently(lambda i: gateway.invoke(MODEL, f"question {i}"), 3)
+    assert fake_llm.requests == 3
+    _concurrently(lambda i: gateway.invoke(MODEL, "same", streaming=True), 2)
+    assert fake_llm.requests == 5
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retried(fake_llm, make_gateway, status):
+    gateway = make_gateway(max_retries=3)
+    fake_llm.fail_next(2, status, retry_after=0.05 if status == 429 else None)
+    reply = gateway.invoke(MODEL, "hello")
+    assert reply.content
+    assert fake_llm.requests == 3
+    stats = gateway.stats()[MODEL]
+    assert (stats['calls'], stats['retries'], stats['errors']) == (1, 2, 0)
+    assert stats['input_tokens'] > 0
+
+
+def test_retries_give_up_after_the_limit(fake_llm, make_gateway):
+    gateway = make_gateway(max_retries=2)
+    fake_llm.fail_next(3, 503)
+    with pytest.raises(openai.InternalServerError):
+        gateway.invoke(MODEL, "hello")
+    assert fake_llm.requests == 3
+    assert gateway.stats()[MODEL]['errors'] == 1
+
+
+def test_client_errors_are_not_retried(fake_llm, make_gateway):
+    gateway = make_gateway()
+    fake_llm.fail_next(1, 400)
+    with pytest.raises(openai.BadRequestError):
+        gateway.invoke(MODEL, "hello")
+    assert fake_llm.requests == 1
+
+
+def test_empty_request_bucket_throttles_calls(fake_llm, make_gateway):
+    gateway = make_gateway(requests_per_minute=600)
+    (requests, _), _ = gateway._model_state(MODEL)
+    requests.available = 0
+    started = time.monotonic()
+    for i in range(3):
+        gateway.invoke(MODEL, f"question {i}")
+    # 10 requests per second from an empty bucket: the third request cannot start before 0.3s.
+    assert time.monotonic() - started >= 0.29
+    assert gateway.stats()[MODEL]['throttled_seconds'] >= 0.1
+    assert fake_llm.requests == 3
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=600)
+    assert bucket.acquire(600) == 0.0
+    started = time.monotonic()
+    bucket.acquire(5)
+    assert 0.4 <= time.monotonic() - started < 2.0
+
+    bucket.adjust(30)  # the call used more than estimated: the bucket goes into debt
+    assert bucket.available < 0
+    assert TokenBucket(per_minute=0).acquire(10**9) == 0.0
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+from app.config import Config
+from app.services.query_cache import QueryCache, normalize_query
+
+SCHEMA = "Columns: `context`, `co2_ppm`, `humidity`, `temperature_c`."
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'QUERY_CACHE_ENABLED', True)
+    return QueryCache(str(tmp_path / 'query_cache.sqlite3'))
+
+
+@pytest.mark.parametrize('a, b', [
+    ("rooms with co2 greater than humidity", "rooms with humidity greater than co2"),
+    ("rooms with co2 above 25", "rooms with co2 below 25"),
+    ("readings where temperature is greater than 25", "readings where temperature is less than 25"),
+    ("average co2 excluding room 1", "average co2 and room 1"),
+    ("average co2 by room", "average humidity by room"),
+    ("average co2 by room", "maximum co2 by room"),
+    ("top 5 rooms by co2", "top 10 rooms by co2"),
+    ("hourly average co2", "daily average co2"),
+    ("co2 per room per hour", "co2 per hour per room"),
+])
+def test_different_questions_do_not_match(a, b):
+    assert normalize_query(a) != normalize_query(b)
+
+
+@pytest.mark.parametrize('a, b', [
+    ("avg CO2 per room", "average co2 by room"),
+    ("What is the mean CO2 for each room?", "average co2 by rooms"),
+    ("show me the max temperature", "highest temperature"),
+    ("Rooms with humidity greater than 60", "rooms with humidity more than 60"),
+    ("Can you please calculate the total alarms per sensor", "sum alarm by sensor"),
+])
+def test_rephrasings_match(a, b):
+    assert normalize_query(a) == normalize_query(b)
+
+
+def test_code_is_served_only_for_the_same_question(cache):
+    cache.put_code(SCHEMA, "rooms with co2 greater than humidity", "CODE", "d1")
+    assert cache.get_code(SCHEMA, "Rooms with CO2 more than humidity?") == "CODE"
+    assert cache.get_code(SCHEMA, "rooms with humidity greater than co2") is None
+    assert cache.get_code(SCHEMA, "rooms with co2 less than humidity") is None
+    assert cache.get_code("Columns: `other`.", "rooms with co2 greater than humidity") is None
+    assert (cache.code_hits, cache.code_misses) == (1, 3)
+
+
+def test_results_are_keyed_by_fingerprint_and_invalidated_per_dataset(cache):
+    cache.put_code(SCHEMA, "average co2 by room", "CODE", "d1")
+    cache.put_result("fp-1", "CODE", "d1", {"summary_text": "ok", "table": []}, {"chart": None})
+    assert cache.get_result("fp-1", "CODE")["analysis_result"]["summary_text"] == "ok"
+    assert cache.get_result("fp-2", "CODE") is None
+    cache.invalidate_dataset("d1")
+    assert cache.get_result("fp-1", "CODE") is None
+    assert cache.get_code(SCHEMA, "average co2 by room") is None
+
+
+def test_expired_entries_are_not_served(cache, monkeypatch):
+    cache.put_code(SCHEMA, "average co2 by room", "CODE", "d1")
+    monkeypatch.setattr(Config, 'QUERY_CACHE_TTL_SECONDS', -1)
+    assert cache.get_code(SCHEMA, "average co2 by room") is None
+
+
+def test_keys_from_the_unordered_normalization_are_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'QUERY_CACHE_ENABLED', True)
+    path = str(tmp_path / 'query_cache.sqlite3')
+    QueryCache(path).put_code(SCHEMA, "above co2 humidity room", "STALE", "d1")
+    with sqlite3.connect(path) as conn:
+        conn.execute('PRAGMA user_version = 0')
+    assert QueryCache(path).get_code(SCHEMA, "above co2 humidity room") is None
@@ -0,0 +1,64 @@
+import json
+
+
+def read_events(response) -> list[tuple[str, dict]]:
+    """Parses a server-sent events body into `(event, data)` pairs."""
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if not block.strip():
+            continue
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_stream_sends_progress_events_in_graph_order(client, uploaded_dataset):
+    response = client.post('/api/query/stream', json={"dataset_id": uploaded_dataset, "query": "average co2 per room"})
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    events = read_events(response)
+    names = [name for name, _ in events]
+    assert names == ['start', 'intent', 'code', 'table', 'summary', 'chart', 'done']
+
+    data = dict(events)
+    assert data['start']['queue_wait_ms'] >= 0
+    assert data['intent']['intent'] == 'DATA_ANALYSIS_REQUEST'
+    assert 'def analyze_data' in data['code']['code']
+    assert len(data['table']['table']) == 4
+    assert data['table']['table'] == data['done']['table']
+    assert data['summary']['text'] == data['done']['summary'] == "Average CO2 per room."
+    elapsed = [payload['elapsed_ms'] for _, payload in events]
+    assert elapsed == sorted(elapsed)
+    assert data['done']['timings']['table'] <= data['done']['timings']['chart']
+
+
+def test_stream_done_matches_blocking_endpoint(client, uploaded_dataset):
+    query = {"dataset_id": uploaded_dataset, "query": "average co2 per room"}
+    blocking = client.post('/api/query', json=query).get_json()
+    done = dict(read_events(client.get('/api/query/stream', query_string=query)))['done']
+
+    for key in ('summary', 'table', 'visualizationUrl'):
+        assert done[key] == blocking[key]
+    assert done['cache'] == {"code": True, "result": True}
+
+
+def test_stream_forwards_summary_tokens_for_conversation(client, uploaded_dataset):
+    events = read_events(client.post('/api/query/stream', json={"dataset_id": uploaded_dataset, "query": "hello"}))
+
+    names = [name for name, _ in events]
+    assert names[:2] == ['start', 'intent'] and names[-1] == 'done'
+    assert dict(events)['intent']['intent'] == 'GENERAL_CONVERSATION'
+    tokens = "".join(data['token'] for name, data in events if name == 'summary_token')
+    assert tokens and tokens == dict(events)['done']['summary']
+    assert 'code' not in names and 'chart' not in names
+
+
+def test_stream_validates_before_streaming(client, uploaded_dataset):
+    assert client.post('/api/query/stream', json={"dataset_id": uploaded_dataset}).status_code == 400
+    assert client.post('/api/query/stream', json={"dataset_id": uploaded_dataset, "query": "co2",
+                                                  "chart_format": "gif"}).status_code == 400
+    missing = client.post('/api/query/stream', json={"dataset_id": "no_such_dataset", "query": "co2"})
+    assert missing.status_code == 404
+    assert missing.mimetype == 'application/json'
@@ -0,0 +1,48 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from app.services.result_service import frame_to_records
+
+
+def test_float32_columns_serialize_as_their_shortest_repr():
+    rng = np.random.default_rng(0)
+    values = np.concatenate([
+        rng.normal(800, 150, 5000).round(1),
+        rng.normal(0, 1, 5000) * 10.0 ** rng.integers(-40, 38, 5000),
+        [1147.59, 0.1, -0.0, 3.4e38, 1e-45],
+    ]).astype(np.float32)
+    records = frame_to_records(pd.DataFrame({"v": values}))
+    assert [record["v"] for record in records] == [float(str(value)) for value in values]
+
+
+def test_records_are_json_ready():
+    df = pd.DataFrame({
+        "time": pd.to_datetime(["2024-01-01 10:00:00", None, "2024-01-01 10:00:00.5"], format="ISO8601"),
+        "room": pd.Categorical(["Room 1", "Room 2", None]),
+        "co2": np.array([812.3, np.nan, np.inf], dtype=np.float32),
+        "count": [1, 2, 3],
+    })
+    records = frame_to_records(df)
+    assert records == [
+        {"time": "2024-01-01T10:00:00", "room": "Room 1", "co2": 812.3, "count": 1},
+        {"time": None, "room": "Room 2", "co2": None, "count": 2},
+        {"time": "2024-01-01T10:00:00.500000", "room": None, "co2": None, "count": 3},
+    ]
+    assert json.loads(json.dumps(records)) == records
+
+
+def test_numpy_scalars_in_object_columns_are_boxed():
+    df = pd.DataFrame({"room": ["Room 1", "Room 2", "Room 1"], "co2": [800.5, 812.0, np.nan]})
+    summary = df.describe(include='all').reset_index()
+    mixed = pd.DataFrame({"value": pd.Series([np.int64(3), np.float32(0.5), np.bool_(True), "ok", None],
+                                             dtype=object)})
+
+    for frame in (summary, mixed):
+        records = frame_to_records(frame)
+        assert json.loads(json.dumps(records)) == records
+    assert records == [{"value": 3}, {"value": 0.5}, {"value": True}, {"value": "ok"}, {"value": None}]
+    counts = {record["index"]: record["room"] for record in frame_to_records(summary)}
+    assert counts["count"] == 3 and type(counts["count"]) is int
+    assert counts["top"] == "Room 1"
@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from synthetic_data import generate_ndjson
+
+from app.services.ingest_service import COLUMNAR_DIR, convert_dataset, load_dataset, read_manifest
+from app.services.rollup_service import build_file_rollups, rollup_columns
+
+MEASURES = ['co2_ppm', 'temperature_c', 'humidity']
+
+
+def _expected(combined: pd.DataFrame, granularity: str) -> pd.DataFrame:
+    buckets = combined['timestamp'].dt.floor({'hour': 'h', 'day': 'D'}[granularity])
+    return combined.groupby(['context', buckets], observed=True)[MEASURES].agg(['count', 'sum', 'min', 'max', 'std'])
+
+
+@pytest.mark.parametrize('granularity', ['hour', 'day'])
+def test_rollups_match_aggregates_of_the_raw_rows(sensor_dataset, granularity):
+    dataset = load_dataset(sensor_dataset)
+    expected = _expected(dataset['combined'], granularity)
+    rollup = dataset['rollups'][granularity].set_index(['context', 'timestamp']).sort_index()
+    assert len(rollup) == len(expected)
+    assert rollup['row_count'].sum() == len(dataset['combined'])
+    for measure in MEASURES:
+        count, total, sumsq = rollup[f'{measure}_count'], rollup[f'{measure}_sum'], rollup[f'{measure}_sumsq']
+        assert np.array_equal(count.to_numpy(), expected[(measure, 'count')].to_numpy())
+        assert np.allclose(total, expected[(measure, 'sum')])
+        assert np.allclose(rollup[f'{measure}_min'], expected[(measure, 'min')])
+        assert np.allclose(rollup[f'{measure}_max'], expected[(measure, 'max')])
+        std = np.sqrt((sumsq - total ** 2 / count) / (count - 1))
+        assert np.allclose(std, expected[(measure, 'std')])
+
+
+def test_batched_build_matches_a_single_pass(sensor_dataset, tmp_path):
+    info = next(iter(read_manifest(sensor_dataset)['files'].values()))
+    parquet_path = os.path.join(sensor_dataset, COLUMNAR_DIR, info['path'])
+    whole = build_file_rollups(parquet_path, str(tmp_path / 'whole'))
+    batched = build_file_rollups(parquet_path, str(tmp_path / 'batched'), batch_rows=7)
+    for granularity in ('hour', 'day'):
+        a = pd.read_parquet(tmp_path / 'whole' / whole[granularity]['path'])
+        b = pd.read_parquet(tmp_path / 'batched' / batched[granularity]['path'])
+        pd.testing.assert_frame_equal(a, b, check_exact=False)
+
+
+def test_appended_files_extend_the_rollups(sensor_dataset, tmp_path):
+    before = load_dataset(sensor_dataset)['rollups']['hour']
+    added = generate_ndjson(str(tmp_path / 'added'), rows=300, files=5, seed=3)[-1:]
+    convert_dataset(sensor_dataset, added, version=2)
+
+    after = load_dataset(sensor_dataset)
+    hour = after['rollups']['hour']
+    assert 'Room 5' in set(hour['context'])
+    assert hour['row_count'].sum() == len(after['combined']) == 2000 + 60
+    unchanged = hour[hour['context'] != 'Room 5'].reset_index(drop=True)
+    pd.testing.assert_frame_equal(unchanged, before.reset_index(drop=True), check_categorical=False)
+
+
+def test_identifier_columns_are_not_measures():
+    schema = pa.schema([('reading_time', pa.timestamp('ns')), ('timestamp', pa.timestamp('ns')),
+                        ('device_id', pa.int32()), ('co2', pa.float64()), ('status', pa.string())])
+    assert rollup_columns(schema) == ('timestamp', ['co2'])
+    assert rollup_columns(pa.schema([('co2', pa.float64())])) == (None, [])
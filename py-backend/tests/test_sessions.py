@@ -0,0 +1,121 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from app.services.session_service import SessionManager
+
+
+@pytest.fixture
+def make_manager(tmp_path):
+    def make(**limits) -> SessionManager:
+        options = dict(ttl_seconds=3600, max_sessions=100, max_bytes=10**8, history_turns=3)
+        options.update(limits)
+        return SessionManager(str(tmp_path / 'sessions.sqlite3'), str(tmp_path / 'results'), **options)
+
+    return make
+
+
+def frame(n: int) -> pd.DataFrame:
+    return pd.DataFrame({"room": [f"Room {i}" for i in range(n)], "co2": [800.0 + i for i in range(n)]})
+
+
+def test_sessions_persist_across_managers(make_manager):
+    session_id = make_manager().create_session('ds')
+    make_manager().record_turn(session_id, 'average co2', 'Average CO2.', code='def analyze_data(): ...',
+                               engine='pandas', frame=frame(3))
+
+    session = make_manager().get_session(session_id)
+    assert session['dataset_id'] == 'ds'
+    assert [turn['query'] for turn in session['history']] == ['average co2']
+    assert (session['last_code'], session['last_engine']) == ('def analyze_data(): ...', 'pandas')
+    assert session['result_columns'] == ['room', 'co2']
+    pd.testing.assert_frame_equal(make_manager().load_result(session), frame(3))
+
+
+def test_history_is_trimmed_and_results_replaced(make_manager):
+    manager = make_manager()
+    session_id = manager.create_session('ds')
+    manager.record_turn(session_id, 'q1', 's1', code='c1', frame=frame(2))
+    first_path = manager.get_session(session_id)['result_path']
+    for n in range(2, 6):
+        manager.record_turn(session_id, f'q{n}', f's{n}')
+    manager.record_turn(session_id, 'q6', 's6', code='c6', frame=frame(5))
+
+    session = manager.get_session(session_id)
+    assert [turn['query'] for turn in session['history']] == ['q4', 'q5', 'q6']
+    assert session['last_code'] == 'c6' and session['result_rows'] == 5
+    assert not os.path.exists(first_path)
+
+
+def test_turns_without_code_keep_the_last_result(make_manager):
+    manager = make_manager()
+    session_id = manager.create_session('ds')
+    manager.record_turn(session_id, 'q1', 's1', code='c1', frame=frame(2))
+    manager.record_turn(session_id, 'thanks', 'You are welcome!')
+
+    session = manager.get_session(session_id)
+    assert session['last_code'] == 'c1' and session['result_rows'] == 2
+    assert os.path.exists(session['result_path'])
+
+
+def test_expired_sessions_are_gone(make_manager):
+    manager = make_manager(ttl_seconds=1)
+    session_id = manager.create_session('ds')
+    manager.record_turn(session_id, 'q1', 's1', code='c1', frame=frame(2))
+    result_path = manager.get_session(session_id)['result_path']
+
+    time.sleep(1.1)
+    assert manager.get_session(session_id) is None
+    assert not os.path.exists(result_path)
+    assert manager.record_turn(session_id, 'q2', 's2') is False
+
+
+def test_least_recently_used_sessions_are_evicted(make_manager):
+    manager = make_manager(max_sessions=2)
+    oldest, middle = manager.create_session('ds'), manager.create_session('ds')
+    manager.get_session(oldest)
+    newest = manager.create_session('ds')
+
+    assert manager.get_session(middle) is None
+    assert manager.get_session(oldest) is not None and manager.get_session(newest) is not None
+    assert manager.evictions == 1
+
+
+def test_results_larger_than_the_store_are_not_kept(make_manager):
+    manager = make_manager(max_bytes=4096)
+    session_id = manager.create_session('ds')
+    assert manager.record_turn(session_id, 'all rows', 'Raw readings.', code='c', frame=frame(5000))
+
+    session = manager.get_session(session_id)
+    assert session['result_path'] is None
+    assert session['last_code'] == 'c'
+    assert os.listdir(manager.results_folder) == []
+
+
+def test_malformed_ids_are_rejected(make_manager):
+    manager = make_manager()
+    assert manager.get_session('../../etc/passwd') is None
+    assert manager.get_session(None) is None
+
+
+def test_session_routes_follow_a_conversation(client, uploaded_dataset):
+    created = client.post('/api/sessions', json={"dataset_id": uploaded_dataset})
+    assert created.status_code == 201
+    session_id = created.get_json()['session_id']
+    assert created.get_json()['history'] == []
+
+    answer = client.post('/api/query', json={"dataset_id": uploaded_dataset, "query": "average co2 per room",
+                                             "session_id": session_id})
+    assert answer.status_code == 200
+
+    session = client.get(f'/api/sessions/{session_id}').get_json()
+    assert [turn['query'] for turn in session['history']] == ['average co2 per room']
+    assert 'def analyze_data' in session['last_code']
+    assert session['result'] == {"columns": ['context', 'co2_ppm'], "rows": 4}
+
+    assert client.delete(f'/api/sessions/{session_id}').status_code == 204
+    assert client.get(f'/api/sessions/{session_id}').status_code == 404
+    assert client.delete(f'/api/sessions/{session_id}').status_code == 404
+    assert client.post('/api/sessions', json={"dataset_id": "no_such_dataset"}).status_code == 404